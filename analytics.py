@@ -0,0 +1,283 @@
+"""Statistics about the collection and its loans, computed a whole column at a time.
+
+The compact columns of the catalog, the loans and the loan history already
+hold ids, counts and dates as arrays of ints (see columns.py). A Snapshot copies those arrays
+into NumPy, and every statistic is then a bincount, sort or mask over them,
+with no Python code per loan, so a report over millions of loans takes
+well under a second once the tables are loaded. Reviews are matched to their
+book's author by title and averaged with a pandas groupby.
+
+A report is a dict of tables, each a (column headings, rows) pair. The
+Statistics tab of lib.py and libBERT.py shows one, and
+`python report.py statistics` prints or exports it as JSON or CSV.
+"""
+import csv
+import datetime
+import json
+
+import numpy as np
+
+TOP = 20                    # rows in the tables that rank books and borrowers
+SCORE_CHUNK = 10000         # reviews looked up in the score cache at a time
+EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+
+def _copy(values, dtype=np.int32):
+    # A copy, not a view: NumPy holding on to an array's buffer would keep
+    # the table from growing it
+    return np.frombuffer(values, dtype=dtype).copy()
+
+
+def _readable(column, slots):
+    """For each slot, whether the column holds its field as a number."""
+    odd = np.zeros(len(column.numbers), dtype=bool)
+    odd[list(column.odd)] = True
+    return ~odd[slots]
+
+
+def _loan_arrays(table, columns):
+    """How many records table has, and an array per column of the records whose ids and dates can be read."""
+    slots = _copy(table.slot_of)
+    slots = slots[slots >= 0]
+    columns = [table.data[column] for column in columns]
+    readable = np.logical_and.reduce([_readable(column, slots) for column in columns])
+    arrays = [_copy(column.numbers)[slots[readable]] for column in columns]
+    # Ids are never negative, which bincount relies on
+    valid = (arrays[0] >= 0) & (arrays[1] >= 0)
+    return len(slots), [values[valid] for values in arrays]
+
+
+class Snapshot:
+    """The catalog, loans, loan history and borrowers as NumPy arrays, as of the moment it is taken.
+
+    Taking one only copies arrays, quick enough for the GUI thread, and it
+    has to be taken on the thread that changes the library. Everything done
+    with it afterwards can run on any thread. Loans with a borrower id, book
+    id or date that can't be read are counted in loans (or ended) but left
+    out of every other statistic.
+    """
+
+    def __init__(self, library, today=None):
+        self.today = (today or datetime.date.today()).toordinal()
+
+        books = library.book_data
+        book_slots = _copy(books.slot_of)
+        self.book_ids = np.flatnonzero(book_slots >= 0)
+        slots = book_slots[self.book_ids]
+        self.copies, self.available = (np.where(_readable(books.data[column], slots),
+                                                _copy(books.data[column].numbers)[slots], 0)
+                                       for column in ('Copies', 'Available'))
+        authors = books.data['Author']
+        self.author_codes = _copy(authors.codes)[slots]
+        self.author_names = list(authors.categories)
+        titles = books.data['Title']
+        self.title_buffer = bytes(titles.buffer)
+        self.title_starts = _copy(titles.starts, np.int64)[slots]
+        self.title_lengths = _copy(titles.lengths)[slots]
+
+        # The loans out now, with the day they are due back
+        self.loans, (self.borrower_ids, self.loan_book_ids, self.borrowed, self.due) = _loan_arrays(
+            library.borrowed_books, ('Borrower ID', 'Book ID', 'Borrow Date', 'Return Date'))
+        # The loans that have ended, with the day the copy came back
+        self.ended, (self.ended_borrower_ids, self.ended_book_ids, self.ended_borrowed, self.returned_on) = (
+            _loan_arrays(library.loan_history, ('Borrower ID', 'Book ID', 'Borrow Date', 'Returned On')))
+
+        patrons = library.borrowers.table
+        self.patron_slots = _copy(patrons.slot_of)
+        self.patron_names = list(patrons.data['Borrower'])
+        self.patrons = len(patrons)
+
+    def every_loan(self, values, ended_values):
+        """An array over every loan on record, out now or ended, from its two halves."""
+        return np.concatenate((values, ended_values))
+
+    def title(self, position):
+        """The title of the book at position in book_ids."""
+        start = self.title_starts[position]
+        return self.title_buffer[start:start + self.title_lengths[position]].decode().strip()
+
+    def titles(self):
+        """Every title, in the order of book_ids."""
+        # Plain ints rather than NumPy's, which are slow to slice with
+        buffer = self.title_buffer
+        ends = (self.title_starts + self.title_lengths).tolist()
+        return [buffer[start:end].decode().strip() for start, end in zip(self.title_starts.tolist(), ends)]
+
+    def author(self, position):
+        code = self.author_codes[position]
+        return self.author_names[code].strip() if code >= 0 else ''
+
+    def position(self, book_id):
+        """Where book_id is in book_ids, or -1 if the catalog has no such book."""
+        position = np.searchsorted(self.book_ids, book_id)
+        return int(position) if position < len(self.book_ids) and self.book_ids[position] == book_id else -1
+
+    def borrower(self, borrower_id):
+        if borrower_id < len(self.patron_slots) and self.patron_slots[borrower_id] >= 0:
+            return self.patron_names[self.patron_slots[borrower_id]].strip()
+        return ''
+
+
+def _ranked(counts, top):
+    """Indexes of the top largest counts, largest first and then by index, skipping zeros."""
+    nonzero = np.flatnonzero(counts)
+    order = np.lexsort((nonzero, -counts[nonzero]))
+    return nonzero[order[:top] if top else order]
+
+
+def _lengths(snapshot):
+    # Days from borrowing to bringing the copy back, of every ended loan
+    return snapshot.returned_on - snapshot.ended_borrowed
+
+
+def summary(snapshot):
+    lengths = _lengths(snapshot)
+    rows = [('Titles', len(snapshot.book_ids)),
+            ('Copies', int(snapshot.copies.sum())),
+            ('Copies on the shelf', int(snapshot.available.sum())),
+            ('Loans out', snapshot.loans),
+            ('Overdue loans', int((snapshot.due < snapshot.today).sum())),
+            ('Loans returned', snapshot.ended),
+            ('Borrowers registered', snapshot.patrons),
+            ('Borrowers with loans', int(np.count_nonzero(np.bincount(snapshot.borrower_ids)))),
+            ('Average loan length (days)', round(float(lengths.mean()), 1) if len(lengths) else ''),
+            ('Median loan length (days)', float(np.median(lengths)) if len(lengths) else '')]
+    return ['Statistic', 'Value'], rows
+
+
+def most_borrowed(snapshot, top=TOP):
+    """The books lent most often, counting loans out now and returned ones."""
+    counts = np.bincount(snapshot.every_loan(snapshot.loan_book_ids, snapshot.ended_book_ids))
+    rows = []
+    for book_id in _ranked(counts, top):
+        position = snapshot.position(book_id)
+        title, author, copies = ((snapshot.title(position), snapshot.author(position), int(snapshot.copies[position]))
+                                 if position >= 0 else ('', '', ''))
+        rows.append((int(book_id), title, author, int(counts[book_id]), copies))
+    return ['Book ID', 'Title', 'Author', 'Loans', 'Copies'], rows
+
+
+def most_active_borrowers(snapshot, top=TOP):
+    counts = np.bincount(snapshot.every_loan(snapshot.borrower_ids, snapshot.ended_borrower_ids))
+    rows = [(int(borrower_id), snapshot.borrower(borrower_id), int(counts[borrower_id]))
+            for borrower_id in _ranked(counts, top)]
+    return ['Borrower ID', 'Borrower', 'Loans'], rows
+
+
+def loans_per_borrower(snapshot):
+    """How many borrowers have borrowed once, twice and so on."""
+    per_borrower = np.bincount(snapshot.every_loan(snapshot.borrower_ids, snapshot.ended_borrower_ids))
+    borrowers = np.bincount(per_borrower[per_borrower > 0])
+    loans = np.flatnonzero(borrowers)
+    return ['Loans', 'Borrowers'], list(zip(loans.tolist(), borrowers[loans].tolist()))
+
+
+def loan_lengths(snapshot):
+    """How many returned loans lasted each number of days, from borrowing to bringing the copy back."""
+    lengths = _lengths(snapshot)
+    if not len(lengths):
+        return ['Days', 'Loans'], []
+    shortest = lengths.min()
+    counts = np.bincount(lengths - shortest)
+    days = np.flatnonzero(counts)
+    return ['Days', 'Loans'], list(zip((days + shortest).tolist(), counts[days].tolist()))
+
+
+def loans_by_month(snapshot):
+    """Loans on record by the month they were borrowed in."""
+    borrowed = snapshot.every_loan(snapshot.borrowed, snapshot.ended_borrowed)
+    months = (borrowed - EPOCH).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    if not len(months):
+        return ['Month', 'Loans'], []
+    first = months.min()
+    counts = np.bincount(months - first)
+    present = np.flatnonzero(counts)
+    labels = np.datetime_as_string((present + first).astype('datetime64[M]'))
+    return ['Month', 'Loans'], list(zip(labels.tolist(), counts[present].tolist()))
+
+
+def review_scores(library, cache, model_id):
+    """Every (title, review) of the library and its (label, score) from cache, or None if not scored yet."""
+    reviews = library.reviews()
+    scores = []
+    for start in range(0, len(reviews), SCORE_CHUNK):
+        # A chunk at a time, so the review dialogs get a turn at the cache
+        scores.extend(cache.lookup(model_id, [review for _, review in reviews[start:start + SCORE_CHUNK]]))
+    return reviews, scores
+
+
+def sentiment_by_author(snapshot, reviews, scores):
+    """Reviews per author and their average sentiment, from -1 (negative) to 1 (positive).
+
+    A review belongs to every book with its title, matched like the review
+    dialogs match them, without case or surrounding spaces. Only the
+    reviews with a score count towards the average.
+    """
+    headers = ['Author', 'Reviews', 'Scored', 'Average sentiment', 'Positive']
+    if not reviews:
+        return headers, []
+    # Imported here so that the report without sentiment doesn't pay for pandas
+    import pandas as pd
+    labels = pd.Categorical([score[0] if score else None for score in scores])
+    # A label's kind is worked out once per label rather than per review; the
+    # last entry is for the reviews without one (code -1)
+    kinds = [label.upper() for label in labels.categories] + ['']
+    negative = np.array([kind.startswith('NEG') for kind in kinds])[labels.codes]
+    positive = np.array([kind.startswith('POS') for kind in kinds])[labels.codes]
+    score = np.array([score[1] if score else np.nan for score in scores], dtype=float)
+    frame = pd.DataFrame({
+        'title': [title.strip().lower() for title, _ in reviews],
+        # VADER's compound score is already signed; BERT's is its confidence in the label
+        'sentiment': np.where(negative, -np.abs(score), score),
+        'positive': np.where(labels.codes >= 0, positive, np.nan)})
+    catalog = pd.DataFrame({'title': [title.lower() for title in snapshot.titles()],
+                            'author': snapshot.author_codes}).drop_duplicates()
+    matched = frame.merge(catalog, on='title')
+    grouped = matched.groupby('author').agg(reviews=('title', 'size'), scored=('sentiment', 'count'),
+                                            sentiment=('sentiment', 'mean'), positive=('positive', 'mean'))
+    grouped = grouped.sort_values(['reviews', 'sentiment'], ascending=False)
+    rows = [(snapshot.author_names[code].strip() if code >= 0 else '', int(row.reviews), int(row.scored),
+             '' if pd.isna(row.sentiment) else round(float(row.sentiment), 3),
+             '' if pd.isna(row.positive) else f"{row.positive:.0%}")
+            for code, row in zip(grouped.index, grouped.itertuples())]
+    return headers, rows
+
+
+def report(snapshot, reviews=None, scores=None, top=TOP):
+    """Every statistic, as {name: (column headings, rows)}; top limits the ranked tables (0 for all rows)."""
+    tables = {'Summary': summary(snapshot),
+              'Most borrowed books': most_borrowed(snapshot, top),
+              'Most active borrowers': most_active_borrowers(snapshot, top),
+              'Loans per borrower': loans_per_borrower(snapshot),
+              'Loan lengths': loan_lengths(snapshot),
+              'Loans by month': loans_by_month(snapshot)}
+    if reviews is not None:
+        tables['Sentiment by author'] = sentiment_by_author(snapshot, reviews, scores)
+        tables['Summary'][1].append(('Reviews', len(reviews)))
+        tables['Summary'][1].append(('Reviews scored', sum(score is not None for score in scores)))
+    return tables
+
+
+def slug(name):
+    """'Most borrowed books' -> 'most_borrowed_books', for file names."""
+    return name.lower().replace(' ', '_')
+
+
+def write_json(tables, file):
+    json.dump({name: [dict(zip(headers, row)) for row in rows] for name, (headers, rows) in tables.items()},
+              file, indent=1)
+
+
+def write_csv(table, file):
+    headers, rows = table
+    writer = csv.writer(file)
+    writer.writerow(headers)
+    writer.writerows(rows)
+
+
+def format_table(table):
+    """The table as aligned text, for the terminal."""
+    headers, rows = table
+    cells = [list(map(str, headers))] + [list(map(str, row)) for row in rows]
+    widths = [max(map(len, column)) for column in zip(*cells)]
+    return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() for line in cells)
@@ -0,0 +1,133 @@
+"""Statistics benchmark: the full report of analytics.py over millions of loans.
+
+Builds a catalog of --books titles, --borrowers patrons and --loans loans
+spread over several years as compact RecordTables, the way Library loads
+them, with some books and borrowers far busier than others. One loan in ten
+is still out; the rest are in the loan history. Then times what
+the Statistics tab does: counting the loans for the running totals
+(LoanCounters.build, done on every load), taking a Snapshot (on the GUI
+thread) and working out the report from it, once without and once with
+sentiment by author over --reviews scored reviews. For comparison, it also
+times counting loans per book with a Python loop over the rows of both tables.
+
+    python benchmarks/bench_analytics.py [--books 1000000] [--loans 5000000] [--reviews 1000000]
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import Snapshot, most_borrowed, report
+from borrowers import BorrowerRegistry
+from circulation import LoanCounters
+from library import BOOK_KINDS, HISTORY_KINDS, LOAN_KINDS
+from record_table import RecordTable
+from repository import BOOK_COLUMNS, HISTORY_COLUMNS, LOAN_COLUMNS, PATRON_COLUMNS
+
+FIRST_DAY = datetime.date(2019, 1, 1).toordinal()
+YEARS = 6
+
+
+def skewed(rng, size, count):
+    # size draws from range(count), low numbers far more often than high ones
+    return (rng.pareto(1.2, size) * count / 50).astype(np.int64) % count
+
+
+def make_library(rng, books, borrowers, loans):
+    catalog = RecordTable.from_columns(BOOK_COLUMNS, {
+        'Book ID': (str(i) for i in range(books)),
+        'Title': (f"Title {i}" for i in range(books)),
+        'Author': (f" Author {i % 50000}" for i in range(books)),
+        'Year': (f" {1800 + i % 220}" for i in range(books)),
+        'Copies': (str(1 + i % 3) for i in range(books)),
+        'Available': (str(i % 3) for i in range(books))}, books, range(books), BOOK_KINDS)
+    patrons = RecordTable.from_columns(PATRON_COLUMNS, {
+        'Borrower ID': (str(i) for i in range(borrowers)),
+        'Borrower': (f"Borrower {i}" for i in range(borrowers)),
+        'Borrower Email': (f"borrower{i}@example.com" for i in range(borrowers)),
+        'Borrower Phone': ('' for _ in range(borrowers))}, borrowers, range(borrowers))
+    out = loans // 10
+    borrowed = FIRST_DAY + rng.integers(0, 365 * YEARS, loans)
+    due = borrowed + rng.choice([7, 14, 14, 21, 28], loans)
+    # Most copies come back around the day they are due, some weeks late
+    returned = due + rng.integers(-5, 3, loans) + rng.pareto(2.0, loans).astype(np.int64)
+    day = datetime.date.fromordinal
+    borrower_ids = skewed(rng, loans, borrowers).tolist()
+    book_ids = skewed(rng, loans, books).tolist()
+
+    def fields(start, stop):
+        return {'Borrower ID': map(str, borrower_ids[start:stop]),
+                'Book ID': map(str, book_ids[start:stop]),
+                'Borrow Date': (' ' + day(ordinal).isoformat() for ordinal in borrowed[start:stop].tolist()),
+                'Return Date': (' ' + day(ordinal).isoformat() for ordinal in due[start:stop].tolist())}
+    loan_table = RecordTable.from_columns(LOAN_COLUMNS, fields(0, out), out, kinds=LOAN_KINDS)
+    history = RecordTable.from_columns(HISTORY_COLUMNS, {
+        **fields(out, loans),
+        'Returned On': (' ' + day(ordinal).isoformat() for ordinal in returned[out:].tolist())},
+        loans - out, kinds=HISTORY_KINDS)
+    return SimpleNamespace(book_data=catalog, borrowed_books=loan_table, loan_history=history,
+                           borrowers=BorrowerRegistry(patrons))
+
+
+def make_reviews(rng, size, books):
+    titles = skewed(rng, size, books).tolist()
+    scores = rng.uniform(-1, 1, size).tolist()
+    reviews = [(f"Title {book}", f"Review {i}") for i, book in enumerate(titles)]
+    # One review in ten hasn't been scored yet
+    return reviews, [None if i % 10 == 0 else ('Positive' if score > 0 else 'Negative', score)
+                     for i, score in enumerate(scores)]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--borrowers', type=int, default=200000)
+    parser.add_argument('--loans', type=int, default=5000000)
+    parser.add_argument('--reviews', type=int, default=1000000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    library, seconds = timed(make_library, rng, args.books, args.borrowers, args.loans)
+    print(f"{args.books} books, {args.borrowers} borrowers, {args.loans} loans, built in {seconds:.1f} s")
+    reviews, scores = make_reviews(rng, args.reviews, args.books)
+
+    loans = library.borrowed_books
+    counters, seconds = timed(LoanCounters.build, loans, library.loan_history)
+    print(f"  running totals (LoanCounters.build)  {seconds:6.2f} s")
+    snapshot, seconds = timed(Snapshot, library)
+    print(f"  Snapshot                             {seconds:6.2f} s")
+    tables, seconds = timed(report, snapshot)
+    print(f"  report without sentiment             {seconds:6.2f} s")
+    tables, seconds = timed(report, snapshot, reviews, scores)
+    print(f"  report with sentiment                {seconds:6.2f} s  ({len(reviews)} reviews)")
+
+    # The same count as the 'Most borrowed books' table, a row at a time
+    start = time.perf_counter()
+    by_book = Counter(int(row[1]) for table in (loans, library.loan_history) for row in table.rows())
+    looped = time.perf_counter() - start
+    _, seconds = timed(most_borrowed, snapshot)
+    print(f"  loans per book: row loop {looped:.2f} s, bincount {seconds:.3f} s")
+
+    assert counters.loans + counters.ended == args.loans and sum(by_book.values()) == args.loans
+    assert [count for _, count in by_book.most_common(5)] == [row[3] for row in tables['Most borrowed books'][1][:5]]
+    print()
+    for name in ('Summary', 'Most borrowed books', 'Sentiment by author'):
+        headers, rows = tables[name]
+        print(name, headers, *rows[:3], sep='\n  ')
+
+
+if __name__ == '__main__':
+    main()
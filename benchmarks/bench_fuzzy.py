@@ -0,0 +1,129 @@
+"""Typo-tolerant search benchmark: recall and latency of SearchIndex.closest.
+
+Builds a SearchIndex over --records synthetic books, whose titles and
+author names are drawn from vocabularies of made-up words, common words far
+more often than rare ones, as in a real catalog. Each query takes one title
+word and the author's surname from a random book and misspells both the
+way patrons do (a letter dropped, doubled, replaced, or two letters swapped),
+then asks for the --limit closest books. Reports how often the book the
+query came from is first and in the results, how often it is at least tied
+with the first (common words and surnames often come together, in which
+case any of those books is as good an answer), how often the substring
+search finds it, and latency percentiles.
+
+    python benchmarks/bench_fuzzy.py [--records 1000000] [--queries 1000] [--limit 10]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzy_index import max_edits
+from search_index import SearchIndex
+
+CONSONANTS = 'bcdfghjklmnprstvwz'
+VOWELS = 'aeiou'
+SYLLABLES = [c + v for c in CONSONANTS for v in VOWELS]
+
+
+def make_words(rng, count, syllables):
+    words = set()
+    while len(words) < count:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.choice(syllables)))
+        words.add(word + rng.choice(['', '', 'n', 'r', 's']))
+    return sorted(words)
+
+
+def weighted(rng, words):
+    # In a random order, so the common words aren't all alike; the i-th is
+    # drawn about 1/i as often as the first
+    rng.shuffle(words)
+    return words, list(accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+
+def make_books(rng, size):
+    titles = weighted(rng, make_words(rng, 60000, (1, 2, 2, 3, 4)))
+    surnames = weighted(rng, make_words(rng, 20000, (2, 3, 3, 4)))
+    first_names = make_words(rng, 2000, (2, 2, 3))
+    books = []
+    for _ in range(size):
+        title = ' '.join(word.title() for word in rng.choices(titles[0], cum_weights=titles[1], k=rng.randint(1, 4)))
+        author = f"{rng.choice(first_names).title()} {rng.choices(surnames[0], cum_weights=surnames[1])[0].title()}"
+        books.append((title, author, str(rng.randint(1800, 2024))))
+    return books
+
+
+def misspell(rng, word):
+    """word with one typo, or two in a long word."""
+    for _ in range(max_edits(word)):
+        i = rng.randrange(len(word) - 1)
+        kind = rng.choice(['drop', 'double', 'replace', 'swap'])
+        if kind == 'drop':
+            word = word[:i] + word[i + 1:]
+        elif kind == 'double':
+            word = word[:i] + word[i] + word[i:]
+        elif kind == 'replace':
+            word = word[:i] + rng.choice(VOWELS if word[i] in VOWELS else CONSONANTS) + word[i + 1:]
+        else:
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word
+
+
+def rank(index, query, book_id):
+    # What closest() ranks the book by, for telling ties apart from misses:
+    # how many of the query's words it has, and how close they are
+    words = set(index.docs[book_id][0].split() + index.docs[book_id][1].split())
+    closest = [max((similarity for known, similarity in index.vocabulary.similar(word) if known in words), default=0)
+               for word in query.split()]
+    return sum(map(bool, closest)), sum(closest)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    books = make_books(rng, args.records)
+    start = time.perf_counter()
+    index = SearchIndex.build(enumerate(books))
+    print(f"{args.records} books, {len(index.tokens)} words ({len(index.vocabulary)} fuzzy), "
+          f"indexed in {time.perf_counter() - start:.1f} s")
+
+    first = found = tied = substring = 0
+    latencies = []
+    for _ in range(args.queries):
+        book_id = rng.randrange(len(books))
+        title, author, _ = books[book_id]
+        word = max(title.lower().split(), key=len)
+        query = f"{misspell(rng, word)} {misspell(rng, author.lower().split()[-1])}"
+        start = time.perf_counter()
+        results = index.closest(query, args.limit)
+        latencies.append(time.perf_counter() - start)
+        first += bool(results) and results[0] == book_id
+        found += book_id in results
+        tied += bool(results) and rank(index, query, book_id) >= rank(index, query, results[0])
+        substring += book_id in index.search(query)
+
+    print(f"{args.queries} misspelt 'title word + surname' queries, top {args.limit}:")
+    print(f"  book ranked first   {first / args.queries:7.1%}")
+    print(f"  book in the results {found / args.queries:7.1%}")
+    print(f"  tied with the first {tied / args.queries:7.1%}")
+    print(f"  substring search    {substring / args.queries:7.1%}")
+    print(f"  latency ms          p50 {percentile(latencies, 0.5) * 1000:.2f}  "
+          f"p99 {percentile(latencies, 0.99) * 1000:.2f}  max {max(latencies) * 1000:.2f}")
+
+
+if __name__ == '__main__':
+    main()
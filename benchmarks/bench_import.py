@@ -0,0 +1,128 @@
+"""Bulk catalog import benchmark: Library.import_books against add_book.
+
+Starts from a library of --catalog books in the text files (or SQLite with
+--backend sqlite) and imports a --format file of --records records, of
+which a tenth are already in the catalog, a twentieth repeat an earlier
+record of the file and one in a hundred is invalid. Reports how long the
+import takes, how much the process's peak resident set grew meanwhile,
+how long the new books then take to index for search, and how long
+exporting the catalog takes. For comparison, it also times adding books one
+at a time through add_book, as the Add Book dialog does.
+
+    python benchmarks/bench_import.py [--records 1000000] [--catalog 100000] [--format csv]
+
+Linux only, since it reads /proc/self/status.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_files import read_books, write_books
+from library import Library
+from repository import BOOK_COLUMNS, LOAN_COLUMNS, PATRON_COLUMNS, SqliteRepository
+
+ADD_BOOK_SAMPLE = 2000  # books added one at a time
+
+
+def memory(field):
+    """VmRSS or VmHWM (the peak) of this process, in bytes."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    raise LookupError(field)
+
+
+def make_catalog(directory, size, backend):
+    rows = ([str(i), f"Title {i}", f"Author {i % 5000}", str(1800 + i % 220), '2', '2'] for i in range(size))
+    if backend == 'text':
+        with open(os.path.join(directory, 'books.txt'), 'w') as f:
+            f.writelines(','.join(row) + '\n' for row in rows)
+        for name in ('borrowers.txt', 'patrons.txt'):
+            open(os.path.join(directory, name), 'w').close()
+    else:
+        storage = SqliteRepository(os.path.join(directory, 'library.db'),
+                                   {'books': BOOK_COLUMNS, 'borrowers': LOAN_COLUMNS, 'patrons': PATRON_COLUMNS})
+        storage.insert_many('books', rows)
+        storage.close()
+
+
+def records(size, catalog, rng):
+    for i in range(size):
+        kind = rng.random()
+        if kind < 0.01:
+            yield {'Title': '', 'Author': 'Nobody', 'Year': '2000', 'Copies': '1'}
+        elif kind < 0.11 and catalog:
+            book = rng.randrange(catalog)
+            yield {'Title': f"Title {book}", 'Author': f"Author {book % 5000}", 'Year': str(1800 + book % 220),
+                   'Copies': '1'}
+        else:
+            # A twentieth of the new books come twice
+            book = i - 1 if kind > 0.95 and i else i
+            yield {'Title': f"Imported {book}", 'Author': f"Writer {book % 20000}", 'Year': str(1900 + book % 120),
+                   'Copies': str(1 + book % 3)}
+
+
+def write_file(path, form, rows):
+    with open(path, 'w', newline='') as f:
+        if form == 'csv':
+            writer = csv.DictWriter(f, ['Title', 'Author', 'Year', 'Copies'])
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--catalog', type=int, default=100000)
+    parser.add_argument('--format', default='csv', choices=['csv', 'jsonl'])
+    parser.add_argument('--backend', default='text', choices=['text', 'sqlite'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_catalog(tmp, args.catalog, args.backend)
+        path = os.path.join(tmp, 'import.' + args.format)
+        write_file(path, args.format, records(args.records, args.catalog, random.Random(0)))
+        library = Library.open(tmp, args.backend)
+        library.load()
+        print(f"{args.catalog} books in the catalog ({args.backend}), importing {args.records} records "
+              f"({os.path.getsize(path) / 2**20:.0f} MB of {args.format})")
+
+        resident, peak = memory('VmRSS'), memory('VmHWM')
+        start = time.perf_counter()
+        added, copied, invalid = library.import_books(read_books(path))
+        seconds = time.perf_counter() - start
+        grown = max(memory('VmHWM') - max(resident, peak), 0)
+        print(f"  import            {seconds:7.2f} s  peak memory +{grown / 2**20:.0f} MB, "
+              f"catalog +{(memory('VmRSS') - resident) / 2**20:.0f} MB")
+        print(f"                    {added} books added, {copied} copies of books already in it, "
+              f"{len(invalid)} records skipped")
+
+        start = time.perf_counter()
+        library.index_pending()
+        print(f"  search indexing   {time.perf_counter() - start:7.2f} s")
+
+        start = time.perf_counter()
+        write_books(os.path.join(tmp, 'export.' + args.format), library.catalog())
+        print(f"  export            {time.perf_counter() - start:7.2f} s  ({len(library.book_data)} books)")
+
+        start = time.perf_counter()
+        for i in range(ADD_BOOK_SAMPLE):
+            library.add_book(f"Added {i}", f"Writer {i}", '2024')
+        per_book = (time.perf_counter() - start) / ADD_BOOK_SAMPLE
+        print(f"  add_book          {per_book * 1000:7.2f} ms a book, "
+              f"{per_book * args.records:.0f} s for {args.records}")
+        library.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Startup loader benchmark.
+
+Times what Library.load() does with books.txt and borrowers.txt, reading
+the records with records.read_records and building the RecordTable from
+them, on synthetic files from 1k to 1M rows, and prints the cost per row,
+which should stay flat if loading is linear. The original per-line
+pd.concat loop is timed too on the same rows, up to --legacy-max rows,
+since it is quadratic and becomes unusable long before 1M.
+
+    python benchmarks/bench_loader.py [--sizes 1000,10000,100000,1000000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from library import BOOK_KINDS, LOAN_KINDS
+from record_table import RecordTable
+from records import format_records, gc_paused, read_records
+from repository import BOOK_COLUMNS, COLUMN_TYPES, LOAN_COLUMNS
+
+
+def book_rows(rows):
+    return ([str(i), f"Title {i}", f"Author {i % 5000}", str(1800 + i % 220), '2', '1'] for i in range(rows))
+
+
+def loan_rows(rows):
+    return ([str(i % 50000), str(i), '2024-09-13', '2024-10-05'] for i in range(rows))
+
+
+def write(path, rows, columns):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        f.writelines(format_records(rows, columns, COLUMN_TYPES))
+
+
+def load(path, columns, kinds, ids):
+    # As Library.load() does it: parse, then build the table in one go
+    with gc_paused():
+        rows, _ = read_records(path, len(columns))
+        return RecordTable.from_rows(columns, rows, [int(row[0]) for row in rows] if ids else None, kinds)
+
+
+def legacy_load(path, columns):
+    """The loader this benchmark replaces: one concat per line, of a file without a header."""
+    frame = pd.DataFrame(columns=columns)
+    with open(path, 'r') as f:
+        lines = f.readlines()
+    for line in lines:
+        if line.strip():
+            new_row = pd.DataFrame([line.strip().split(',')], columns=columns)
+            frame = pd.concat([frame, new_row], ignore_index=True)
+    return frame
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000')
+    parser.add_argument('--legacy-max', type=int, default=10000)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print(f"{'file':<10} {'rows':>9} {'load (s)':>10} {'us/row':>8} {'legacy (s)':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, make_rows, columns, kinds, ids in (('books', book_rows, BOOK_COLUMNS, BOOK_KINDS, True),
+                                                     ('borrowers', loan_rows, LOAN_COLUMNS, LOAN_KINDS, False)):
+            for rows in sizes:
+                path = os.path.join(tmp, f'{name}_{rows}.txt')
+                write(path, make_rows(rows), columns)
+                elapsed = timed(load, path, columns, kinds, ids)
+                legacy = '-'
+                if rows <= args.legacy_max:
+                    legacy_path = os.path.join(tmp, f'{name}_{rows}.old')
+                    with open(legacy_path, 'w') as f:
+                        f.writelines(','.join(row) + '\n' for row in make_rows(rows))
+                    legacy = f"{timed(legacy_load, legacy_path, columns):.3f}"
+                print(f"{name:<10} {rows:>9} {elapsed:>10.3f} {elapsed / rows * 1e6:>8.2f} {legacy:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Catalog memory benchmark: object-dtype DataFrames vs compact RecordTables.
+
+Builds a books table and a loans table twice: as DataFrames of Python
+strings, the layout book_data and borrowed_books had before RecordTable, and
+as RecordTables with the compact column types Library uses (BOOK_KINDS and
+LOAN_KINDS). Each table and layout is built in a fresh process, and what is
+reported is how much that process's resident set grew, so every string,
+array and dict counts.
+
+    python benchmarks/bench_memory.py [--books 1000000] [--loans 5000000]
+
+Linux only, since it reads /proc/self/statm.
+"""
+import argparse
+import datetime
+import gc
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from library import BOOK_KINDS, LOAN_KINDS
+from repository import BOOK_COLUMNS, LOAN_COLUMNS
+
+FIRST_DAY = datetime.date(2024, 1, 1).toordinal()
+
+
+def book_values(size, books):
+    # Generators, so each field is a new string as if it had just been read
+    # from books.txt, and only the table being measured keeps them
+    return {'Book ID': (str(i) for i in range(size)),
+            'Title': (f"Title {i}" for i in range(size)),
+            'Author': (f" Author {i % 5000}" for i in range(size)),
+            'Year': (f" {1800 + i % 220}" for i in range(size)),
+            'Copies': (str(1 + i % 3) for i in range(size)),
+            'Available': (str(i % 3) for i in range(size))}
+
+
+def loan_values(size, books):
+    def date(i, offset):
+        return ' ' + datetime.date.fromordinal(FIRST_DAY + i % 365 + offset).isoformat()
+    return {'Borrower ID': (str(i % 200000) for i in range(size)),
+            'Book ID': (str(i % books) for i in range(size)),
+            'Borrow Date': (date(i, 0) for i in range(size)),
+            'Return Date': (date(i, 14) for i in range(size))}
+
+
+TABLES = {'books': (BOOK_COLUMNS, BOOK_KINDS, book_values),
+          'loans': (LOAN_COLUMNS, LOAN_KINDS, loan_values)}
+
+
+def resident():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure(layout, table, size, books):
+    """Build one table in this process; returns (bytes, seconds)."""
+    columns, kinds, make_values = TABLES[table]
+    if layout == 'pandas':
+        import pandas as pd
+    else:
+        from record_table import RecordTable
+    gc.collect()
+    before = resident()
+    start = time.perf_counter()
+    values = make_values(size, books)
+    if layout == 'pandas':
+        built = pd.DataFrame({column: list(values[column]) for column in columns}, columns=columns)
+    else:
+        built = RecordTable.from_columns(columns, values, size, kinds=kinds)
+    seconds = time.perf_counter() - start
+    gc.collect()
+    used = resident() - before
+    assert len(built) == size
+    return used, seconds
+
+
+def run_child(layout, table, size, books):
+    output = subprocess.run([sys.executable, __file__, '--child', layout, table, str(size), str(books)],
+                            check=True, capture_output=True, text=True).stdout
+    used, seconds = output.split()
+    return int(used), float(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--loans', type=int, default=5000000)
+    parser.add_argument('--child', nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        layout, table, size, books = args.child
+        print(*measure(layout, table, int(size), int(books)))
+        return
+
+    print(f"{'table':<8}{'rows':>10}{'DataFrame':>14}{'RecordTable':>14}{'ratio':>8}{'bytes/row':>16}")
+    for table, size in (('books', args.books), ('loans', args.loans)):
+        frame, frame_seconds = run_child('pandas', table, size, args.books)
+        compact, compact_seconds = run_child('compact', table, size, args.books)
+        print(f"{table:<8}{size:>10}{frame / 2**20:>11.1f} MB{compact / 2**20:>11.1f} MB"
+              f"{frame / compact:>7.1f}x{frame / size:>8.0f} ->{compact / size:>5.0f}")
+        print(f"{'':<8}{'built in':>10}{frame_seconds:>12.1f} s{compact_seconds:>12.1f} s")
+
+
+if __name__ == '__main__':
+    main()
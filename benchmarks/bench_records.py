@@ -0,0 +1,81 @@
+"""Record format benchmark: parsing and writing the text files, in the record format and the old one.
+
+Writes --rows catalog records and as many loans and reviews in the record
+format of records.py (a tenth of the titles and reviews have a comma or
+quote in them, so they are quoted), then times reading them back with
+read_records and scanning the reviews like the review index does. The
+same rows in the old comma-split format are read for comparison, without
+the quoted titles, which that format can't hold.
+
+    python benchmarks/bench_records.py [--rows 1000000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import REVIEW_COLUMNS, data_start, format_records, parse_review, read_records, scan_records
+from repository import BOOK_COLUMNS, COLUMN_TYPES, LOAN_COLUMNS
+
+
+def make_rows(size):
+    books = [[str(i), f"Crime, and Punishment {i}" if i % 10 == 0 else f"Title {i}", f"Author {i % 5000}",
+              str(1800 + i % 220), '2', '1'] for i in range(size)]
+    loans = [[str(i % 50000), str(i), '2024-09-13', '2024-10-05'] for i in range(size)]
+    reviews = [(f"Title {i % (size // 10 or 1)}", f'A "quoted" review, number {i}' if i % 10 == 0 else f"Review {i}")
+               for i in range(size)]
+    return books, loans, reviews
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def write(path, rows, columns, types=None):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        f.writelines(format_records(rows, columns, types))
+
+
+def scan_reviews(path):
+    titles = 0
+    with open(path, 'rb') as f:
+        quoted = data_start(f)
+        for _, _, record in scan_records(f, quoted):
+            titles += parse_review(record, quoted) is not None
+    return titles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    books, loans, reviews = make_rows(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{args.rows} rows per table")
+        for name, rows, columns in (('books', books, BOOK_COLUMNS), ('loans', loans, LOAN_COLUMNS)):
+            path = os.path.join(tmp, name + '.txt')
+            _, written = timed(write, path, rows, columns, COLUMN_TYPES)
+            (read, malformed), seconds = timed(read_records, path, len(columns))
+            assert read == rows and not malformed
+            old_path = os.path.join(tmp, name + '.old')
+            with open(old_path, 'w') as f:
+                f.writelines(','.join(field.replace(',', ';') for field in row) + '\n' for row in rows)
+            _, old_seconds = timed(read_records, old_path, len(columns))
+            print(f"  {name:8} write {args.rows / written / 1e6:5.2f}M rows/s  read {args.rows / seconds / 1e6:5.2f}M "
+                  f"rows/s  (old format: read {args.rows / old_seconds / 1e6:5.2f}M rows/s)")
+
+        path = os.path.join(tmp, 'reviews.txt')
+        _, written = timed(write, path, reviews, REVIEW_COLUMNS)
+        scanned, seconds = timed(scan_reviews, path)
+        assert scanned == len(reviews)
+        print(f"  reviews  write {args.rows / written / 1e6:5.2f}M rows/s  scan {args.rows / seconds / 1e6:5.2f}M rows/s")
+
+
+if __name__ == '__main__':
+    main()
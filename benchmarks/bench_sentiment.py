@@ -0,0 +1,95 @@
+"""Sentiment model startup and throughput benchmark.
+
+Time to first window: how long `import libBERT` plus showing the welcome
+screen takes when the pipeline is created at import time (the old behaviour)
+versus loaded on a background thread. Each case runs in a fresh interpreter so
+nothing is cached between them.
+
+Throughput: reviews per second when calling the pipeline once per review
+versus once per batch of --batch-size reviews.
+
+    python benchmarks/bench_sentiment.py [--reviews 512] [--batch-size 32]
+
+Needs transformers and the default sentiment-analysis model to be available.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sentiment import load_bert_pipeline, score_batches
+
+# Both scripts print the seconds until the welcome screen has been shown
+EAGER = """
+import time
+start = time.perf_counter()
+from transformers import pipeline
+pipeline("sentiment-analysis")
+import libBERT
+from PyQt5.QtWidgets import QApplication
+app = QApplication([])
+screen = libBERT.WelcomeScreen()
+screen.show()
+app.processEvents()
+print(time.perf_counter() - start)
+"""
+
+BACKGROUND = """
+import time
+start = time.perf_counter()
+import libBERT
+from PyQt5.QtWidgets import QApplication
+app = QApplication([])
+screen = libBERT.WelcomeScreen()
+screen.show()
+app.processEvents()
+print(time.perf_counter() - start)
+"""
+
+
+def time_to_window(script):
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.split()[-1])
+
+
+def make_reviews(count):
+    phrases = ["A wonderful, moving story.", "Dull and far too long.", "The ending felt rushed but the characters were great.",
+               "I could not put it down!", "Not worth the paper it is printed on."]
+    return [f"{phrases[i % len(phrases)]} (copy {i})" for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reviews', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"time to first window, model loaded eagerly:       {time_to_window(EAGER):.2f} s")
+    print(f"time to first window, model loaded in background: {time_to_window(BACKGROUND):.2f} s")
+
+    model = load_bert_pipeline()
+    reviews = make_reviews(args.reviews)
+    model(reviews[:8])  # warm up
+
+    start = time.perf_counter()
+    for review in reviews:
+        model(review)
+    single = len(reviews) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in score_batches(model, reviews, args.batch_size):
+        pass
+    batched = len(reviews) / (time.perf_counter() - start)
+
+    print(f"per review:          {single:>8.1f} reviews/s")
+    print(f"batches of {args.batch_size:<4}:     {batched:>8.1f} reviews/s ({batched / single:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
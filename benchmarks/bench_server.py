@@ -0,0 +1,122 @@
+"""Load generator for library_server.py: many desks searching, lending and taking returns.
+
+Writes a catalog of --books titles, one to three copies each, to a temporary
+directory, starts the server on it in a subprocess and connects --desks
+simulated desks over a Unix socket. Each desk sends one request at a time for --seconds: mostly
+searches, then checkouts of books its searches found and returns of its
+own loans. Reports operations per second and latency percentiles per
+operation.
+
+    python benchmarks/bench_server.py [--desks 50] [--books 100000] [--seconds 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Title words, made of syllables so there are a few thousand of them, as in
+# a real catalog, instead of a handful that every other title shares
+SYLLABLES = ['ka', 'ri', 'mon', 'tel', 'sa', 'vor', 'len', 'di', 'bra', 'quin', 'os', 'mar', 'te', 'ul', 'fen']
+WORDS = sorted({a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES[::2]})
+# Share of each operation in a desk's requests
+MIX = {'search': 0.7, 'borrow': 0.15, 'return': 0.15}
+
+
+def write_catalog(directory, size):
+    rng = random.Random(1)
+    with open(os.path.join(directory, 'books.txt'), 'w') as f:
+        for i in range(size):
+            copies = 1 + i % 3
+            f.write(f"{i},The {rng.choice(WORDS).title()} of {rng.choice(WORDS).title()} {i}, "
+                    f"Author {i % 5000}, {1800 + i % 220},{copies},{copies}\n")
+    for name in ('borrowers.txt', 'patrons.txt', 'reviews.txt'):
+        open(os.path.join(directory, name), 'w').close()
+
+
+async def desk(number, socket_path, deadline, latencies, refused):
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=1 << 24)
+    rng = random.Random(number)
+    found, loans, request_id = [], [], 0
+
+    async def call(op, **fields):
+        nonlocal request_id
+        request_id += 1
+        started = time.perf_counter()
+        writer.write(json.dumps({'id': request_id, 'op': op, **fields}).encode() + b'\n')
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        latencies[op].append(time.perf_counter() - started)
+        if not reply['ok']:
+            refused[op] += 1
+        return reply.get('result')
+
+    while time.perf_counter() < deadline:
+        op = rng.choices(list(MIX), list(MIX.values()))[0]
+        if op == 'borrow' and found:
+            loan_id = await call('borrow', book_id=found.pop(rng.randrange(len(found))), borrower=f"Desk {number}")
+            if loan_id is not None:
+                loans.append(loan_id)
+        elif op == 'return' and loans:
+            await call('return', loan_id=loans.pop(rng.randrange(len(loans))))
+        else:
+            # A word, or the start of one as if it were still being typed
+            word = rng.choice(WORDS)
+            query = word if rng.random() < 0.5 else word[:rng.randint(3, len(word))]
+            result = await call('search', query=query, limit=20)
+            found = [book[0] for book in result['books']]
+    writer.close()
+
+
+async def run_desks(socket_path, desks, seconds):
+    latencies = {op: [] for op in MIX}
+    refused = dict.fromkeys(MIX, 0)
+    started = time.perf_counter()
+    await asyncio.gather(*(desk(number, socket_path, started + seconds, latencies, refused)
+                           for number in range(desks)))
+    return latencies, refused, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--desks', type=int, default=50)
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_catalog(tmp, args.books)
+        socket_path = os.path.join(tmp, 'library.sock')
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'library_server.py'),
+                                   '--dir', tmp, '--socket', socket_path, '--backend', 'text'],
+                                  stderr=subprocess.PIPE, text=True)
+        try:
+            # The server reports on stderr once it is listening
+            print(server.stderr.readline().strip())
+            latencies, refused, elapsed = asyncio.run(run_desks(socket_path, args.desks, args.seconds))
+        finally:
+            server.terminate()
+            server.wait()
+
+    total = sum(map(len, latencies.values()))
+    print(f"{args.desks} desks, {total} operations in {elapsed:.1f} s: {total / elapsed:.0f} ops/s")
+    print(f"{'op':<8}{'count':>8}{'refused':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for op, values in list(latencies.items()) + [('all', sum(latencies.values(), []))]:
+        print(f"{op:<8}{len(values):>8}{refused.get(op, sum(refused.values())):>9}"
+              f"{percentile(values, 0.5) * 1000:>9.2f}{percentile(values, 0.99) * 1000:>9.2f}"
+              f"{max(values, default=float('nan')) * 1000:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Startup benchmark: reading the catalog and loans from the text files and from binary snapshots.
+
+Writes --rows books and as many loans in the record format, and a binary
+snapshot of each (see table_snapshot.py), then times what Library.load()
+does with each table either way: parse the file and build the RecordTable
+from the rows, or open the snapshot. After a snapshot is opened, titles
+come from the file as they are read, so the time to read a thousand
+titles at random and then every title is shown as well. The files were
+just written, so this is a start with them in the page cache. Parsing ten
+million rows takes several GB, so --no-parse times the snapshots alone.
+
+    python benchmarks/bench_startup.py [--rows 1000000] [--no-parse]
+
+The search index (books.idx) is loaded at startup too and isn't part of
+this; run with --library to time a whole Library.load() both ways.
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from library import BOOK_FILE, BORROWER_FILE, BOOK_KINDS, LOAN_KINDS, PATRON_FILE, REVIEW_FILE, Library
+from record_table import RecordTable
+from records import format_records, gc_paused, read_records
+from repository import BOOK_COLUMNS, COLUMN_TYPES, LOAN_COLUMNS, PATRON_COLUMNS
+from search_index import file_signature
+from table_snapshot import load_table, save_table
+
+SNAPSHOT_FILES = {'books': 'books.snap', 'borrowers': 'borrowers.snap'}
+
+
+def make_tables(size):
+    # Straight into compact columns, so ten million rows fit in memory
+    books = RecordTable.from_columns(BOOK_COLUMNS, {
+        'Book ID': map(str, range(size)),
+        'Title': (f"Crime, and Punishment {i}" if i % 10 == 0 else f"Title {i}" for i in range(size)),
+        'Author': (f"Author {i % 50000}" for i in range(size)),
+        'Year': (str(1800 + i % 220) for i in range(size)),
+        'Copies': ('2' for _ in range(size)),
+        'Available': ('1' for _ in range(size))}, size, kinds=BOOK_KINDS)
+    loans = RecordTable.from_columns(LOAN_COLUMNS, {
+        'Borrower ID': (str(i % 100000) for i in range(size)),
+        'Book ID': map(str, range(size)),
+        'Borrow Date': ('2024-09-13' for _ in range(size)),
+        'Return Date': ('2024-10-05' for _ in range(size))}, size, kinds=LOAN_KINDS)
+    return books, loans
+
+
+def timed(function, *args):
+    gc.collect()
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def parse(path, columns, kinds, ids):
+    with gc_paused():
+        rows, _ = read_records(path, len(columns))
+        return RecordTable.from_rows(columns, rows, [int(row[0]) for row in rows] if ids else None, kinds)
+
+
+def read_titles(table, slots):
+    titles = table.data['Title']
+    return sum(len(titles[slot]) for slot in slots)
+
+
+def write_library(directory, books, loans):
+    for name, table in (('books', books), ('borrowers', loans)):
+        path = os.path.join(directory, {'books': BOOK_FILE, 'borrowers': BORROWER_FILE}[name])
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            f.writelines(format_records(table.rows(), table.columns, COLUMN_TYPES))
+    with open(os.path.join(directory, PATRON_FILE), 'w', newline='', encoding='utf-8') as f:
+        f.writelines(format_records(([str(i), f"Borrower {i}", f"b{i}@example.com", ''] for i in range(100000)),
+                                    PATRON_COLUMNS, COLUMN_TYPES))
+    open(os.path.join(directory, REVIEW_FILE), 'w').close()
+
+
+def time_library(directory, snapshots):
+    library = Library.open(directory, 'text', snapshots=snapshots)
+    _, seconds = timed(library.load)
+    library.close()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--no-parse', action='store_true', help="skip parsing the text files")
+    parser.add_argument('--library', action='store_true', help="also time Library.load() with and without snapshots")
+    args = parser.parse_args()
+
+    books, loans = make_tables(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        write_library(tmp, books, loans)
+        print(f"{args.rows} books and {args.rows} loans")
+        for name, table, columns, kinds, ids in (('books', books, BOOK_COLUMNS, BOOK_KINDS, True),
+                                                 ('borrowers', loans, LOAN_COLUMNS, LOAN_KINDS, False)):
+            text_path = os.path.join(tmp, {'books': BOOK_FILE, 'borrowers': BORROWER_FILE}[name])
+            snapshot_path = os.path.join(tmp, SNAPSHOT_FILES[name])
+            signature = file_signature(text_path)
+            _, written = timed(save_table, snapshot_path, table, signature, (), not ids)
+
+            (opened, _), seconds = timed(load_table, snapshot_path, signature, columns, kinds)
+            assert len(opened) == len(table)
+            line = (f"  {name:9} text {os.path.getsize(text_path) / 1e6:6.0f} MB, snapshot "
+                    f"{os.path.getsize(snapshot_path) / 1e6:6.0f} MB (written in {written:.2f} s)\n"
+                    f"            open snapshot {seconds * 1000:8.1f} ms")
+            if name == 'books':
+                _, sampled = timed(read_titles, opened, random.Random(1).sample(range(len(opened)), 1000))
+                _, scanned = timed(read_titles, opened, range(len(opened)))
+                line += f", then 1000 titles {sampled * 1000:.1f} ms, every title {scanned:.2f} s"
+            del opened
+            if not args.no_parse:
+                parsed, seconds = timed(parse, text_path, columns, kinds, ids)
+                assert len(parsed) == len(table)
+                del parsed
+                line += f"\n            parse text    {seconds * 1000:8.1f} ms"
+            print(line)
+
+        if args.library:
+            del books, loans
+            # The first load builds and saves the search index, the third
+            # saves the snapshots
+            time_library(tmp, snapshots=False)
+            parsed = time_library(tmp, snapshots=False)
+            time_library(tmp, snapshots=True)
+            opened = time_library(tmp, snapshots=True)
+            print(f"  Library.load() parsing the files {parsed:.2f} s, from snapshots {opened:.2f} s "
+                  f"(both loading the saved search index; 100000 borrowers)")
+
+
+if __name__ == '__main__':
+    main()
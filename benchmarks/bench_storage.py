@@ -0,0 +1,97 @@
+"""Text files vs SQLite storage benchmark.
+
+For each size, fills both backends with that many books, a tenth as many
+loans and as many reviews, then times a full load of the books table,
+checkouts (one commit taking a copy off the shelf and inserting a loan;
+the text backend includes its periodic compaction) and fetching the reviews of one title.
+
+    python benchmarks/bench_storage.py [--sizes 10000,100000,1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repository import BOOK_COLUMNS, LOAN_COLUMNS, SqliteRepository, TextRepository
+
+TABLES = {'books': BOOK_COLUMNS, 'borrowers': LOAN_COLUMNS}
+
+
+def make_rows(size):
+    books = [[str(i), f"Title {i}", f"Author {i % 5000}", str(1800 + i % 220), '2', '2'] for i in range(size)]
+    loans = [[str(i), str(i), '2024-09-13', '2024-10-05'] for i in range(0, size, 10)]
+    reviews = [(f"Title {i % (size // 10)}", f"Review number {i}") for i in range(size)]
+    return books, loans, reviews
+
+
+def fill_text(tmp, books, loans, reviews):
+    files = {'books': os.path.join(tmp, 'books.txt'), 'borrowers': os.path.join(tmp, 'borrowers.txt')}
+    for table, rows in (('books', books), ('borrowers', loans)):
+        with open(files[table], 'w') as f:
+            f.writelines(','.join(row) + '\n' for row in rows)
+    review_path = os.path.join(tmp, 'reviews.txt')
+    with open(review_path, 'w') as f:
+        f.writelines(f"{title}:{review}\n" for title, review in reviews)
+    return lambda: TextRepository(files, TABLES, os.path.join(tmp, 'library.journal'), review_path)
+
+
+def fill_sqlite(tmp, books, loans, reviews):
+    path = os.path.join(tmp, 'library.db')
+    database = SqliteRepository(path, TABLES)
+    database.insert_many('books', books)
+    database.insert_many('borrowers', loans)
+    database.insert_many('reviews', reviews)
+    database.close()
+    return lambda: SqliteRepository(path, TABLES)
+
+
+def run(open_repository, books, checkouts, lookups):
+    start = time.perf_counter()
+    repository = open_repository()
+    current = {'books': repository.load('books')[0], 'borrowers': repository.load('borrowers')[0]}
+    load = time.perf_counter() - start
+
+    rng = random.Random(0)
+    picked = rng.sample(range(len(books)), checkouts)
+    start = time.perf_counter()
+    for i in picked:
+        # A checkout takes a copy off the shelf and records the loan
+        repository.commit([('borrowers', 'insert', ['0', str(i), '2024-09-13', '2024-10-05'], None),
+                           ('books', 'update', books[i], [*books[i][:5], '1'])])
+        # The benchmark doesn't track the live rows, so compaction rewrites the loaded ones
+        repository.compact_if_needed(lambda: current)
+    checkout = (time.perf_counter() - start) / checkouts
+
+    titles = [f"Title {rng.randrange(len(books) // 10)}" for _ in range(lookups)]
+    start = time.perf_counter()
+    for title in titles:
+        repository.reviews_for(title)
+    review = (time.perf_counter() - start) / lookups
+    repository.flush(lambda: current)
+    repository.close()
+    return load, checkout, review
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--checkouts', type=int, default=2000)
+    parser.add_argument('--lookups', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'backend':<8} {'records':>9} {'load (s)':>9} {'checkout (ms)':>14} {'reviews (ms)':>13}")
+    for size in (int(size) for size in args.sizes.split(',')):
+        books, loans, reviews = make_rows(size)
+        for name, fill in (('text', fill_text), ('sqlite', fill_sqlite)):
+            with tempfile.TemporaryDirectory() as tmp:
+                load, checkout, review = run(fill(tmp, books, loans, reviews), books,
+                                             min(args.checkouts, size // 2), args.lookups)
+                print(f"{name:<8} {size:>9} {load:>9.3f} {checkout * 1000:>14.3f} {review * 1000:>13.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Stress test: many library instances lending and taking back the same books at once.
+
+Writes a catalog of --titles titles with --copies copies each to a temporary
+directory, then starts --workers processes that each open their own Library
+on it and run --cycles borrow/return cycles against whatever is on the shelf
+or out on loan, so they keep reaching for the same books. A change that clashes with
+another worker's is refused with ConflictError; the worker catches up and
+carries on. With --background, workers save through a StorageWriter, as
+the windows and the server do, so clashing changes are dropped on the storage
+thread and the worker loads everything again. With --kill, one extra worker
+is killed with SIGKILL halfway through, possibly in the middle of a write.
+
+Afterwards the library is opened fresh and every title must still have its
+copies, each exactly once on the shelf or on loan: nothing lost, nothing
+doubled.
+
+    python benchmarks/stress_transactions.py [--workers 8] [--cycles 500] [--backend text] [--background] [--kill]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from library import Library
+from repository import BOOK_COLUMNS, ConflictError, SqliteRepository
+
+
+def write_catalog(directory, backend, titles, copies):
+    books = [[str(i), f"Title {i}", f" Author {i % 17}", f" {1900 + i % 120}", str(copies), str(copies)]
+             for i in range(titles)]
+    if backend == 'sqlite':
+        database = SqliteRepository(os.path.join(directory, 'library.db'), {'books': BOOK_COLUMNS})
+        database.insert_many('books', books)
+        database.close()
+    else:
+        with open(os.path.join(directory, 'books.txt'), 'w') as f:
+            f.writelines(','.join(book) + '\n' for book in books)
+        for name in ('borrowers.txt', 'patrons.txt', 'reviews.txt'):
+            open(os.path.join(directory, name), 'w').close()
+    return books
+
+
+def worker(number, directory, backend, background, cycles, results):
+    library = Library.open(directory, backend, background)
+    library.load()
+    rng = random.Random(number)
+    done = conflicts = 0
+    while done < cycles:
+        _, dropped, _ = library.refresh()
+        conflicts += dropped
+        try:
+            loans = list(library.borrowed_books)
+            shelved = [book_id for book_id in library.book_data if library.available(book_id)]
+            if loans and (rng.random() < 0.5 or not shelved):
+                # Any desk can take back any loan, so workers race for these too
+                library.return_book(rng.choice(loans))
+                done += 1
+            elif shelved:
+                library.borrow_book(rng.choice(shelved), f"Desk {number} patron {rng.randrange(20)}")
+        except ConflictError:
+            conflicts += 1
+    # Whatever the storage thread still drops is counted before closing
+    conflicts += library.refresh()[1]
+    library.close()
+    if results is not None:
+        results.put((number, done, conflicts))
+
+
+def count_copies(directory, backend):
+    # Copies per title, as the catalog counts them and as the shelf and the
+    # loans add up
+    library = Library.open(directory, backend)
+    library.load()
+    books = library.book_data
+    counted = Counter({books.value(book_id, 'Title'): int(books.value(book_id, 'Copies')) for book_id in books})
+    titles = Counter({books.value(book_id, 'Title'): library.available(book_id) for book_id in books})
+    titles.update(library.loan_value(loan_id, 'Title') for loan_id in library.borrowed_books)
+    on_shelf, on_loan = sum(map(library.available, books)), len(library.borrowed_books)
+    library.close()
+    return counted, titles, on_shelf, on_loan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--cycles', type=int, default=500, help="returns each worker makes")
+    parser.add_argument('--titles', type=int, default=20)
+    parser.add_argument('--copies', type=int, default=5)
+    parser.add_argument('--backend', default='text', choices=['text', 'sqlite'])
+    parser.add_argument('--background', action='store_true', help="save through a StorageWriter")
+    parser.add_argument('--kill', action='store_true', help="SIGKILL one more worker halfway through")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        books = write_catalog(tmp, args.backend, args.titles, args.copies)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker, args=(number, tmp, args.backend, args.background, args.cycles, results))
+                     for number in range(args.workers)]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        if args.kill:
+            victim = multiprocessing.Process(target=worker, args=(args.workers, tmp, args.backend, args.background, 10 ** 9, None))
+            victim.start()
+            time.sleep(2)
+            os.kill(victim.pid, signal.SIGKILL)
+            victim.join()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+        if any(process.exitcode for process in processes):
+            sys.exit("FAILED: a worker crashed")
+        finished = [results.get() for _ in processes]
+
+        cycles = sum(done for _, done, _ in finished)
+        conflicts = sum(conflicted for _, _, conflicted in finished)
+        print(f"{args.workers} workers ({args.backend}{', background' if args.background else ''}), {cycles} borrow/return cycles in {elapsed:.1f} s, "
+              f"{conflicts} conflicts refused{', one worker killed' if args.kill else ''}")
+
+        counted, titles, on_shelf, on_loan = count_copies(tmp, args.backend)
+        expected = Counter({book[1]: args.copies for book in books})
+        print(f"{on_shelf} copies on the shelf + {on_loan} on loan = {on_shelf + on_loan}, "
+              f"expected {args.titles * args.copies}")
+        if counted != expected:
+            sys.exit(f"FAILED: the catalog counts {dict(counted - expected)} more and {dict(expected - counted)} fewer copies")
+        if titles != expected:
+            lost, doubled = expected - titles, titles - expected
+            sys.exit(f"FAILED: copies lost {dict(lost)}, copies doubled {dict(doubled)}")
+        print("OK: every copy is accounted for exactly once")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+from record_table import RecordTable
+from repository import PATRON_COLUMNS
+
+
+class BorrowerRegistry:
+    """Everyone who has borrowed a book, each stored once under an integer id.
+
+    Loans only refer to a borrower's id. Email and phone are hash indexed, so
+    a returning borrower is recognised without a scan; the name index is for
+    borrowers registered without any contact details and for looking people
+    up by name. Relatives often share a phone and sometimes an email, so
+    each index keeps every borrower with the value, and find() only takes
+    one of them for the same person if none of their details disagree.
+    """
+
+    def __init__(self, table=None):
+        self.table = table if table is not None else RecordTable(PATRON_COLUMNS)
+        self.by_email = {}
+        self.by_phone = {}
+        self.by_name = {}
+        for borrower_id, row in self.table.items():
+            self._index(borrower_id, row)
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        return cls(RecordTable.from_rows(PATRON_COLUMNS, rows, [int(row[0]) for row in rows]))
+
+    def __len__(self):
+        return len(self.table)
+
+    def _index(self, borrower_id, row):
+        _, name, email, phone = row
+        if email.strip():
+            self.by_email.setdefault(_key(email), []).append(borrower_id)
+        if phone.strip():
+            self.by_phone.setdefault(_key(phone), []).append(borrower_id)
+        self.by_name.setdefault(_key(name), []).append(borrower_id)
+
+    def find(self, name='', email='', phone=''):
+        """The id of the borrower with these details, or None.
+
+        A borrower is the same person if they have the same email, or the
+        same phone and name, and neither their email nor their phone is
+        different where both are filled in. Without either, a borrower with
+        the same name and no contact details is the same person.
+        """
+        name, email, phone = _key(name), _key(email), _key(phone)
+        if email or phone:
+            candidates = self.by_email.get(email, []) + self.by_phone.get(phone, [])
+        else:
+            candidates = self.by_name.get(name, ())
+        for borrower_id in candidates:
+            if self._same(borrower_id, name, email, phone):
+                return borrower_id
+        return None
+
+    def _same(self, borrower_id, name, email, phone):
+        _, known_name, known_email, known_phone = map(_key, self.table.row(borrower_id))
+        if email and known_email and email != known_email:
+            return False
+        if phone and known_phone and phone != known_phone:
+            return False
+        if email and email == known_email:
+            return True
+        if phone and phone == known_phone:
+            return name == known_name
+        return not (email or phone or known_email or known_phone) and name == known_name
+
+    def register(self, name, email='', phone=''):
+        """Add a new borrower and return their row, id first."""
+        row = self.new_row(name, email, phone)
+        self.add(row)
+        return row
+
+    def new_row(self, name, email='', phone=''):
+        """The row a new borrower would be registered under, without adding it."""
+        return [str(self.table.next_id), name, email, phone]
+
+    def add(self, row):
+        """Add a borrower row, e.g. one from new_row() or another instance; its id must be new."""
+        borrower_id = int(row[0])
+        self.table.insert(row, borrower_id)
+        self._index(borrower_id, row)
+
+    def lookup(self, text):
+        """Ids of the borrowers whose name, email or phone is text."""
+        key = _key(text)
+        ids = list(self.by_name.get(key, ()))
+        for index in (self.by_email, self.by_phone):
+            ids.extend(borrower_id for borrower_id in index.get(key, ()) if borrower_id not in ids)
+        return ids
+
+    def value(self, borrower_id, column):
+        return self.table.value(borrower_id, column)
+
+    def record(self, borrower_id):
+        return self.table.record(borrower_id)
+
+
+def _key(text):
+    return text.strip().lower()
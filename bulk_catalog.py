@@ -0,0 +1,64 @@
+"""Import or export the whole catalog from the command line, without opening the library window.
+
+    python bulk_catalog.py import books.csv      # add the books of a .csv, .jsonl or .parquet file
+    python bulk_catalog.py export catalog.jsonl  # write every book to a file, in the format of its extension
+
+An import adds copies to the books the catalog already has, saves the
+catalog in one write and indexes the new books for search, so the next
+start of the window finds the index ready. An export only loads the
+catalog, without the search index. See catalog_files.py for the formats.
+"""
+import argparse
+import sys
+import time
+
+from catalog_files import read_books, write_books
+from library import Library, STORAGE_BACKEND
+from repository import ConflictError
+
+INVALID_SHOWN = 20  # skipped records listed after an import
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('file', help="a .csv, .jsonl or .parquet file")
+    parser.add_argument('--dir', default='.', help="directory holding the library files")
+    parser.add_argument('--backend', default=STORAGE_BACKEND, choices=['text', 'sqlite'])
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    library = Library.open(args.dir, args.backend)
+    if args.action == 'export':
+        library.load_loans()
+        try:
+            written = write_books(args.file, library.catalog())
+        except (ValueError, OSError, ImportError) as error:
+            sys.exit(f"Export failed: {error}")
+        finally:
+            library.storage.close()
+        print(f"{written} books exported in {time.perf_counter() - started:.2f} s", file=sys.stderr)
+        return
+
+    library.load()
+    try:
+        added, copied, invalid = library.import_books(read_books(args.file))
+    except ConflictError:
+        library.close()
+        sys.exit("Import failed: the catalog was changed at another desk meanwhile; nothing was imported")
+    except (ValueError, OSError, ImportError, UnicodeDecodeError) as error:
+        library.close()
+        sys.exit(f"Import failed: {error}")
+    imported = time.perf_counter()
+    library.index_pending()
+    library.close()
+    print(f"{added} books added, {copied} copies added to books already in the catalog; imported in "
+          f"{imported - started:.2f} s, indexed in {time.perf_counter() - imported:.2f} s", file=sys.stderr)
+    for number, reason in invalid[:INVALID_SHOWN]:
+        print(f"record {number} skipped: {reason}", file=sys.stderr)
+    if len(invalid) > INVALID_SHOWN:
+        print(f"... {len(invalid) - INVALID_SHOWN} more records skipped", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""Whole catalogs in and out of CSV, JSON Lines and Parquet files.
+
+read_books() streams the records of a file a chunk at a time, as dicts with
+lowercase keys, and Library.import_books() adds them to the catalog;
+write_books() streams the catalog out the same way. Neither ever holds more
+than a chunk of the file. The format comes from the file's extension.
+
+A CSV file starts with a header row and a JSON Lines file has an object
+per line. Title, Author and Year are needed; Copies is optional (1 by
+default). Other columns, e.g. the Available of an exported catalog, are
+ignored on import. Parquet needs pyarrow, which is only imported for it.
+"""
+import csv
+import json
+import os
+from array import array
+from itertools import islice
+
+from columns import CategoryColumn, TextColumn
+
+CHUNK = 10000   # records read or written at a time
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.parquet': 'parquet'}
+# For file dialogs
+FILE_FILTER = "Catalogs (*.csv *.jsonl *.ndjson *.parquet)"
+
+EXPORT_COLUMNS = ['Title', 'Author', 'Year', 'Copies', 'Available']
+
+
+def file_format(path):
+    """'csv', 'jsonl' or 'parquet', from the extension of path."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"{os.path.basename(path)} is not a .csv, .jsonl or .parquet file")
+    return FORMATS[extension]
+
+
+def _parquet():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet files need pyarrow. Run: pip install pyarrow") from None
+    return pyarrow, pyarrow.parquet
+
+
+def read_books(path, chunk_size=CHUNK):
+    """Yield the records of the catalog file at path, as lists of up to chunk_size dicts.
+
+    A JSON Lines record that isn't a JSON object comes as None, for
+    book_fields() to report along with the other invalid records.
+    """
+    return {'csv': _read_csv, 'jsonl': _read_jsonl, 'parquet': _read_parquet}[file_format(path)](path, chunk_size)
+
+
+def _read_csv(path, chunk_size):
+    # utf-8-sig: spreadsheets often start the file with a byte order mark
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        header = [name.strip().lower() for name in next(reader, [])]
+        while chunk := [dict(zip(header, row)) for row in islice(reader, chunk_size)]:
+            yield chunk
+
+
+def _read_jsonl(path, chunk_size):
+    def record(line):
+        try:
+            value = json.loads(line)
+        except ValueError:
+            return None
+        return {str(key).strip().lower(): field for key, field in value.items()} if isinstance(value, dict) else None
+
+    with open(path, encoding='utf-8') as file:
+        lines = (line for line in file if line.strip())
+        while chunk := [record(line) for line in islice(lines, chunk_size)]:
+            yield chunk
+
+
+def _read_parquet(path, chunk_size):
+    _, parquet = _parquet()
+    for batch in parquet.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        names = [name.strip().lower() for name in batch.schema.names]
+        columns = [column.to_pylist() for column in batch.columns]
+        yield [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def book_fields(record):
+    """(title, author, year, copies) of a record from read_books().
+
+    Raises ValueError saying what is wrong with it: a missing field, or
+    copies that aren't a whole number of at least one.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("not a record")
+    fields = []
+    for name in ('title', 'author', 'year'):
+        value = record.get(name)
+        value = '' if value is None else str(value).strip()
+        if not value:
+            raise ValueError(f"no {name}")
+        fields.append(value)
+    copies = record.get('copies')
+    if copies is None or copies == '':
+        copies = 1
+    else:
+        try:
+            copies = int(str(copies).strip())
+        except ValueError:
+            raise ValueError(f"copies is {copies!r}, not a whole number") from None
+        if copies < 1:
+            raise ValueError("copies is less than one")
+    return (*fields, copies)
+
+
+class BookKeys:
+    """Hash index from a book's (title, author, year) to its id, for finding duplicates.
+
+    Only a hash of the three fields is kept per book, not the text, so the
+    index of a million books takes a fraction of the memory of the books'
+    own fields. fields(book_id) gives a book's stripped (title, author, year),
+    to tell a real match from two books whose fields happen to hash alike.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.ids = {}       # hash of (title, author, year) -> book id
+        self.shared = {}    # (title, author, year) -> book id, for books whose hash another book has
+
+    @classmethod
+    def of(cls, table, fields):
+        """The index of every book in table, a RecordTable with Title, Author and Year columns."""
+        keys = cls(fields)
+        titles, authors, years = (table.data[column] for column in ('Title', 'Author', 'Year'))
+        ids = keys.ids
+        for book_id, slot in enumerate(table.slot_of):
+            if slot >= 0:
+                key = (titles[slot].strip(), authors[slot].strip(), years[slot].strip())
+                if ids.setdefault(hash(key), book_id) != book_id:
+                    keys.shared.setdefault(key, book_id)
+        return keys
+
+    def find(self, key):
+        """The id of the book with key as its stripped (title, author, year), or None."""
+        book_id = self.ids.get(hash(key))
+        if book_id is None or self.fields(book_id) == key:
+            return book_id
+        return self.shared.get(key)
+
+    def add(self, key, book_id):
+        """Index a book that find() didn't find."""
+        if self.ids.setdefault(hash(key), book_id) != book_id:
+            self.shared[key] = book_id
+
+
+class StagedBooks:
+    """New books read from a file, held until they are saved, with ids from first_id on.
+
+    Titles, authors and years go into compact columns (see columns.py) as
+    they are read, so a big import costs about what the same books will
+    cost in the catalog, not what their rows of strings would.
+    """
+
+    def __init__(self, first_id):
+        self.first_id = first_id
+        self.titles = TextColumn()
+        self.authors = CategoryColumn()
+        self.years = CategoryColumn()
+        self.copies = array('i')
+
+    def __len__(self):
+        return len(self.copies)
+
+    def add(self, title, author, year, copies):
+        """Stage a book and return its id."""
+        self.titles.append(title)
+        self.authors.append(author)
+        self.years.append(year)
+        self.copies.append(copies)
+        return self.first_id + len(self.copies) - 1
+
+    def add_copies(self, book_id, copies):
+        self.copies[book_id - self.first_id] += copies
+
+    def fields(self, book_id):
+        """The book's (title, author, year)."""
+        position = book_id - self.first_id
+        return self.titles[position], self.authors[position], self.years[position]
+
+    def rows(self):
+        """The books as catalog rows, with all their copies on the shelf."""
+        for book_id, title, author, year, copies in zip(range(self.first_id, self.first_id + len(self)), self.titles,
+                                                         self.authors, self.years, self.copies):
+            copies = str(copies)
+            yield [str(book_id), title, author, year, copies, copies]
+
+
+def write_books(path, rows, chunk_size=CHUNK, progress=None):
+    """Write rows, [title, author, year, copies, available] lists, to a catalog file at path.
+
+    The file is written under a temporary name and renamed into place, so
+    an export that fails leaves any earlier file alone. progress(rows
+    written) is called after every chunk.
+    """
+    form = file_format(path)
+    tmp_path = path + '.tmp'
+    rows = iter(rows)
+    chunks = iter(lambda: list(islice(rows, chunk_size)), [])
+    written = 0
+    try:
+        if form == 'parquet':
+            pyarrow, parquet = _parquet()
+            schema = pyarrow.schema([('Title', pyarrow.string()), ('Author', pyarrow.string()),
+                                     ('Year', pyarrow.string()), ('Copies', pyarrow.int64()),
+                                     ('Available', pyarrow.int64())])
+            with parquet.ParquetWriter(tmp_path, schema) as writer:
+                for chunk in chunks:
+                    writer.write_table(pyarrow.Table.from_pylist(
+                        [dict(zip(EXPORT_COLUMNS, row)) for row in chunk], schema=schema))
+                    written += len(chunk)
+                    if progress is not None:
+                        progress(written)
+        else:
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as file:
+                if form == 'csv':
+                    writer = csv.writer(file)
+                    writer.writerow(EXPORT_COLUMNS)
+                    write = writer.writerows
+                else:
+                    def write(chunk):
+                        file.writelines(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n' for row in chunk)
+                for chunk in chunks:
+                    write(chunk)
+                    written += len(chunk)
+                    if progress is not None:
+                        progress(written)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return written
@@ -0,0 +1,128 @@
+"""Import Catalog... and Export Catalog... for the Books tab of lib.py and libBERT.py.
+
+An import reads the file a chunk at a time behind a progress dialog and
+saves the catalog in one write (see Library.import_books), after which the
+window shows the catalog again once. The imported books are then indexed
+for search a batch at a time between events, with the progress shown next
+to the buttons. See catalog_files.py for the formats.
+"""
+from PyQt5.QtCore import QTimer, Qt, pyqtSignal
+from PyQt5.QtWidgets import QFileDialog, QHBoxLayout, QLabel, QMessageBox, QProgressDialog, QPushButton, QWidget
+
+from catalog_files import FILE_FILTER, read_books, write_books
+from repository import ConflictError
+
+INDEX_BATCH = 2000      # imported books indexed between events
+INVALID_SHOWN = 10      # skipped records listed after an import
+
+
+class Cancelled(Exception):
+    """Raised from a progress callback when the progress dialog's Cancel is pressed."""
+
+
+class CatalogButtons(QWidget):
+    """The import and export buttons, and the search indexing after an import."""
+    # True while an import or export runs; the window mustn't change the
+    # catalog meanwhile, e.g. with changes from other desks
+    busy = pyqtSignal(bool)
+    imported = pyqtSignal()     # the catalog changed; show it again
+    indexed = pyqtSignal()      # searches find every imported book now
+
+    def __init__(self, library, parent=None):
+        super().__init__(parent)
+        self.library = library
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.import_button = QPushButton("Import Catalog...")
+        self.import_button.clicked.connect(self.import_catalog)
+        self.export_button = QPushButton("Export Catalog...")
+        self.export_button.clicked.connect(self.export_catalog)
+        self.status = QLabel()
+        layout.addWidget(self.import_button)
+        layout.addWidget(self.export_button)
+        layout.addWidget(self.status, 1)
+        self.setLayout(layout)
+
+        self.index_timer = QTimer(self)
+        self.index_timer.timeout.connect(self.index_batch)
+
+    def _progress(self, title, maximum=0):
+        # maximum 0 shows a busy bar, for files whose record count isn't known up front
+        dialog = QProgressDialog(title, "Cancel", 0, maximum, self)
+        dialog.setWindowTitle(title)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(0)
+
+        def progress(done):
+            # setValue lets the dialog process events, Cancel included
+            dialog.setLabelText(f"{title} {done} records so far")
+            dialog.setValue(min(done, maximum))
+            if dialog.wasCanceled():
+                raise Cancelled()
+        return dialog, progress
+
+    def import_catalog(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import Catalog", "", FILE_FILTER)
+        if not path:
+            return
+        dialog, progress = self._progress("Importing...")
+        self.busy.emit(True)
+        try:
+            added, copied, invalid = self.library.import_books(read_books(path), progress)
+        except Cancelled:
+            # Nothing is saved until the whole file has been read
+            return
+        except ConflictError:
+            QMessageBox.warning(self, "Import Failed",
+                                "The catalog was changed at another desk during the import, so nothing was "
+                                "imported. The list now shows what is stored; please import again.")
+            self.imported.emit()
+            return
+        except (ValueError, OSError, ImportError, UnicodeDecodeError) as error:
+            QMessageBox.warning(self, "Import Failed", str(error))
+            return
+        finally:
+            dialog.close()
+            self.busy.emit(False)
+
+        self.imported.emit()
+        self.index_timer.start(0)
+        lines = [f"{added} books added, {copied} copies added to books already in the catalog."]
+        if invalid:
+            lines.append(f"{len(invalid)} records skipped:")
+            lines.extend(f"  record {number}: {reason}" for number, reason in invalid[:INVALID_SHOWN])
+            if len(invalid) > INVALID_SHOWN:
+                lines.append("  ...")
+        QMessageBox.information(self, "Import Finished", "\n".join(lines))
+
+    def index_batch(self):
+        left = self.library.index_pending(INDEX_BATCH)
+        if left:
+            self.status.setText(f"Indexing imported books for search: {left} left")
+        else:
+            self.index_timer.stop()
+            self.status.setText("")
+            self.indexed.emit()
+
+    def export_catalog(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Catalog", "catalog.csv", FILE_FILTER)
+        if not path:
+            return
+        dialog, progress = self._progress("Exporting...", len(self.library.book_data))
+        self.busy.emit(True)
+        try:
+            written = write_books(path, self.library.catalog(), progress=progress)
+        except Cancelled:
+            return
+        except (ValueError, OSError, ImportError) as error:
+            QMessageBox.warning(self, "Export Failed", str(error))
+            return
+        finally:
+            dialog.close()
+            self.busy.emit(False)
+        QMessageBox.information(self, "Export Finished", f"{written} books exported.")
+
+    def stop(self):
+        """Stop indexing, e.g. before the library closes; the next start indexes the catalog afresh."""
+        self.index_timer.stop()
@@ -0,0 +1,134 @@
+import datetime
+from collections import Counter
+
+
+class LoanCounters:
+    """Running totals over the loans on record, for statistics that are shown all the time.
+
+    Library keeps them up to date as loans are made and ended, so the
+    Statistics tab can show how many books are out, to how many borrowers,
+    how long borrowers kept the books they brought back and which books are
+    lent most often without going through every loan. Books are counted by
+    every loan of them, out now or in the loan history; loan lengths come
+    from the history alone, from borrowing to the day the copy came back.
+    Fields that can't be read as ids or dates are left out, as the full
+    report (see analytics.py) leaves them out.
+    """
+
+    def __init__(self):
+        self.loans = 0                  # loans out now
+        self.ended = 0                  # loans in the history
+        self.by_book = Counter()        # book id -> loans of it, out now or ended
+        self.by_borrower = Counter()    # borrower id -> loans out now
+        self.loan_days = 0              # days from borrowing to bringing the copy back, over the dated ended loans
+        self.dated = 0                  # ended loans with both dates
+        self.changes = 0                # loans added and removed since build, for noticing a change
+
+    @classmethod
+    def build(cls, loans, history):
+        """Count the loans of the loans and history RecordTables, which have no freed slots.
+
+        Their columns' arrays are counted by NumPy, some ten times faster
+        than a Counter over them; only the few fields that aren't numbers
+        are looked at one by one.
+        """
+        counters = cls()
+        counters.loans = len(loans)
+        counters.ended = len(history)
+        _count_ids(counters.by_borrower, loans.data['Borrower ID'])
+        for table in (loans, history):
+            _count_ids(counters.by_book, table.data['Book ID'])
+        counters.loan_days, counters.dated = _total_days(history.data['Borrow Date'], history.data['Returned On'])
+        return counters
+
+    def add(self, loan):
+        self._count(loan, 1)
+
+    def remove(self, loan):
+        self._count(loan, -1)
+
+    def _count(self, loan, step):
+        # loan is a row of the loans table
+        self.loans += step
+        self.changes += 1
+        for counter, field in ((self.by_borrower, loan[0]), (self.by_book, loan[1])):
+            _step(counter, _number(field), step)
+
+    def add_ended(self, ended):
+        """Count a row of the loan history, e.g. a loan that was just returned."""
+        self.ended += 1
+        self.changes += 1
+        _step(self.by_book, _number(ended[1]), 1)
+        borrowed, returned = _day(ended[2]), _day(ended[4])
+        if borrowed is not None and returned is not None:
+            self.loan_days += returned - borrowed
+            self.dated += 1
+
+    def borrowers(self):
+        """How many borrowers have a book out."""
+        return len(self.by_borrower)
+
+    def average_days(self):
+        """Average days from borrowing a book to bringing it back, or None before any dated loan has ended."""
+        return self.loan_days / self.dated if self.dated else None
+
+    def most_borrowed(self, count):
+        """(book id, loans) of the count books lent most often."""
+        return self.by_book.most_common(count)
+
+
+def _step(counter, key, step):
+    if key is not None:
+        counter[key] += step
+        if counter[key] <= 0:
+            del counter[key]
+
+
+def _count_ids(counter, column):
+    # Add the ids in an IntColumn to counter
+    # Imported here so that scripts which never count loans don't pay for NumPy
+    import numpy as np
+    # Those slots hold 0 in the array
+    counted = np.ones(len(column.numbers), dtype=bool)
+    counted[list(column.odd)] = False
+    # Indexing copies, so no view that would keep the column from growing
+    # outlives the line
+    numbers = np.frombuffer(column.numbers, dtype=np.int32)[counted]
+    ids = numbers[numbers >= 0]
+    loans = np.bincount(ids) if len(ids) else np.zeros(0, dtype=np.int64)
+    present = np.flatnonzero(loans)
+    counter.update(dict(zip(present.tolist(), loans[present].tolist())))
+    # bincount only counts from 0
+    counter.update(numbers[numbers < 0].tolist())
+
+
+def _total_days(start, end):
+    # Days from start to end summed over the slots where both DateColumns
+    # hold a date, and how many slots those are
+    import numpy as np
+    dated = np.ones(len(start.numbers), dtype=bool)
+    dated[list(set(start.odd) | set(end.odd))] = False
+    days = (np.frombuffer(end.numbers, dtype=np.int32)[dated].astype(np.int64)
+            - np.frombuffer(start.numbers, dtype=np.int32)[dated])
+    return int(days.sum()), int(dated.sum())
+
+
+def _number(field):
+    # The field as a number only where IntColumn holds it as one, so a loan
+    # counts the same whether it was added on its own or with the whole table
+    text = field.lstrip(' ')
+    try:
+        number = int(text)
+    except ValueError:
+        return None
+    return number if str(number) == text else None
+
+
+def _day(field):
+    # Likewise for DateColumn
+    text = field.lstrip(' ')
+    try:
+        day = datetime.date.fromisoformat(text)
+    except ValueError:
+        return None
+    return day.toordinal() if day.isoformat() == text else None
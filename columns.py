@@ -0,0 +1,278 @@
+"""Compact column types for RecordTable.
+
+A plain list keeps a full Python string per field, which costs 50 to 100
+bytes whatever the text. These columns hold the same values in arrays:
+
+    TextColumn      UTF-8 bytes in one buffer, for mostly unique text (titles)
+    CategoryColumn  an int code per field into a list of distinct values (authors)
+    IntColumn       int32 numbers (ids)
+    YearColumn      int16 numbers
+    DateColumn      int32 day numbers of ISO dates
+
+All of them give back exactly the text they were given, since storage
+matches rows by their text. Leading spaces, which the ', ' separated files
+leave on every field but the first, are kept as a one-byte count, and text
+that isn't a canonical number or date is kept as is in a small dict of odd
+values. Like a list, they are indexed by slot, grow with append and take
+None for a freed slot.
+"""
+import datetime
+from array import array
+from itertools import accumulate, islice
+
+# extend() converts values in chunks of this many, so a bulk load never holds
+# more than a chunk of the source strings at once
+CHUNK = 65536
+
+
+class TextColumn:
+    """Strings stored back to back as UTF-8 in one bytearray."""
+
+    def __init__(self, values=()):
+        self.buffer = bytearray()
+        self.starts = array('q')
+        self.lengths = array('i')   # -1 for None
+        self.extend(values)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self.starts)))
+
+    def __getitem__(self, slot):
+        length = self.lengths[slot]
+        if length < 0:
+            return None
+        start = self.starts[slot]
+        return self.buffer[start:start + length].decode()
+
+    def append(self, value):
+        self.starts.append(len(self.buffer))
+        self.lengths.append(-1)
+        self[len(self.starts) - 1] = value
+
+    def extend(self, values):
+        for chunk in _chunks(values):
+            encoded = [value.encode() for value in chunk]
+            lengths = array('i', map(len, encoded))
+            self.starts.extend(accumulate(lengths[:-1], initial=len(self.buffer)))
+            self.lengths.extend(lengths)
+            self._add(b''.join(encoded))
+
+    def _add(self, data):
+        # Put data at the end of the buffer and return where it starts
+        if not isinstance(self.buffer, bytearray):
+            # The map of a snapshot's text (see table_snapshot.py) can't grow,
+            # so the first new field copies it into memory
+            self.buffer = bytearray(self.buffer)
+        start = len(self.buffer)
+        self.buffer += data
+        return start
+
+    def __setitem__(self, slot, value):
+        if value is None:
+            self.lengths[slot] = -1
+            return
+        data = value.encode()
+        if len(data) > max(self.lengths[slot], 0):
+            # Doesn't fit where the old value was; the old bytes stay unused
+            # until the table is next loaded
+            self.starts[slot] = self._add(data)
+        else:
+            start = self.starts[slot]
+            self.buffer[start:start + len(data)] = data
+        self.lengths[slot] = len(data)
+
+
+class CategoryColumn:
+    """Dictionary encoding: each distinct value is stored once and fields hold its code."""
+
+    def __init__(self, values=()):
+        self.codes = array('i')     # -1 for None
+        self.categories = []
+        self.index = {}             # value -> code
+        self.extend(values)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self.codes)))
+
+    def __getitem__(self, slot):
+        code = self.codes[slot]
+        return None if code < 0 else self.categories[code]
+
+    def _code(self, value):
+        if value is None:
+            return -1
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def append(self, value):
+        self.codes.append(self._code(value))
+
+    def extend(self, values):
+        index = self.index
+        for chunk in _chunks(values):
+            # Only the distinct new values go through Python code
+            new = [value for value in dict.fromkeys(chunk) if value not in index]
+            index.update(zip(new, range(len(self.categories), len(self.categories) + len(new))))
+            self.categories.extend(new)
+            self.codes.extend(map(index.__getitem__, chunk))
+
+    def __setitem__(self, slot, value):
+        self.codes[slot] = self._code(value)
+
+
+class IntColumn:
+    """Whole numbers in an array, with their leading spaces and any odd text on the side.
+
+    numbers holds 0 for odd slots, so check odd (slot -> text, or None for
+    a freed slot) before using it directly.
+    """
+    typecode = 'i'
+    decimal = True      # fields are written in decimal, so int() can read a whole chunk
+
+    def __init__(self, values=()):
+        self.numbers = array(self.typecode)
+        self.pads = bytearray()     # leading spaces of each field
+        self.odd = {}
+        self.extend(values)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self.numbers)))
+
+    def parse(self, text):
+        """The number text stands for, or None unless format() gives text back."""
+        try:
+            number = int(text)
+        except ValueError:
+            return None
+        return number if str(number) == text else None
+
+    def format(self, number):
+        return str(number)
+
+    def __getitem__(self, slot):
+        if slot in self.odd:
+            return self.odd[slot]
+        return ' ' * self.pads[slot] + self.format(self.numbers[slot])
+
+    def number(self, slot):
+        """The field as a number, or None if it isn't one."""
+        return None if slot in self.odd else self.numbers[slot]
+
+    def append(self, value):
+        self.numbers.append(0)
+        self.pads.append(0)
+        self[len(self.numbers) - 1] = value
+
+    def extend(self, values):
+        for chunk in _chunks(values):
+            if self.decimal:
+                # Usually every value is a plain number, like the ids of loans
+                try:
+                    numbers = array(self.typecode, map(int, chunk))
+                except (ValueError, TypeError, OverflowError):
+                    pass
+                else:
+                    if list(map(str, numbers)) == chunk:
+                        self.numbers.extend(numbers)
+                        self.pads.extend(bytes(len(chunk)))
+                        continue
+            self._extend(chunk)
+
+    def _extend(self, values):
+        first = len(self.numbers)
+        self.numbers.extend([0] * len(values))
+        self.pads.extend(bytes(len(values)))
+        # Convert each distinct value once, in the first new slot, then copy
+        # the results into place
+        numbers, pads, odd = {}, {}, set()
+        for value in set(values):
+            self[first] = value
+            numbers[value], pads[value] = self.numbers[first], self.pads[first]
+            if self.odd.pop(first, _NUMBER) is not _NUMBER:
+                odd.add(value)
+        self.numbers[first:] = array(self.typecode, map(numbers.__getitem__, values))
+        self.pads[first:] = bytes(map(pads.__getitem__, values))
+        if odd:
+            for slot, value in enumerate(values, first):
+                if value in odd:
+                    self.odd[slot] = value
+
+    def __setitem__(self, slot, value):
+        if value is not None:
+            text = value.lstrip(' ')
+            number = self.parse(text)
+            pad = len(value) - len(text)
+            if number is not None and pad < 256:
+                try:
+                    self.numbers[slot] = number
+                except OverflowError:
+                    pass
+                else:
+                    self.pads[slot] = pad
+                    self.odd.pop(slot, None)
+                    return
+        self.numbers[slot] = 0
+        self.odd[slot] = value
+
+
+# Marks a value that was a number, since None is a valid odd value
+_NUMBER = object()
+
+
+class YearColumn(IntColumn):
+    typecode = 'h'
+
+
+class DateColumn(IntColumn):
+    """ISO dates ('2024-10-05') as proleptic ordinal day numbers."""
+    decimal = False
+
+    def __init__(self, values=()):
+        # Loans share a few hundred distinct dates, so convert each only once
+        self._days = {}     # text -> day number or None
+        self._texts = {}    # day number -> text
+        super().__init__(values)
+
+    def parse(self, text):
+        if text in self._days:
+            return self._days[text]
+        try:
+            day = datetime.date.fromisoformat(text)
+        except ValueError:
+            number = None
+        else:
+            number = day.toordinal() if day.isoformat() == text else None
+        if len(self._days) < 100000:
+            self._days[text] = number
+        return number
+
+    def format(self, number):
+        text = self._texts.get(number)
+        if text is None:
+            text = self._texts[number] = datetime.date.fromordinal(number).isoformat()
+        return text
+
+    def days(self):
+        """The day number of every slot, None where the field isn't a date."""
+        days = list(self.numbers)
+        for slot in self.odd:
+            days[slot] = None
+        return days
+
+
+def _chunks(values):
+    values = iter(values)
+    while chunk := list(islice(values, CHUNK)):
+        yield chunk
@@ -0,0 +1,117 @@
+import datetime
+from bisect import bisect_left, bisect_right, insort
+
+# A key packs the return day and the loan id into one int, so keys are unique
+# and sort by day first
+ID_BITS = 32
+ID_MASK = (1 << ID_BITS) - 1
+
+
+def day_number(date_text):
+    """'2024-10-05' -> proleptic ordinal day, or None if it isn't a date."""
+    try:
+        return datetime.date.fromisoformat(date_text.strip()).toordinal()
+    except (ValueError, AttributeError):
+        return None
+
+
+def today_number():
+    return datetime.date.today().toordinal()
+
+
+class DueIndex:
+    """Loans ordered by return date, overall and per borrower.
+
+    Return dates are kept as day numbers in a sorted list of
+    packed (day, loan id) keys, so the loans due before, on or between any
+    days are found with a binary search. The per-borrower lists are built from
+    it the first time a borrower is asked for; borrowers can be any hashable
+    key. Loans whose return date can't be parsed are kept aside in undated.
+    """
+
+    def __init__(self):
+        self.keys = []          # sorted keys of every dated loan
+        self.days = {}          # loan id -> day number
+        self.borrowers = {}     # loan id -> borrower
+        self.undated = set()
+        self._by_borrower = None  # borrower -> sorted keys of their loans
+
+    @classmethod
+    def build(cls, loan_ids, borrowers, return_days):
+        """Index loans given as three parallel sequences.
+
+        return_days are day numbers, None for a return date that isn't one,
+        as DateColumn.days() gives them.
+        """
+        index = cls()
+        index.days = dict(zip(loan_ids, return_days))
+        index.borrowers = dict(zip(loan_ids, borrowers))
+        if None in index.days.values():
+            index.undated = {loan_id for loan_id, day in index.days.items() if day is None}
+            for loan_id in index.undated:
+                del index.days[loan_id]
+        # One sort of plain ints, instead of an insort per loan
+        index.keys = sorted([(day << ID_BITS) | loan_id for loan_id, day in index.days.items()])
+        return index
+
+    def __len__(self):
+        return len(self.days) + len(self.undated)
+
+    def _borrower_keys(self):
+        if self._by_borrower is None:
+            by_borrower = {}
+            borrowers = self.borrowers
+            # keys are already sorted, so every borrower's list comes out sorted
+            for key in self.keys:
+                by_borrower.setdefault(borrowers[key & ID_MASK], []).append(key)
+            self._by_borrower = by_borrower
+        return self._by_borrower
+
+    def add(self, loan_id, borrower, return_date):
+        self.borrowers[loan_id] = borrower
+        day = day_number(return_date)
+        if day is None:
+            self.undated.add(loan_id)
+            return
+        key = (day << ID_BITS) | loan_id
+        self.days[loan_id] = day
+        insort(self.keys, key)
+        if self._by_borrower is not None:
+            insort(self._by_borrower.setdefault(borrower, []), key)
+
+    def remove(self, loan_id):
+        borrower = self.borrowers.pop(loan_id)
+        if loan_id in self.undated:
+            self.undated.discard(loan_id)
+            return
+        key = (self.days.pop(loan_id) << ID_BITS) | loan_id
+        del self.keys[bisect_left(self.keys, key)]
+        if self._by_borrower is not None:
+            keys = self._by_borrower[borrower]
+            del keys[bisect_left(keys, key)]
+            if not keys:
+                del self._by_borrower[borrower]
+
+    def due_day(self, loan_id):
+        return self.days.get(loan_id)
+
+    def between(self, first, last):
+        """Ids of the loans due from day first through day last, earliest first."""
+        start = bisect_left(self.keys, first << ID_BITS)
+        end = bisect_right(self.keys, (last << ID_BITS) | ID_MASK)
+        return [key & ID_MASK for key in self.keys[start:end]]
+
+    def overdue(self, today=None):
+        """Ids of the loans due before today, most overdue first."""
+        today = today_number() if today is None else today
+        end = bisect_left(self.keys, today << ID_BITS)
+        return [key & ID_MASK for key in self.keys[:end]]
+
+    def due_within(self, days, today=None):
+        """Ids of the loans due from today through days from now."""
+        today = today_number() if today is None else today
+        return self.between(today, today + days)
+
+    def outstanding(self, borrower):
+        """Ids of the dated loans of borrower, earliest due first."""
+        return [key & ID_MASK for key in self._borrower_keys().get(borrower, ())]
@@ -0,0 +1,131 @@
+"""Typo-tolerant lookup of the words in the catalog.
+
+SearchIndex finds books with the query in them exactly as typed, so a
+misspelt name ("Fitzgerlad", "Dostoyevsky" for "Dostoevsky") finds nothing.
+Vocabulary holds every distinct word SearchIndex has indexed and finds the
+ones within a few typos of a query word, without comparing the query to all
+of them: each word is split into bigrams, padded at both ends, and only the
+words sharing enough bigrams with the query word, in about the same places,
+are compared by edit distance.
+
+An edit (a letter inserted, deleted or replaced, or two neighbouring
+letters swapped) changes at most three of a word's bigrams and moves the
+ones after it by at most one place. So a word within k edits of the query
+word has at least len(bigrams) - 3k of its bigrams, each no more than k
+places from where the query word has it.
+"""
+from collections import Counter
+from itertools import chain, compress
+
+PAD = '\0'
+
+
+def max_edits(word):
+    """How many typos a query word may have: none in short words, where one would be guesswork."""
+    if len(word) <= 3:
+        return 0
+    return 1 if len(word) <= 8 else 2
+
+
+def _bigrams(word):
+    word = PAD + word + PAD
+    return [word[i:i + 2] for i in range(len(word) - 1)]
+
+
+def _letter_masks(word):
+    # Bit i of masks[letter] is set where word[i] is letter
+    masks = {}
+    for i, letter in enumerate(word):
+        masks[letter] = masks.get(letter, 0) | 1 << i
+    return masks
+
+
+def _distance(masks, length, other):
+    # Hyyro's bit-parallel edit distance with swaps: one column of the edit
+    # table per letter of other, all of the query word's rows at once in the
+    # bits of a Python int. Some ten times faster than filling the table.
+    # positive and negative mark the rows whose value is one more or one less
+    # than the row above's, up and down the same against the column before.
+    if not length:
+        return len(other)
+    positive, negative, diagonal, before = -1, 0, 0, 0
+    top = 1 << (length - 1)
+    edits = length
+    for letter in other:
+        match = masks.get(letter, 0)
+        swapped = ((~diagonal & match) << 1) & before
+        diagonal = (((match & positive) + positive) ^ positive) | match | negative | swapped
+        up = negative | ~(diagonal | positive)
+        down = diagonal & positive
+        if up & top:
+            edits += 1
+        elif down & top:
+            edits -= 1
+        up = (up << 1) | 1
+        negative = up & diagonal
+        positive = (down << 1) | ~(up | diagonal)
+        before = match
+    return edits
+
+
+def distance(a, b):
+    """Edits from a to b, counting a swap of neighbouring letters as one."""
+    return _distance(_letter_masks(a), len(a), b)
+
+
+class Vocabulary:
+    """Every distinct word with a letter in it, indexed by bigram for similar() lookups.
+
+    Words are only ever added. One that no book uses any more stays behind
+    and is simply matched to no books.
+    """
+
+    def __init__(self):
+        self.words = []     # word id -> word
+        self.ids = {}       # word -> word id
+        self.bigrams = {}   # (place, bigram) -> ids of the words with that bigram in that place
+
+    def __len__(self):
+        return len(self.words)
+
+    def add(self, word):
+        if word in self.ids or word.isdigit():
+            return
+        word_id = len(self.words)
+        self.words.append(word)
+        self.ids[word] = word_id
+        for place, bigram in enumerate(_bigrams(word)):
+            self.bigrams.setdefault((place, bigram), []).append(word_id)
+
+    def similar(self, word):
+        """(word, similarity) for each known word within max_edits(word) of word, closest first.
+
+        similarity is 1 for the word itself and less the more edits apart
+        the two are. Safe to call while another thread adds words.
+        """
+        limit = max_edits(word)
+        if not limit:
+            return [(word, 1.0)] if word in self.ids else []
+        grams = _bigrams(word)
+        needed = len(grams) - 3 * limit
+        # Counting in C: how many of word's bigrams each known word has near
+        # the same place. A word with a bigram twice may be counted more than
+        # it should, which only lets through a few more to check.
+        bigrams = self.bigrams
+        shared = Counter(chain.from_iterable(
+            bigrams.get((near, gram), ())
+            for place, gram in enumerate(grams)
+            for near in range(place - limit, place + limit + 1)))
+        # Most share a bigram or two; those are passed over in C as well
+        candidates = compress(shared.keys(), map(needed.__le__, shared.values()))
+        masks, length = _letter_masks(word), len(word)
+        words = self.words
+        found = []
+        for word_id in candidates:
+            other = words[word_id]
+            if abs(len(other) - length) <= limit:
+                edits = _distance(masks, length, other)
+                if edits <= limit:
+                    found.append((other, 1 - edits / max(length, len(other))))
+        found.sort(key=lambda match: -match[1])
+        return found
@@ -0,0 +1,302 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (Windows): only one instance may use the files at a time
+    fcntl = None
+
+SYNC_EVERY = 64        # fsync after this many unsynced records...
+SYNC_INTERVAL = 1.0    # ...or once this many seconds have passed since the last fsync
+
+
+class Journal:
+    """Append-only log of changes to the library's text files.
+
+    Every mutation is appended as one JSON line instead of rewriting
+    books.txt/borrowers.txt. Appends are fsynced in batches; compaction writes
+    fresh snapshot files and truncates the log, and on startup the records
+    that are newer than each snapshot are replayed on top of it.
+
+    Each snapshot is written to a temporary file first and its signature is
+    recorded in a checkpoint file before the rename, so after a crash at any
+    point we can tell whether a snapshot already contains the journaled
+    records or still needs them replayed.
+
+    Several instances may share the files. Whoever holds lock() may write,
+    and catch_up() reads what the others appended since this one last looked.
+    A change that spans tables is appended as a single line, so a crash
+    can't leave half of it behind.
+    """
+
+    def __init__(self, path, sync_every=SYNC_EVERY, sync_interval=SYNC_INTERVAL):
+        self.path = path
+        self.checkpoint_path = path + '.ckpt'
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._lock_file = open(path + '.lock', 'a')
+        self._locks = 0
+        self._caught_up = False     # nobody else can append until the lock is released
+        with self.lock():
+            self._reread()
+        self.foreign = []       # records other instances appended, see catch_up()
+        self.stale = False
+        self._file = open(self.path, 'a')
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._batching = False
+
+    def _reread(self):
+        self.checkpoint = self._read_checkpoint()
+        self.records, self._offset, self._torn = self._read_records(0)
+        self.seq = max([record['seq'] for record in self.records] +
+                       [entry['seq'] for entry in self.checkpoint.values()] + [0])
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _read_records(self, offset):
+        """The records in the journal from byte offset on.
+
+        Returns them with the offset just past the last complete line and
+        whether a partial line follows it.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0, False
+        end = data.rfind(b'\n') + 1
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A write torn by a crash; whoever appended next ended the line
+                continue
+            if 'ops' in record:
+                # One line for a change to several tables
+                records.extend(dict(op, seq=record['seq']) for op in record['ops'])
+            else:
+                records.append(record)
+        return records, offset + end, end < len(data)
+
+    def acquire(self):
+        """Take the lock on the files, waiting for other instances; calls nest."""
+        if self._locks == 0 and fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self._locks += 1
+
+    def release(self):
+        self._locks -= 1
+        if self._locks == 0:
+            self._caught_up = False
+            if fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def lock(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def catch_up(self):
+        """Read the records other instances appended since we last looked; hold the lock.
+
+        They are added to foreign until take_foreign() collects them. If
+        another instance compacted the journal meanwhile, the records it
+        folded into the files can't be told apart any more: the journal is
+        read again from scratch and stale is set, meaning whoever keeps the
+        tables in memory has to load them again.
+        """
+        if self._caught_up:
+            return
+        self._caught_up = True
+        # Every compaction writes a checkpoint with the latest seq. Its
+        # contents tell, where the file's size and mtime could be the same
+        # after two quick compactions.
+        if self._read_checkpoint() != self.checkpoint or os.path.getsize(self.path) < self._offset:
+            self._reread()
+            self.foreign = []
+            self.stale = True
+            return
+        records, self._offset, self._torn = self._read_records(self._offset)
+        if records:
+            self.seq = max(self.seq, records[-1]['seq'])
+            self.records.extend(records)
+            self.foreign.extend(records)
+
+    def take_foreign(self):
+        """The records caught up since the last call, or None if the tables must be loaded again."""
+        with self.lock():
+            self.catch_up()
+            foreign = None if self.stale else self.foreign
+            self.foreign = []
+            self.stale = False
+        return foreign
+
+    def pending(self, table, snapshot_path):
+        """Records for table that are not yet part of the snapshot at snapshot_path."""
+        entry = self.checkpoint.get(table)
+        applied = 0
+        if entry is not None and _signature(snapshot_path) == tuple(entry['signature']):
+            applied = entry['seq']
+        return [record for record in self.records if record['table'] == table and record['seq'] > applied]
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, table, op, row, new=None):
+        """Log one change: op is 'insert', 'delete' or 'update' (row -> new)."""
+        self.append_many([(table, op, row, new)])
+
+    def append_many(self, changes):
+        """Log (table, op, row, new) changes as one line, which is replayed whole or not at all."""
+        with self.lock():
+            self.catch_up()
+            self.seq += 1
+            records = []
+            for table, op, row, new in changes:
+                record = {'seq': self.seq, 'table': table, 'op': op, 'row': list(row)}
+                if new is not None:
+                    record['new'] = list(new)
+                records.append(record)
+            if len(records) == 1:
+                line = json.dumps(records[0])
+            else:
+                line = json.dumps({'seq': self.seq, 'ops': [{key: value for key, value in record.items() if key != 'seq'}
+                                                            for record in records]})
+            if self._torn:
+                self._file.write('\n')
+                self._torn = False
+            self._file.write(line + '\n')
+            self.records.extend(records)
+            self._unsynced += 1
+            if not self._batching:
+                self._flush()
+
+    @contextmanager
+    def batch(self):
+        """Append the records logged inside with one write (and at most one fsync).
+
+        Holds the lock throughout, so nothing can be appended in between.
+        """
+        with self.lock():
+            self._batching = True
+            try:
+                yield
+            finally:
+                self._batching = False
+                self._flush()
+
+    def _flush(self):
+        if self._file.closed:
+            return
+        self._file.flush()
+        if self._caught_up:
+            # Everything before our writes has been read and nobody else can
+            # append while we hold the lock, so the end of the file is ours.
+            # Without a catch_up() we wrote nothing and others may have.
+            self._offset = os.fstat(self._file.fileno()).st_size
+        if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def write_snapshot(self, table, path, lines):
+        """Atomically replace the snapshot of table at path with lines; hold the lock."""
+        tmp_path = path + '.tmp'
+        # newline='': line breaks inside quoted fields are written as they are
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        # os.replace keeps the size and mtime, so the signature survives the rename
+        # A list, as it reads back from the file, so catch_up() can compare
+        self.checkpoint[table] = {'seq': self.seq, 'signature': list(_signature(tmp_path))}
+        self._write_checkpoint()
+        os.replace(tmp_path, path)
+
+    def _write_checkpoint(self):
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def truncate(self):
+        """Drop every record; call once all tables have fresh snapshots."""
+        self._file.close()
+        with open(self.path, 'w') as f:
+            os.fsync(f.fileno())
+        # Append mode again, so writes land after whatever others append next
+        self._file = open(self.path, 'a')
+        self.records = []
+        self._offset = 0
+        self._torn = False
+        self._unsynced = 0
+
+    def close(self):
+        self.sync()
+        self._file.close()
+        self._lock_file.close()
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def apply_records(rows, records):
+    """Replay journal records onto rows (a list of field lists) and return the result.
+
+    Inserts append, deletes drop the first row with the same fields and updates
+    change it in place, which is how the Library changes its tables.
+    """
+    if not records:
+        return rows
+    # Only rows that some record deletes or updates need finding again, so
+    # only those are indexed, not every row of a large table
+    targets = {tuple(record['row']) for record in records if record['op'] != 'insert'}
+    live = list(rows)
+    positions = {}
+    if targets:
+        for position, row in enumerate(live):
+            row = tuple(row)
+            if row in targets:
+                positions.setdefault(row, []).append(position)
+
+    for record in records:
+        op, row = record['op'], tuple(record['row'])
+        if op == 'insert':
+            if row in targets:
+                positions.setdefault(row, []).append(len(live))
+            live.append(list(row))
+        elif positions.get(row):
+            position = positions[row].pop(0)
+            if op == 'delete':
+                live[position] = None
+            elif op == 'update':
+                new = tuple(record['new'])
+                live[position] = list(new)
+                if new in targets:
+                    positions.setdefault(new, []).append(position)
+    return [row for row in live if row is not None]
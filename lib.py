@@ -1,25 +1,31 @@
 import sys
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, 
-                             QTableWidget, QTableWidgetItem, QMessageBox, QHBoxLayout, QTabWidget, 
+                             QTableView, QMessageBox, QHBoxLayout, QTabWidget, 
                              QTextEdit, QInputDialog, QAbstractItemView, QHeaderView, QDialog, QFormLayout, 
                              QTextBrowser)
-from PyQt5.QtCore import QDate
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import pandas as pd
-
-# Initialize the sentiment analysis pipeline with BERT
-nltk.download('vader_lexicon')
-
-BOOK_FILE = 'books.txt'
-BORROWER_FILE = 'borrowers.txt'
-REVIEW_FILE = 'reviews.txt'
+from PyQt5.QtCore import QDate, QTimer
+from library import Library, BOOK_FILE, BORROWER_FILE, HISTORY_FILE, PATRON_FILE
+from records import describe_malformed
+from live_search import LiveSearch
+from review_loader import ReviewLoader
+from review_pages import ReviewBrowser
+from statistics_tab import StatisticsTab
+from catalog_transfer import CatalogButtons
+from table_models import RecordTableModel
+from sentiment import VADER_MODEL_ID, BackgroundModel, ScoreCache, load_vader, vader_scores
+
+SENTIMENT_CACHE_FILE = 'sentiment_cache.db'
+# VADER is loaded the first time a review needs scoring, off the GUI thread
+sentiment_model = BackgroundModel(load_vader)
+SENTIMENT_BATCH_SIZE = 200  # reviews scored between progress updates
 
 class EditBookDialog(QDialog):
-    def __init__(self, book_title, parent=None):
+    def __init__(self, book_id, row, parent=None):
         super().__init__(parent)
-        self.book_title = book_title
-        self.setWindowTitle(f"Edit Book: {book_title}")
+        self.book_id = book_id
+        self.row = row
+        book = self.parent().library.book_data.record(book_id)
+        self.setWindowTitle(f"Edit Book: {book['Title']}")
         self.layout = QFormLayout()
 
         # Book Entry Fields in the dialog
@@ -28,10 +34,9 @@ class EditBookDialog(QDialog):
         self.year_input = QLineEdit()
 
         # Populate the fields with the current book data
-        book_data = self.parent().book_data[self.parent().book_data['Title'] == book_title]
-        self.title_input.setText(book_data['Title'].iloc[0])
-        self.author_input.setText(book_data['Author'].iloc[0])
-        self.year_input.setText(book_data['Year'].iloc[0])
+        self.title_input.setText(book['Title'])
+        self.author_input.setText(book['Author'])
+        self.year_input.setText(book['Year'])
 
         self.layout.addRow('Title:', self.title_input)
         self.layout.addRow('Author:', self.author_input)
@@ -59,16 +64,10 @@ class EditBookDialog(QDialog):
         year = self.year_input.text()
 
         # Update the book data
-        book_data = self.parent().book_data
-        book_data.loc[book_data['Title'] == self.book_title, 'Title'] = title
-        book_data.loc[book_data['Title'] == self.book_title, 'Author'] = author
-        book_data.loc[book_data['Title'] == self.book_title, 'Year'] = year
+        self.parent().library.edit_book(self.book_id, title, author, year)
 
-        # Save the changes to the books.txt file
-        self.parent().save_books_to_file()
-
-        # Update the book table
-        self.parent().update_book_table()
+        # Repaint the edited row
+        self.parent().book_model.refresh_row(self.row)
 
         # Close the dialog
         self.accept()
@@ -80,60 +79,36 @@ class ReviewDialog(QDialog):
         self.setWindowTitle(f"Reviews for {book_title}")
         self.layout = QVBoxLayout()
 
-        # Text area to show reviews
-        self.review_text = QTextBrowser()
-        self.layout.addWidget(self.review_text)
+        # The reviews a page at a time; only the page shown goes through VADER
+        self.browser = ReviewBrowser(self.parent().library, book_title, self.parent().score_cache,
+                                     VADER_MODEL_ID, sentiment_model, vader_scores, SENTIMENT_BATCH_SIZE,
+                                     ["Positive", "Negative", "Neutral"], self.get_sentiment_color)
+        self.browser.failed.connect(self.show_scoring_error)
+        self.layout.addWidget(self.browser)
 
         # Add "Add Review" button
         self.add_review_button = QPushButton("Add a Review")
         self.add_review_button.clicked.connect(self.add_review)
         self.layout.addWidget(self.add_review_button)
-        
-        # Load and display reviews with sentiment
-        self.load_reviews_with_sentiment(book_title)
 
         self.setLayout(self.layout)
 
-    def load_reviews_with_sentiment(self, book_title):
-        reviews = []
-        sia = SentimentIntensityAnalyzer()  # VADER sentiment analyzer
-        try:
-            with open(REVIEW_FILE, 'r') as file:
-                for line in file:
-                    title, review = map(str.strip, line.strip().split(':', 1))
-                    if title.lower() == book_title.lower():
-                        # Analyze sentiment of the review using VADER
-                        sentiment_scores = sia.polarity_scores(review)
-                        sentiment = self.get_sentiment_label(sentiment_scores['compound'])
-
-                        # Append review with sentiment
-                        sentiment_color = self.get_sentiment_color(sentiment)
-                        reviews.append(f"Review: {review}<br>Sentiment: <span style='font-weight: bold; color: {sentiment_color}'>{sentiment}</span><br><br>")
-        except FileNotFoundError:
-            reviews = ["No reviews available."]
-        
-        if reviews:
-            self.review_text.setHtml("<br>".join(reviews))
-        else:
-            self.review_text.setHtml("No reviews available.")
-
-    def get_sentiment_label(self, compound_score):
-        """Helper method to classify sentiment based on VADER's compound score."""
-        if compound_score >= 0.05:
-            return "Positive"
-        elif compound_score <= -0.05:
-            return "Negative"
-        else:
-            return "Neutral"
+    def show_scoring_error(self, message):
+        # The browser shows the reviews anyway, without the sentiment we can't compute
+        QMessageBox.warning(self, "Sentiment Unavailable", message)
+
+    def done(self, result):
+        self.browser.stop()
+        super().done(result)
 
     def get_sentiment_color(self, sentiment):
         """Helper method to get sentiment color."""
         if sentiment == "Positive":
             return "green"
-        elif sentiment == "Neutral":
-            return "gray"
-        else:
+        elif sentiment == "Negative":
             return "red"
+        else:
+            return "gray"
     
     def add_review(self):
         # Create a dialog with a QTextEdit for the review
@@ -161,12 +136,11 @@ class ReviewDialog(QDialog):
         if review_dialog.exec_() == QDialog.Accepted:
             review = self.review_input.toPlainText()
             if review:
-                # Save the review to the file
-                with open(REVIEW_FILE, 'a') as file:
-                    file.write(f"{self.book_title}:{review}\n")
+                # Save the review to storage
+                self.parent().library.add_review(self.book_title, review)
                 
-                # Reload the reviews with the new entry
-                self.load_reviews_with_sentiment(self.book_title)
+                # Go to the last page, where the new review is
+                self.browser.reload()
             else:
                 QMessageBox.warning(self, "Input Error", "Review cannot be empty.")
                 
@@ -246,19 +220,29 @@ class LibraryManagementSystem(QWidget):
         self.tabs.addTab(self.book_tab, "Books")
         self.tabs.addTab(self.borrowed_tab, "Borrowed Books")
 
+        # The catalog, loans and reviews; this window only displays and edits
+        # them. Storage is written on a thread of its own, so saving never
+        # blocks the window.
+        self.library = Library.open(background=True)
+
         # Initialize tabs
         self.init_books_tab()
         self.init_borrowed_tab()
 
         self.setLayout(self.main_layout)
 
-        # Data storage
-        self.book_data = pd.DataFrame(columns=['Title', 'Author', 'Year'])
-        self.borrowed_books = pd.DataFrame(columns=['Borrower', 'Title', 'Borrow Date', 'Return Date'])
+        self.score_cache = ScoreCache(SENTIMENT_CACHE_FILE)
+        # Statistics over the catalog, loans and reviews, with the sentiment this window's model gave
+        self.statistics_tab = StatisticsTab(self.library, self.score_cache, VADER_MODEL_ID)
+        self.tabs.addTab(self.statistics_tab, "Statistics")
+        # Every second, make sure changes are on disk and pick up the ones
+        # made at other desks sharing the same files
+        self.sync_timer = QTimer(self)
+        self.sync_timer.timeout.connect(self.refresh_library)
+        self.sync_timer.start(1000)
 
-        # Load books from file
-        self.load_books_from_file()
-        self.load_borrowers_from_file()
+        # Load books and loans from storage
+        self.load_library()
 
     def init_books_tab(self):
         layout = QVBoxLayout()
@@ -268,19 +252,23 @@ class LibraryManagementSystem(QWidget):
         self.add_book_button.clicked.connect(self.show_add_book_dialog)
 
         self.search_input = QLineEdit()
-        self.search_input.setPlaceholderText("Search by Title")
+        self.search_input.setPlaceholderText("Search by Title, Author or Year")
 
         self.search_button = QPushButton("Search")
         self.search_button.clicked.connect(self.search_book)
-
-        # Book List Table
-        self.book_table = QTableWidget()
-        self.book_table.setColumnCount(3)
+        self.search_status = QLabel()
+
+        # Book List Table: one row per title, with how many copies are on the shelf
+        self.book_model = RecordTableModel(['Title', 'Author', 'Year', 'Copies', 'Available'])
+        # Filter the table as the user types
+        self.live_search = LiveSearch(self.library, self.book_model, self.search_input, self)
+        self.live_search.status.connect(self.search_status.setText)
+        self.book_table = QTableView()
+        self.book_table.setModel(self.book_model)
         self.book_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
         self.book_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
         self.book_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
         self.book_table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.book_table.setHorizontalHeaderLabels(["Title", "Author", "Year"])
         
         # Edit Book Button
         self.edit_book_button = QPushButton("Edit Selected Book")
@@ -302,33 +290,40 @@ class LibraryManagementSystem(QWidget):
         button_layout = QHBoxLayout()
         button_layout.addWidget(self.search_input)
         button_layout.addWidget(self.search_button)
+        button_layout.addWidget(self.search_status)
         button_layout.addWidget(self.reviews_button)
         button_layout.addWidget(self.edit_book_button) 
         button_layout.addWidget(self.borrow_book_button)
         button_layout.addWidget(self.remove_book_button)
 
+        # Whole catalogs in and out of CSV, JSON Lines or Parquet files
+        self.catalog_buttons = CatalogButtons(self.library, self)
+        self.catalog_buttons.busy.connect(self.pause_sync)
+        self.catalog_buttons.imported.connect(self.live_search.search_now)
+        self.catalog_buttons.indexed.connect(self.search_imported)
+
         # Adding widgets to layout
         layout.addWidget(self.add_book_button)
+        layout.addWidget(self.catalog_buttons)
         layout.addLayout(button_layout)
         layout.addWidget(self.book_table)
 
         self.book_tab.setLayout(layout)
         
     def show_reviews(self):
-        selected_row = self.book_table.currentRow()
+        selected_row = self.book_table.currentIndex().row()
         if selected_row >= 0:
             # Fetch the title from the table instead of directly from book_data to handle filtered data
-            book_title = self.book_table.item(selected_row, 0).text()
+            book_title = self.book_model.index(selected_row, 0).data()
             dialog = ReviewDialog(book_title, self)
             dialog.exec_()
         else:
             QMessageBox.warning(self, "Selection Error", "Please select a book to see its reviews")
             
     def edit_book(self):
-        selected_row = self.book_table.currentRow()
+        selected_row = self.book_table.currentIndex().row()
         if selected_row >= 0:
-            book_title = self.book_data.iloc[selected_row]['Title']
-            dialog = EditBookDialog(book_title, self)
+            dialog = EditBookDialog(self.book_model.record_id(selected_row), selected_row, self)
             dialog.exec_()
         else:
             QMessageBox.warning(self, "Selection Error", "Please select a book to edit")
@@ -336,10 +331,11 @@ class LibraryManagementSystem(QWidget):
     def init_borrowed_tab(self):
         layout = QVBoxLayout()
 
-        self.borrowed_table = QTableWidget()
-        self.borrowed_table.setColumnCount(5)  # Update column count to 5
+        self.borrowed_model = RecordTableModel(['Borrower', 'Title', 'Author', 'Year', 'Return Date'],
+                                               value=self.library.loan_value)
+        self.borrowed_table = QTableView()
+        self.borrowed_table.setModel(self.borrowed_model)
         self.borrowed_table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.borrowed_table.setHorizontalHeaderLabels(['Borrower', 'Title', 'Author', 'Year', 'Return Date'])  
         self.borrowed_table.horizontalHeader().setStretchLastSection(True)
         
         # Return Book Button
@@ -356,17 +352,18 @@ class LibraryManagementSystem(QWidget):
         self.borrowed_tab.setLayout(layout)
 
     def show_borrowed_book_info(self):
-        selected_row = self.borrowed_table.currentRow()
+        selected_row = self.borrowed_table.currentIndex().row()
         if selected_row >= 0:
-            # Get the book details from the borrowed_books DataFrame
-            borrower = self.borrowed_books.iloc[selected_row]['Borrower']
-            borrower_email = self.borrowed_books.iloc[selected_row]['Borrower Email']
-            borrower_phone = self.borrowed_books.iloc[selected_row]['Borrower Phone']
-            title = self.borrowed_books.iloc[selected_row]['Title']
-            author = self.borrowed_books.iloc[selected_row]['Author']  # Author detail
-            year = self.borrowed_books.iloc[selected_row]['Year']      # Year detail
-            borrow_date = self.borrowed_books.iloc[selected_row]['Borrow Date']
-            return_date = self.borrowed_books.iloc[selected_row]['Return Date']
+            # Get the loan and its borrower's details
+            loan = self.library.loan_record(self.borrowed_model.record_id(selected_row))
+            borrower = loan['Borrower']
+            borrower_email = loan['Borrower Email']
+            borrower_phone = loan['Borrower Phone']
+            title = loan['Title']
+            author = loan['Author']  # Author detail
+            year = loan['Year']      # Year detail
+            borrow_date = loan['Borrow Date']
+            return_date = loan['Return Date']
 
             # Create a dialog to display the book details
             dialog = QDialog(self)
@@ -384,21 +381,61 @@ class LibraryManagementSystem(QWidget):
         else:
             QMessageBox.warning(self, "Selection Error", "Please select a borrowed book to show its info.")
         
-    def load_books_from_file(self):
-        try:
-            with open(BOOK_FILE, 'r') as f:
-                lines = f.readlines()
-
-            # Populate DataFrame with file data
-            for line in lines:
-                title, author, year = line.strip().split(',')
-                new_book = pd.DataFrame([[title, author, year]], columns=['Title', 'Author', 'Year'])
-                self.book_data = pd.concat([self.book_data, new_book], ignore_index=True)
-
-            self.update_book_table()
+    def load_library(self):
+        missing, malformed = self.library.load()
+        self.update_book_table()
+        self.update_borrowed_table()
 
-        except FileNotFoundError:
+        if 'books' in missing:
             QMessageBox.information(self, "File Error", "No book file found. Starting fresh.")
+        if 'borrowers' in missing:
+            QMessageBox.information(self, "File Error", "No borrower file found. Starting fresh.")
+        for table, path in (('books', BOOK_FILE), ('borrowers', BORROWER_FILE), ('patrons', PATRON_FILE),
+                            ('history', HISTORY_FILE)):
+            if malformed[table]:
+                QMessageBox.warning(self, "File Error", describe_malformed(path, malformed[table]))
+
+    def refresh_library(self):
+        self.library.sync()
+        changed, dropped, failure = self.library.refresh()
+        if changed:
+            # Shows the whole catalog again, or reruns the search being shown
+            self.live_search.search_now()
+            self.update_borrowed_table()
+        if failure is not None:
+            QMessageBox.critical(self, "Save Error",
+                                 f"The last change could not be saved ({failure}), so {dropped} change(s) were "
+                                 "undone. The lists now show what is stored.")
+        elif dropped:
+            QMessageBox.warning(self, "Conflict",
+                                f"{dropped} change(s) clashed with changes made at another desk and were undone. "
+                                "The lists now show what is stored.")
+
+    def pause_sync(self, paused):
+        # Changes from other desks mustn't reach the catalog during an import or export
+        if paused:
+            self.sync_timer.stop()
+        else:
+            self.sync_timer.start(1000)
+
+    def search_imported(self):
+        # A search made while imported books were being indexed may have missed some
+        if self.search_input.text():
+            self.live_search.search_now()
+
+    def closeEvent(self, event):
+        self.sync_timer.stop()
+        self.live_search.stop()
+        ReviewLoader.stop_all()
+        self.statistics_tab.stop()
+        self.catalog_buttons.stop()
+        try:
+            self.library.close()
+        except Exception as error:
+            # Raising here would abort the process before the cache is closed
+            QMessageBox.critical(self, "Save Error", f"The last changes could not be saved: {error}")
+        self.score_cache.close()
+        super().closeEvent(event)
             
     def show_add_book_dialog(self):
         dialog = AddBookDialog(self)
@@ -407,92 +444,55 @@ class LibraryManagementSystem(QWidget):
             self.add_book(title, author, year)
 
     def add_book(self, title, author, year):
-            if title and author and year:
-                # Add book to the data storage
-                new_book = pd.DataFrame([[title, author, year]], columns=['Title', 'Author', 'Year'])
-                self.book_data = pd.concat([self.book_data, new_book], ignore_index=True)
-
-                # Save to the .txt file
-                with open(BOOK_FILE, 'a') as f:
-                    f.write(f'\n{title},{author},{year}')
-
-                # Update UI Table
-                self.update_book_table()
-
-            else:
-                QMessageBox.warning(self, "Input Error", "Please fill in all fields")
+        known = self.library.find_book(title, author, year) is not None
+        try:
+            book_id = self.library.add_book(title, author, year)
+        except ValueError as error:
+            QMessageBox.warning(self, "Input Error", str(error))
+            return
+
+        if known:
+            # Another copy of a book already in the catalog
+            self.book_model.refresh()
+        else:
+            # Insert the new row into the view
+            self.book_model.append_record(book_id)
 
     def update_book_table(self):
-        self.book_table.setRowCount(len(self.book_data))
-        for row in range(len(self.book_data)):
-            self.book_table.setItem(row, 0, QTableWidgetItem(self.book_data.iloc[row]['Title']))
-            self.book_table.setItem(row, 1, QTableWidgetItem(self.book_data.iloc[row]['Author']))
-            self.book_table.setItem(row, 2, QTableWidgetItem(self.book_data.iloc[row]['Year']))
+        # Show the whole catalog; the view only reads the rows currently on screen
+        self.book_model.set_table(self.library.book_data)
 
     def remove_book(self):
-        selected_row = self.book_table.currentRow()
+        selected_row = self.book_table.currentIndex().row()
         if selected_row >= 0:
-            # Remove the selected row from the data and table
-            title_to_remove = self.book_data.iloc[selected_row]['Title']
-            self.book_data = self.book_data.drop(selected_row).reset_index(drop=True)
-            self.update_book_table()
-
-            # Remove from the .txt file
-            self.save_books_to_file()
+            # Remove a copy; the row goes once the last copy does
+            book_id = self.book_model.record_id(selected_row)
+            try:
+                self.library.remove_book(book_id)
+            except ValueError as error:
+                QMessageBox.warning(self, "Not Available", str(error))
+                return
+            if book_id in self.library.book_data:
+                self.book_model.refresh_row(selected_row)
+            else:
+                self.book_model.remove_row(selected_row)
 
             QMessageBox.information(self, "Success", "Book removed successfully!")
         else:
             QMessageBox.warning(self, "Selection Error", "Please select a book to remove")
 
-    def save_books_to_file(self):
-        with open(BOOK_FILE, 'w') as f:
-            for index, row in self.book_data.iterrows():
-                f.write(f"{row['Title']},{row['Author']},{row['Year']}\n")
-
-    def save_borrowers_to_file(self):
-        with open(BORROWER_FILE, 'w') as f:
-            for index, row in self.borrowed_books.iterrows():
-                f.write(f"{row['Borrower']},{row['Title']},{row['Author']},{row['Year']},{row['Borrow Date']},{row['Return Date']}\n")
-                
-    def load_borrowers_from_file(self):
-        try:
-            with open(BORROWER_FILE, 'r') as f:
-                lines = f.readlines()
-
-            # Populate DataFrame with file data
-            for line in lines:
-                if line.strip(): 
-                    borrower, borrower_email, borrower_phone, title, author, year, borrow_date, return_date = line.strip().split(',')
-                    new_borrow = pd.DataFrame([[borrower, borrower_email, borrower_phone, title, author, year, borrow_date, return_date]],
-                                            columns=['Borrower', 'Borrower Email', 'Borrower Phone', 'Title', 'Author', 'Year', 'Borrow Date', 'Return Date'])
-                    self.borrowed_books = pd.concat([self.borrowed_books, new_borrow], ignore_index=True)
-
-            self.update_borrowed_table()
-
-        except FileNotFoundError:
-            QMessageBox.information(self, "File Error", "No borrower file found. Starting fresh.")
-        
     def search_book(self):
-        search_query = self.search_input.text().lower()
-        if search_query:
-            # Filter the book data based on the search query
-            filtered_books = self.book_data[self.book_data['Title'].str.lower().str.contains(search_query)]
-            
-            if not filtered_books.empty:
-                self.book_table.setRowCount(len(filtered_books))
-                for row in range(len(filtered_books)):
-                    self.book_table.setItem(row, 0, QTableWidgetItem(filtered_books.iloc[row]['Title']))
-                    self.book_table.setItem(row, 1, QTableWidgetItem(filtered_books.iloc[row]['Author']))
-                    self.book_table.setItem(row, 2, QTableWidgetItem(filtered_books.iloc[row]['Year']))
-            else:
-                QMessageBox.information(self, "No Results", "No books found matching the search query")
-        else:
-            # If no search query, show the entire book list
-            self.update_book_table()
+        # Search right away instead of waiting for typing to pause
+        self.live_search.search_now()
 
     def borrow_book(self):
-        selected_row = self.book_table.currentRow()
+        selected_row = self.book_table.currentIndex().row()
         if selected_row >= 0:
+            book_id = self.book_model.record_id(selected_row)
+            if not self.library.available(book_id):
+                QMessageBox.warning(self, "Not Available", "Every copy of this book is on loan.")
+                return
+
             # Create a dialog with multiple inputs
             dialog = QDialog(self)
             dialog.setWindowTitle("Borrow Book")
@@ -526,83 +526,46 @@ class LibraryManagementSystem(QWidget):
             button_layout.addWidget(cancel_button)
             layout.addRow(button_layout)
 
-            # Show the dialog and get the inputs
+            # Show the dialog and get the inputs; Cancel lends nothing
             if dialog.exec_() == QDialog.Accepted:
                 borrower = self.borrower_input.text()
                 borrower_email = self.borrower_email_input.text()
                 borrower_phone = self.borrower_phone_input.text()
-                return_date = self.return_date_input.text()
-
-                # Get book details
-                title = self.book_data.iloc[selected_row]['Title']
-                author = self.book_data.iloc[selected_row]['Author']
-                year = self.book_data.iloc[selected_row]['Year']
+                return_date = self.return_date_input.text().strip()
 
                 # Set borrow date to current date
                 borrow_date = QDate.currentDate().toString("yyyy-MM-dd")
 
-                # Add the book to the borrowed books data
-                borrowed_book = pd.DataFrame([[borrower, title, author, year, borrow_date, return_date]],
-                                            columns=['Borrower', 'Title', 'Author', 'Year', 'Borrow Date', 'Return Date'])
-                self.borrowed_books = pd.concat([self.borrowed_books, borrowed_book], ignore_index=True)
-
-                # Remove from available books
-                self.book_data = self.book_data.drop(selected_row).reset_index(drop=True)
-                self.update_book_table()
-
-                # Save to the borrowers.txt file
-                self.save_borrowers_to_file()
-
-                # Save to the books.txt file (after removing the borrowed book)
-                self.save_books_to_file()
-
-                # Update borrowed books table
-                self.update_borrowed_table()
+                # Lend a copy; the book keeps its row with one copy fewer available
+                title = self.library.book_data.value(book_id, 'Title')
+                try:
+                    loan_id = self.library.borrow_book(book_id, borrower, borrower_email, borrower_phone,
+                                                       return_date, borrow_date)
+                except ValueError as error:
+                    QMessageBox.warning(self, "Input Error", str(error))
+                    return
+                self.book_model.refresh_row(selected_row)
+                self.borrowed_model.append_record(loan_id)
 
                 QMessageBox.information(self, "Success", f"{title} has been borrowed by {borrower}!")
-            else:
-                QMessageBox.warning(self, "Input Error", "Please fill in all fields.")
 
-    def save_borrowers_to_file(self):
-        with open(BORROWER_FILE, 'w') as f:
-            for index, row in self.borrowed_books.iterrows():
-                f.write(f"{row['Borrower']},{row['Borrower Email']},{row['Borrower Phone']},{row['Title']},{row['Author']},{row['Year']},{row['Borrow Date']},{row['Return Date']}\n")
-                
     def return_book(self):
-        selected_row = self.borrowed_table.currentRow()
+        selected_row = self.borrowed_table.currentIndex().row()
         if selected_row >= 0:
-            # Get the book details from the borrowed_books DataFrame
-            borrower = self.borrowed_books.iloc[selected_row]['Borrower']
-            borrower_email = self.borrowed_books.iloc[selected_row]['Borrower Email']
-            borrower_phone = self.borrowed_books.iloc[selected_row]['Borrower Phone']
-            title = self.borrowed_books.iloc[selected_row]['Title']
-            author = self.borrowed_books.iloc[selected_row]['Author']  # Author detail
-            year = self.borrowed_books.iloc[selected_row]['Year']      # Year detail
-
-            # Add the book back to the available books
-            returned_book = pd.DataFrame([[title, author, year]], columns=['Title', 'Author', 'Year'])
-            self.book_data = pd.concat([self.book_data, returned_book], ignore_index=True)
-            self.update_book_table()
-
-            # Remove from borrowed books
-            self.borrowed_books = self.borrowed_books.drop(selected_row).reset_index(drop=True)
-            self.update_borrowed_table()
-
-            # Save changes to the borrowers.txt file
-            self.save_borrowers_to_file()
-
-            QMessageBox.information(self, "Success", f"{title} has been returned by {borrower}!")
+            # Put the copy back on the shelf and drop the loan
+            loan_id = self.borrowed_model.record_id(selected_row)
+            loan = self.library.loan_record(loan_id)
+            self.library.return_book(loan_id)
+            self.book_model.refresh()
+            self.borrowed_model.remove_row(selected_row)
+
+            QMessageBox.information(self, "Success", f"{loan['Title']} has been returned by {loan['Borrower']}!")
         else:
             QMessageBox.warning(self, "Selection Error", "Please select a borrowed book to return.")
 
     def update_borrowed_table(self):
-        self.borrowed_table.setRowCount(len(self.borrowed_books))
-        for row in range(len(self.borrowed_books)):
-            self.borrowed_table.setItem(row, 0, QTableWidgetItem(self.borrowed_books.iloc[row]['Borrower']))
-            self.borrowed_table.setItem(row, 1, QTableWidgetItem(self.borrowed_books.iloc[row]['Title']))
-            self.borrowed_table.setItem(row, 2, QTableWidgetItem(self.borrowed_books.iloc[row]['Author']))
-            self.borrowed_table.setItem(row, 3, QTableWidgetItem(self.borrowed_books.iloc[row]['Year']))
-            self.borrowed_table.setItem(row, 4, QTableWidgetItem(self.borrowed_books.iloc[row]['Return Date']))
+        # Show every loan; the view only reads the rows currently on screen
+        self.borrowed_model.set_table(self.library.borrowed_books)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
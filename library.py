@@ -0,0 +1,842 @@
+"""Catalog, loan and review operations without any GUI.
+
+lib.py and libBERT.py are Qt windows over a Library; scripts, benchmarks and
+tests can drive one directly without a display. Nothing here imports PyQt5,
+pandas or NLTK, so importing this module stays cheap.
+"""
+import datetime
+import os
+from collections import Counter, deque
+
+from borrowers import BorrowerRegistry
+from catalog_files import BookKeys, StagedBooks, book_fields
+from circulation import LoanCounters
+from columns import CategoryColumn, DateColumn, IntColumn, TextColumn, YearColumn
+from due_index import DueIndex
+from record_table import RecordTable
+from records import gc_paused
+from repository import (BOOK_COLUMNS, BORROWER_COLUMNS, HISTORY_COLUMNS, LEGACY_BOOK_COLUMNS, LEGACY_LOAN_COLUMNS,
+                        LOAN_COLUMNS, PATRON_COLUMNS, ConflictError, open_repository)
+from search_index import SearchIndex
+from table_snapshot import load_table, save_table
+from writer import StorageWriter
+
+BOOK_FILE = 'books.txt'
+BORROWER_FILE = 'borrowers.txt'
+PATRON_FILE = 'patrons.txt'
+HISTORY_FILE = 'loan_history.txt'
+REVIEW_FILE = 'reviews.txt'
+BOOK_INDEX_FILE = 'books.idx'
+BOOK_SNAPSHOT_FILE = 'books.snap'
+BORROWER_SNAPSHOT_FILE = 'borrowers.snap'
+PATRON_SNAPSHOT_FILE = 'patrons.snap'
+HISTORY_SNAPSHOT_FILE = 'loan_history.snap'
+JOURNAL_FILE = 'library.journal'
+DATABASE_FILE = 'library.db'
+
+# 'text' keeps the .txt files above, 'sqlite' stores everything in DATABASE_FILE
+STORAGE_BACKEND = os.environ.get('LIBRARY_BACKEND', 'text')
+# Binary snapshots next to the text files (see table_snapshot.py), which start
+# the library without parsing them; LIBRARY_SNAPSHOTS=0 goes without
+SNAPSHOTS = os.environ.get('LIBRARY_SNAPSHOTS', '1') != '0'
+
+LOAN_DAYS = 14
+# Books shown when nothing contains the query, closest first
+CLOSEST_LIMIT = 20
+
+# The borrower fields of a loan, which come from the registry, and its book
+# fields, which come from the catalog
+BORROWER_FIELDS = PATRON_COLUMNS[1:]
+BOOK_FIELDS = ['Title', 'Author', 'Year']
+
+# Compact column types for the two big tables. Titles in the catalog are
+# mostly unique; loans are just ids and dates.
+BOOK_KINDS = {'Book ID': IntColumn, 'Title': TextColumn, 'Author': CategoryColumn, 'Year': YearColumn,
+              'Copies': IntColumn, 'Available': IntColumn}
+LOAN_KINDS = {'Borrower ID': IntColumn, 'Book ID': IntColumn, 'Borrow Date': DateColumn, 'Return Date': DateColumn}
+HISTORY_KINDS = {**LOAN_KINDS, 'Returned On': DateColumn}
+
+# Columns, column kinds and whether the records are stored with their ids, by
+# table. Loans aren't, so they are numbered from 0 whenever they are read.
+SNAPSHOT_TABLES = {'books': (BOOK_COLUMNS, BOOK_KINDS, True), 'borrowers': (LOAN_COLUMNS, LOAN_KINDS, False),
+                   'patrons': (PATRON_COLUMNS, None, True), 'history': (HISTORY_COLUMNS, HISTORY_KINDS, False)}
+
+
+class Library:
+    """The catalog, the books on loan and their reviews.
+
+    The catalog lives in the RecordTable book_data, one record per title
+    under the Book ID it is stored with, which the search index also uses.
+    Each record counts the library's copies of the book and how many of them
+    are on the shelf, so lending or taking back a copy only changes two
+    numbers and the record stays put. Loans live in borrowed_books (the
+    borrowers table, for historical reasons) and refer to a book by its id
+    and to a borrower in the BorrowerRegistry borrowers by id. Operations
+    take record ids, so they never have to search or copy a table. Loans are
+    also indexed by return date and borrower in due_index. A returned loan
+    moves to loan_history (the history table) with the day it came back, so
+    circulation can count every loan of a book and how long borrowers
+    really kept them, besides the loans out now.
+
+    Every change is saved to storage first, as one transaction however many
+    tables it touches, and then applied in memory. Several instances can
+    share the same files: a change that conflicts with one another instance
+    saved first raises ConflictError and changes nothing, and refresh()
+    brings in what the others saved. Callers that show a record and change it
+    later can pass the version they showed (book_data.version(book_id)) to
+    have the change refused if the record was changed in between.
+
+    With snapshot_paths (table -> path), every table is also kept in a
+    binary snapshot, from which load() takes it as long as it is stored
+    unchanged since.
+    """
+
+    def __init__(self, storage, index_path=BOOK_INDEX_FILE, snapshot_paths=None):
+        self.storage = storage
+        self.index_path = index_path
+        self.snapshot_paths = dict(snapshot_paths or {})
+        # Table -> signature of the stored table its snapshot was taken of, as far as this instance knows
+        self.snapshot_signatures = {}
+        self.book_data = None
+        self.borrowed_books = None
+        self.loan_history = None
+        self.borrowers = None
+        self.search_index = None
+        self.due_index = None
+        self.circulation = None
+        # Changes dropped by catch-ups inside other calls, and the error that
+        # kept one from being saved, for the next refresh() to report
+        self.undone = 0
+        self.failure = None
+        # Ranges of ids of imported books not in the search index yet, see index_pending()
+        self.unindexed = deque()
+        # Goes up with every change to the books on the shelf, so callers
+        # holding on to search results can tell they are out of date
+        self.catalog_version = 0
+
+    @classmethod
+    def open(cls, directory='.', backend=STORAGE_BACKEND, background=False, snapshots=SNAPSHOTS):
+        """Open the library files in directory; call load() before using it.
+
+        With background, storage is written on a thread of its own (see
+        StorageWriter), so changes return without waiting for the disk.
+        With snapshots, the text files are also kept in binary snapshots.
+        A database has none: its signature is a count of changes, which
+        starts again with a new database, so it can't tell an old snapshot.
+        """
+        def path(name):
+            return os.path.join(directory, name)
+        storage = open_repository(backend,
+                                  {'books': path(BOOK_FILE), 'borrowers': path(BORROWER_FILE),
+                                   'patrons': path(PATRON_FILE), 'history': path(HISTORY_FILE)},
+                                  {'books': BOOK_COLUMNS, 'borrowers': LOAN_COLUMNS, 'patrons': PATRON_COLUMNS,
+                                   'history': HISTORY_COLUMNS},
+                                  path(JOURNAL_FILE), path(REVIEW_FILE), path(DATABASE_FILE))
+        if background:
+            storage = StorageWriter(storage)
+        snapshot_paths = {'books': path(BOOK_SNAPSHOT_FILE), 'borrowers': path(BORROWER_SNAPSHOT_FILE),
+                          'patrons': path(PATRON_SNAPSHOT_FILE),
+                          'history': path(HISTORY_SNAPSHOT_FILE)} if snapshots and backend == 'text' else None
+        return cls(storage, path(BOOK_INDEX_FILE), snapshot_paths)
+
+    def load(self):
+        """Read every table and the search index.
+
+        Returns the tables that have nothing stored yet and the malformed
+        lines that were skipped, by table.
+        """
+        missing = [table for table in ('books', 'borrowers') if not self.storage.exists(table)]
+        # Every table as of one moment, whatever other instances are doing
+        self.storage.begin_reading()
+        try:
+            # A snapshot is only ever taken of tables in the current layout
+            books, book_errors = self._load_snapshot('books', self.book_data)
+            legacy = None
+            if books is None:
+                books, book_errors = self.storage.load('books')
+                legacy = self._legacy_tables(books, book_errors)
+            if legacy is None:
+                self.load_books(books)
+                malformed = self._load_loans()
+                # Tables that were just parsed start from a snapshot next time
+                malformed['books'] = book_errors
+                self._save_snapshots(self._signatures(), malformed)
+            else:
+                shelf, book_errors, loans, malformed = legacy
+                # Loans have only been moved to the history since the
+                # current layout, so it is empty or already in it
+                malformed['history'] = self._load_history()
+                self._upgrade_tables(shelf, loans)
+        finally:
+            self.storage.end_reading()
+        malformed['books'] = book_errors
+        return missing, malformed
+
+    def load_loans(self):
+        """Read the catalog, borrowers and loans without the search index, e.g. for reports.
+
+        Returns the malformed lines by table.
+        """
+        self.storage.begin_reading()
+        try:
+            books, book_errors = self._load_snapshot('books', self.book_data)
+            if books is None:
+                books, book_errors = self.storage.load('books')
+            self._set_books(books)
+            malformed = self._load_loans()
+        finally:
+            self.storage.end_reading()
+        malformed['books'] = book_errors
+        return malformed
+
+    def _load_loans(self):
+        patrons, patron_errors = self._load_snapshot('patrons')
+        if patrons is None:
+            patrons, patron_errors = self.storage.load('patrons')
+        rows, loan_errors = self._load_snapshot('borrowers', self.borrowed_books)
+        if rows is None:
+            rows, loan_errors = self.storage.load('borrowers')
+        with gc_paused():
+            if isinstance(patrons, RecordTable):
+                self.borrowers = BorrowerRegistry(patrons)
+            else:
+                self.borrowers = BorrowerRegistry.from_rows(patrons)
+            history_errors = self._load_history()
+            self._set_loans(rows)
+        return {'borrowers': loan_errors, 'patrons': patron_errors, 'history': history_errors}
+
+    def _load_history(self):
+        # Read the loan history and return its malformed lines; before
+        # _set_loans, which counts it
+        rows, malformed = self._load_snapshot('history', self.loan_history)
+        if rows is None:
+            rows, malformed = self.storage.load('history')
+            with gc_paused():
+                rows = RecordTable.from_rows(HISTORY_COLUMNS, rows, kinds=HISTORY_KINDS,
+                                             clock=_next_clock(self.loan_history))
+        self.loan_history = rows
+        return malformed
+
+    def _set_loans(self, rows):
+        # rows may also be a RecordTable of them, from a snapshot
+        with gc_paused():
+            if isinstance(rows, RecordTable):
+                self.borrowed_books = loans = rows
+            else:
+                self.borrowed_books = loans = RecordTable.from_rows(LOAN_COLUMNS, rows, kinds=LOAN_KINDS,
+                                                                    clock=_next_clock(self.borrowed_books))
+            # Fresh from from_rows or a snapshot, loan i is in slot i of every column
+            self.due_index = DueIndex.build(range(len(loans)), loans.data['Borrower ID'].numbers,
+                                            loans.data['Return Date'].days())
+            self.circulation = LoanCounters.build(loans, self.loan_history)
+
+    def _legacy_tables(self, rows, errors):
+        """The books and loans as saved before the catalog, or None.
+
+        rows and errors are what loading the books in the current layout
+        gave. Books used to be stored once per copy, as Title, Author, Year,
+        and loans carried the book's fields instead of its id. Only text
+        files can be that old; an old database is refused by SqliteRepository.
+        Returns the shelf and its malformed lines, and the loans (with
+        borrower ids) and their malformed lines by table.
+        """
+        if not hasattr(self.storage, 'files') or rows:
+            return None
+        shelf, book_errors = self.storage.load('books', len(LEGACY_BOOK_COLUMNS)) if errors else ([], [])
+        legacy = self._legacy_loans()
+        if legacy is not None:
+            loans, loan_errors = legacy
+            return shelf, book_errors, self._register_borrowers(loans), {'borrowers': loan_errors, 'patrons': []}
+        # Without a single book in the catalog, the loans tell which layout this is
+        loans, loan_errors = self.storage.load('borrowers', len(LEGACY_LOAN_COLUMNS))
+        if not shelf and not loans:
+            return None
+        patrons, patron_errors = self.storage.load('patrons')
+        self.borrowers = BorrowerRegistry.from_rows(patrons)
+        return shelf, book_errors, loans, {'borrowers': loan_errors, 'patrons': patron_errors}
+
+    def _legacy_loans(self):
+        """Loans saved before the borrower registry, with any malformed lines, or None.
+
+        Those rows carry the borrower's name, email and phone (only the name
+        in libBERT.py's files) instead of an id.
+        """
+        if self.storage.exists('patrons') or not self.storage.exists('borrowers'):
+            return None
+        rows, malformed = self.storage.load('borrowers', len(BORROWER_COLUMNS))
+        if rows:
+            return rows, malformed
+        # libBERT.py's layout: Borrower, Title, Author, Year, Borrow Date, Return Date
+        rows, malformed = self.storage.load('borrowers', len(LEGACY_LOAN_COLUMNS))
+        return [[name, '', '', *loan] for name, *loan in rows], malformed
+
+    def _register_borrowers(self, legacy):
+        # Register every borrower once and point their loans at them
+        self.borrowers = BorrowerRegistry()
+        loans = []
+        for name, email, phone, *loan in legacy:
+            borrower_id = self.borrowers.find(name, email, phone)
+            if borrower_id is None:
+                borrower_id = int(self.borrowers.register(name, email, phone)[0])
+            loans.append([str(borrower_id), *loan])
+        return loans
+
+    def _upgrade_tables(self, shelf, legacy):
+        # One catalog record per title, counting a copy for every book on the
+        # shelf and every loan of it; then point the loans at their record
+        # and write the tables out in the new layout straight away. The
+        # copies on the shelf and the loans of a book spelled their fields
+        # with different spacing, so they are matched without it.
+        available = Counter(tuple(field.strip() for field in book) for book in shelf)
+        copies = Counter(available)
+        loans = []
+        for borrower_id, *book, borrow_date, return_date in legacy:
+            book = tuple(field.strip() for field in book)
+            copies[book] += 1
+            loans.append((borrower_id, book, borrow_date, return_date))
+        book_ids = {book: book_id for book_id, book in enumerate(copies)}
+        self.load_books([[str(book_ids[book]), *book, str(count), str(available[book])]
+                         for book, count in copies.items()])
+        self._set_loans([[borrower_id, str(book_ids[book]), borrow_date, return_date]
+                         for borrower_id, book, borrow_date, return_date in loans])
+        self.storage.compact(self.snapshot_rows)
+        self.save_search_index()
+
+    def load_books(self, rows):
+        # rows may also be a RecordTable of them, from a snapshot
+        self.catalog_version += 1
+        self.unindexed = deque()
+        # Reuse the saved index if the stored books haven't changed since
+        signature = self.storage.signature('books')
+        if signature is None:
+            index = None
+        else:
+            # Books are stored with their ids, so the saved order isn't needed
+            index, _ = SearchIndex.load(self.index_path, signature, len(rows))
+        self._set_books(rows)
+        if index is not None:
+            self.search_index = index
+        else:
+            self.search_index = SearchIndex.build((book_id, row[1:4]) for book_id, row in self.book_data.items())
+            self.save_search_index()
+
+    def _set_books(self, rows):
+        if isinstance(rows, RecordTable):
+            self.book_data = rows
+            return
+        with gc_paused():
+            self.book_data = RecordTable.from_rows(BOOK_COLUMNS, rows, [int(row[0]) for row in rows], BOOK_KINDS,
+                                                   _next_clock(self.book_data))
+
+    def _load_snapshot(self, table, replaced=None):
+        """The stored table as a RecordTable from its snapshot and its malformed lines, or (None, None).
+
+        There's only a table if the snapshot was taken of the table exactly
+        as it is stored now. replaced is the table it takes the place of,
+        whose versions it carries on from.
+        """
+        path = self.snapshot_paths.get(table)
+        if path is None:
+            return None, None
+        signature = self.storage.signature(table)
+        columns, kinds, _ = SNAPSHOT_TABLES[table]
+        records, malformed = load_table(path, signature, columns, kinds, _next_clock(replaced))
+        if records is not None:
+            self.snapshot_signatures[table] = signature
+        return records, malformed
+
+    def _signatures(self):
+        return {table: self.storage.signature(table) for table in self.snapshot_paths}
+
+    def _save_snapshots(self, signatures, malformed=None):
+        # Snapshot every table that is stored with a signature its snapshot
+        # doesn't have. Only call while the tables in memory are exactly what
+        # was stored when signatures were read.
+        tables = {'books': self.book_data, 'borrowers': self.borrowed_books, 'patrons': self.borrowers.table,
+                  'history': self.loan_history}
+        for table, signature in signatures.items():
+            if signature is None or self.snapshot_signatures.get(table) == signature:
+                continue
+            renumber = not SNAPSHOT_TABLES[table][2]
+            save_table(self.snapshot_paths[table], tables[table], signature, (malformed or {}).get(table, ()),
+                       renumber)
+            self.snapshot_signatures[table] = signature
+
+    def save_search_index(self):
+        signature = self.storage.signature('books')
+        if signature is None:
+            return
+        self.search_index.save(self.index_path, signature, list(self.book_data))
+
+    def snapshot_rows(self):
+        # Current rows of every table, for backends that write full snapshots
+        return {'books': self.book_data.rows(), 'borrowers': self.borrowed_books.rows(),
+                'patrons': self.borrowers.table.rows(), 'history': self.loan_history.rows()}
+
+    def compact_if_needed(self):
+        # Call once an operation is fully applied and recorded
+        self.storage.compact_if_needed(self.snapshot_rows)
+
+    def sync(self):
+        self.storage.sync()
+
+    def refresh(self):
+        """Apply the changes other instances saved since the last load or refresh.
+
+        Returns (changed, dropped, failure): whether anything changed, how
+        many changes of this library's storage thread were dropped, and the
+        error that kept the first of them from being saved, e.g. a full disk,
+        or None if they were all dropped because another instance got to the
+        same records first. Those were already applied in memory, so then,
+        and whenever the changes can't be replayed one by one, every table is
+        loaded again.
+        """
+        return self.apply_changes(*self.storage.poll())
+
+    def apply_changes(self, records, dropped, failure=None):
+        """refresh() with the result of storage.poll(), for callers that poll on another thread."""
+        dropped, self.undone = dropped + self.undone, 0
+        failure, self.failure = self.failure or failure, None
+        if records is None:
+            self.load()
+            return True, dropped, failure
+        for record in records:
+            if not self._apply(record):
+                self.load()
+                break
+        return bool(records), dropped, failure
+
+    def _catch_up(self):
+        # refresh() for calls that can't report what it returns
+        _, self.undone, self.failure = self.refresh()
+
+    def _apply(self, record):
+        # One change another instance saved; False if it doesn't fit what is
+        # in memory, e.g. a book this library has no record of
+        table, op, row = record['table'], record['op'], record['row']
+        if table == 'books' and op == 'insert':
+            if int(row[0]) < self.book_data.next_id:
+                return False
+            self._shelve(row)
+        elif table == 'books':
+            book_id = int(row[0])
+            if book_id not in self.book_data or self.book_data.row(book_id) != row:
+                return False
+            if op == 'delete':
+                self._unshelve(book_id)
+            else:
+                self._replace_book(book_id, record['new'])
+        elif table == 'borrowers' and op == 'insert':
+            self._lend(row)
+        elif table == 'borrowers' and op == 'delete':
+            loan_id = self._find_loan(row)
+            if loan_id is None:
+                return False
+            self._end_loan(loan_id)
+        elif table == 'history' and op == 'insert':
+            self._record_return(row)
+        elif table == 'patrons' and op == 'insert':
+            if int(row[0]) < self.borrowers.table.next_id:
+                return False
+            self.borrowers.add(row)
+        else:
+            return False
+        return True
+
+    def _find_loan(self, row):
+        borrower_id = int(row[0])
+        undated = [loan_id for loan_id in self.due_index.undated if self.due_index.borrowers[loan_id] == borrower_id]
+        for loan_id in self.due_index.outstanding(borrower_id) + undated:
+            if self.borrowed_books.row(loan_id) == row:
+                return loan_id
+        return None
+
+    def _commit(self, changes):
+        try:
+            self.storage.commit(changes)
+        except ConflictError:
+            # Catch up, so the caller shows what is really there and can try again
+            self._catch_up()
+            raise
+
+    def _check_version(self, table, record_id, version):
+        if version is not None and table.version(record_id) != version:
+            raise ConflictError("This record was changed since it was shown; please check it and try again")
+
+    def close(self):
+        # Flush pending changes, then keep the index on disk so the next start
+        # doesn't have to rebuild it. An index still missing imported books
+        # would pass for a complete one, so then the next start rebuilds it.
+        # Raises the error that kept a change from being saved, if no
+        # refresh() has reported it.
+        self.storage.flush(self.snapshot_rows)
+        if not self.unindexed:
+            self.save_search_index()
+        # The same for the snapshots, but only of tables as this instance has
+        # them: the signatures are read first, so anything another instance
+        # stored after them shows up in poll() and then nothing is saved
+        signatures = self._signatures()
+        records, dropped, failure = self.storage.poll()
+        if records == [] and not dropped:
+            self._save_snapshots(signatures)
+        self.storage.close()
+        failure = self.failure or failure
+        if failure is not None:
+            raise failure
+
+    def search(self, query):
+        """Ids of the books with query in their title, author or year."""
+        return self.search_index.search(query)
+
+    def iter_search(self, query, within=None, cancelled=None):
+        """Yield the same ids as search() one at a time; see SearchIndex.matches."""
+        return self.search_index.matches(query, within, cancelled)
+
+    def closest(self, query, limit=CLOSEST_LIMIT):
+        """Ids of the limit books that best match the words of query despite typos, best first."""
+        return self.search_index.closest(query, limit)
+
+    def _shelve(self, row):
+        book_id = self.book_data.insert(row, int(row[0]))
+        self.search_index.add(book_id, *row[1:4])
+        self.catalog_version += 1
+        return book_id
+
+    def _unshelve(self, book_id):
+        self.search_index.remove(book_id)
+        self.catalog_version += 1
+        return self.book_data.delete(book_id)
+
+    def _replace_book(self, book_id, row):
+        old_row = self.book_data.update(book_id, row)
+        if old_row[1:4] != row[1:4]:
+            self.search_index.update(book_id, *row[1:4])
+        self.catalog_version += 1
+        return old_row
+
+    def _count(self, book_id, column):
+        return int(self.book_data.value(book_id, column))
+
+    def _recount(self, book_id, copies, available):
+        # The book's row with new counts, for a change that lends, takes back,
+        # adds or removes copies
+        return [*self.book_data.row(book_id)[:4], str(copies), str(available)]
+
+    def _lend(self, loan):
+        loan_id = self.borrowed_books.insert(loan)
+        self.due_index.add(loan_id, int(loan[0]), loan[-1])
+        self.circulation.add(loan)
+        return loan_id
+
+    def _end_loan(self, loan_id):
+        self.due_index.remove(loan_id)
+        loan = self.borrowed_books.delete(loan_id)
+        self.circulation.remove(loan)
+        return loan
+
+    def _record_return(self, ended):
+        # ended is a loan's row with the day it came back
+        self.loan_history.insert(ended)
+        self.circulation.add_ended(ended)
+
+    def find_book(self, title, author, year):
+        """The id of the catalog record with exactly these fields, or None."""
+        for book_id in self.search_index.matches(title):
+            if self.book_data.row(book_id)[1:4] == [title, author, year]:
+                return book_id
+        return None
+
+    def add_book(self, title, author, year):
+        """Add a copy of a book to the shelf and return the book's id.
+
+        A book already in the catalog gets one more copy; any other book gets
+        a new record.
+        """
+        if not (title and author and year):
+            raise ValueError("Please fill in all fields")
+        book_id = self.find_book(title, author, year)
+        if book_id is None:
+            row = [str(self.book_data.next_id), title, author, year, '1', '1']
+            self._commit([('books', 'insert', row, None)])
+            book_id = self._shelve(row)
+        else:
+            row = self._recount(book_id, self._count(book_id, 'Copies') + 1, self._count(book_id, 'Available') + 1)
+            self._commit([('books', 'update', self.book_data.row(book_id), row)])
+            self._replace_book(book_id, row)
+        self.compact_if_needed()
+        return book_id
+
+    def import_books(self, chunks, progress=None):
+        """Add the books of a catalog file to the catalog, as one write, and return what was done.
+
+        chunks are lists of records from catalog_files.read_books(). A book
+        already in the catalog, or earlier in the file, is one with the same
+        title, author and year without surrounding spaces; it gets the
+        record's copies added rather than a second record. The new records
+        are kept in compact columns until they are saved, so memory grows
+        with the catalog, not with the file.
+
+        The journal is for small changes, so the whole catalog is stored
+        again in one go (see replace_table) and then changed in memory. New
+        books show in the catalog at once but are only found by searches
+        once index_pending() has indexed them, which takes much longer than
+        the import. progress(records read) is called after every chunk.
+
+        Returns (added, copied, invalid): how many books were added to the
+        catalog, how many copies to books it already had, and (record number,
+        reason) for each record that was skipped.
+        """
+        # Books other instances added are duplicates too
+        self._catch_up()
+        first_id = self.book_data.next_id
+        staged = StagedBooks(first_id)
+
+        def fields(book_id):
+            if book_id >= first_id:
+                return staged.fields(book_id)
+            return tuple(self.book_data.value(book_id, column).strip() for column in BOOK_FIELDS)
+
+        keys = BookKeys.of(self.book_data, fields)
+        more = Counter()    # book id in the catalog -> copies added
+        invalid = []
+        read = 0
+        for chunk in chunks:
+            for number, record in enumerate(chunk, read + 1):
+                try:
+                    title, author, year, copies = book_fields(record)
+                except ValueError as error:
+                    invalid.append((number, str(error)))
+                    continue
+                key = (title, author, year)
+                book_id = keys.find(key)
+                if book_id is None:
+                    keys.add(key, staged.add(title, author, year, copies))
+                elif book_id >= first_id:
+                    staged.add_copies(book_id, copies)
+                else:
+                    more[book_id] += copies
+            read += len(chunk)
+            if progress is not None:
+                progress(read)
+
+        changed = {book_id: self._recount(book_id, self._count(book_id, 'Copies') + copies,
+                                          self._count(book_id, 'Available') + copies)
+                   for book_id, copies in more.items()}
+        if changed or staged:
+            def catalog():
+                for book_id, row in self.book_data.items():
+                    yield changed.get(book_id, row)
+                yield from staged.rows()
+            try:
+                self.storage.replace_table('books', catalog(), self.snapshot_rows)
+            except ConflictError:
+                self._catch_up()
+                raise
+            for book_id, row in changed.items():
+                self.book_data.update(book_id, row)
+            if staged:
+                self.unindexed.append(self.book_data.extend(staged.rows()))
+            self.catalog_version += 1
+        return len(staged), sum(more.values()), invalid
+
+    def index_pending(self, count=None):
+        """Add up to count imported books (all by default) to the search index; returns how many are left.
+
+        Callers with a window call it a batch at a time between events, so
+        the window stays responsive while a big import is indexed.
+        """
+        index, books, unindexed = self.search_index, self.book_data, self.unindexed
+        left = sum(map(len, unindexed))
+        count = left if count is None else min(count, left)
+        while count:
+            book_ids = unindexed.popleft()
+            if len(book_ids) > count:
+                unindexed.appendleft(book_ids[count:])
+                book_ids = book_ids[:count]
+            count -= len(book_ids)
+            left -= len(book_ids)
+            for book_id in book_ids:
+                # A book edited since the import was indexed then, and a removed one needs no indexing
+                if book_id in books and book_id not in index.docs:
+                    index.add(book_id, *books.row(book_id)[1:4])
+            if not left:
+                # Searches find every imported book now. Not bumped per batch,
+                # which would keep restarting the searches running meanwhile.
+                self.catalog_version += 1
+        return left
+
+    def catalog(self):
+        """[title, author, year, copies, available] of every book, for catalog_files.write_books()."""
+        # Only the columns written, rather than whole rows
+        books = self.book_data
+        titles, authors, years, copies, available = (books.data[column] for column in BOOK_COLUMNS[1:])
+        for slot in books.slot_of:
+            if slot >= 0:
+                yield [titles[slot].strip(), authors[slot].strip(), years[slot].strip(),
+                       int(copies[slot]), int(available[slot])]
+
+    def remove_book(self, book_id, version=None):
+        """Remove a copy of a book from the shelf and return the book's fields.
+
+        The book leaves the catalog with its last copy. Copies on loan can't
+        be removed until they are back.
+        """
+        self._check_version(self.book_data, book_id, version)
+        copies, available = self._count(book_id, 'Copies'), self._count(book_id, 'Available')
+        if not available:
+            raise ValueError(f"Every copy of {self.book_data.value(book_id, 'Title').strip()} is on loan")
+        row = self.book_data.row(book_id)
+        if copies == 1:
+            self._commit([('books', 'delete', row, None)])
+            self._unshelve(book_id)
+        else:
+            new = self._recount(book_id, copies - 1, available - 1)
+            self._commit([('books', 'update', row, new)])
+            self._replace_book(book_id, new)
+        self.compact_if_needed()
+        return row[1:4]
+
+    def edit_book(self, book_id, title, author, year, version=None):
+        """Change a book's title, author and year, for all of its copies."""
+        self._check_version(self.book_data, book_id, version)
+        row = self.book_data.row(book_id)
+        new = [row[0], title, author, year, *row[4:]]
+        self._commit([('books', 'update', row, new)])
+        self._replace_book(book_id, new)
+        self.compact_if_needed()
+
+    def available(self, book_id):
+        """How many copies of the book are on the shelf."""
+        return self._count(book_id, 'Available')
+
+    def _borrower(self, name, email, phone):
+        # The borrower's id, and their row if they still have to be registered
+        borrower_id = self.borrowers.find(name, email, phone)
+        if borrower_id is not None:
+            return borrower_id, None
+        row = self.borrowers.new_row(name, email, phone)
+        return int(row[0]), row
+
+    def borrower_id(self, name, email='', phone=''):
+        """The id of the borrower with these details, registering them if they are new."""
+        borrower_id, row = self._borrower(name, email, phone)
+        if row is not None:
+            self._commit([('patrons', 'insert', row, None)])
+            self.borrowers.add(row)
+        return borrower_id
+
+    def borrow_book(self, book_id, borrower, email='', phone='', return_date=None, borrow_date=None, version=None):
+        """Lend a copy of a book and return the new loan's id.
+
+        The dates default to today and LOAN_DAYS from now. Raises ValueError
+        without a borrower's name, or for a date that isn't an ISO date such
+        as 2024-10-05.
+        """
+        today = datetime.date.today()
+        if not borrower.strip():
+            raise ValueError("Please enter the borrower's name")
+        for date, field in ((borrow_date, "borrow date"), (return_date, "return date")):
+            if date:
+                _check_date(date, field)
+        self._check_version(self.book_data, book_id, version)
+        available = self._count(book_id, 'Available')
+        if not available:
+            raise ValueError(f"Every copy of {self.book_data.value(book_id, 'Title').strip()} is on loan")
+        borrower_id, patron = self._borrower(borrower, email, phone)
+        loan = [str(borrower_id), str(book_id), borrow_date or today.isoformat(),
+                return_date or (today + datetime.timedelta(days=LOAN_DAYS)).isoformat()]
+        book = self._recount(book_id, self._count(book_id, 'Copies'), available - 1)
+
+        # Both halves of the checkout, and a new borrower, are saved together or not at all
+        changes = [('borrowers', 'insert', loan, None), ('books', 'update', self.book_data.row(book_id), book)]
+        self._commit(([('patrons', 'insert', patron, None)] if patron else []) + changes)
+        if patron:
+            self.borrowers.add(patron)
+        loan_id = self._lend(loan)
+        self._replace_book(book_id, book)
+        self.compact_if_needed()
+        return loan_id
+
+    def return_book(self, loan_id, version=None, returned_on=None):
+        """Put a borrowed copy back on the shelf and return its book's id.
+
+        The loan goes into the loan history as brought back on returned_on
+        (an ISO date, today by default).
+        """
+        if returned_on is not None:
+            _check_date(returned_on, "return date")
+        loan = self.borrowed_books.row(loan_id)
+        self._check_version(self.borrowed_books, loan_id, version)
+        book_id = int(loan[1])
+        book = self._recount(book_id, self._count(book_id, 'Copies'), self._count(book_id, 'Available') + 1)
+        ended = [*loan, returned_on or datetime.date.today().isoformat()]
+        self._commit([('borrowers', 'delete', loan, None), ('history', 'insert', ended, None),
+                      ('books', 'update', self.book_data.row(book_id), book)])
+        self._end_loan(loan_id)
+        self._record_return(ended)
+        self._replace_book(book_id, book)
+        self.compact_if_needed()
+        return book_id
+
+    def loan_value(self, loan_id, column):
+        """A column of a loan, including the borrower's name, email and phone and the book's fields."""
+        if column in BORROWER_FIELDS:
+            return self.borrowers.value(int(self.borrowed_books.value(loan_id, 'Borrower ID')), column)
+        if column in BOOK_FIELDS:
+            return self.book_data.value(int(self.borrowed_books.value(loan_id, 'Book ID')), column)
+        return self.borrowed_books.value(loan_id, column)
+
+    def loan_record(self, loan_id):
+        """The loan as a dict, with the borrower's details and the book's fields filled in."""
+        loan = self.borrowed_books.record(loan_id)
+        loan.update(self.borrowers.record(int(loan['Borrower ID'])))
+        book = self.book_data.record(int(loan['Book ID']))
+        loan.update((column, book[column]) for column in BOOK_FIELDS)
+        return loan
+
+    def overdue(self, today=None):
+        """Ids of the loans due before today (a date), most overdue first."""
+        return self.due_index.overdue(_day(today))
+
+    def due_within(self, days, today=None):
+        """Ids of the loans due from today through days after it, earliest first."""
+        return self.due_index.due_within(days, _day(today))
+
+    def outstanding(self, borrower_id):
+        """Ids of a borrower's loans, earliest due first."""
+        return self.due_index.outstanding(borrower_id)
+
+    def reviews_for(self, title, positions=None):
+        """The reviews of a book in the order they were added, or those at positions (from 0), in that order."""
+        return self.storage.reviews_for(title, positions)
+
+    def review_count(self, title):
+        return self.storage.review_count(title)
+
+    def reviews(self):
+        """Every (title, review) pair, for statistics over all of them."""
+        return self.storage.reviews()
+
+    def add_review(self, title, review):
+        self.storage.add_review(title, review)
+
+
+def _next_clock(table):
+    # The clock a table replacing table starts from: versions carry on, so a
+    # version read before a reload never matches a record after it
+    return table.clock + 1 if table is not None else 0
+
+
+def _day(date):
+    return None if date is None else date.toordinal()
+
+
+def _check_date(text, field):
+    # Only dates DateColumn reads as one: anything else would keep a loan
+    # out of the due-date index, and so off every overdue list
+    try:
+        valid = datetime.date.fromisoformat(text).isoformat() == text
+    except (TypeError, ValueError):
+        valid = False
+    if not valid:
+        raise ValueError(f"The {field} must be a date such as 2024-10-05, not {text!r}")
@@ -0,0 +1,146 @@
+"""Talk to library_server.py from a script or the command line.
+
+    python library_client.py search gatsby [--limit 20] [--fuzzy]
+    python library_client.py borrow 3 "Jane Doe" [--email ...] [--phone ...]
+    python library_client.py return 12
+    python library_client.py reviews "The Great Gatsby"
+    python library_client.py outstanding "Jane Doe"
+
+Add --socket library.sock, or --host and --port, to reach a server that
+isn't on the default localhost port.
+"""
+import argparse
+import json
+import socket
+import sys
+
+from library_server import DEFAULT_PORT
+
+
+class ServerError(Exception):
+    """The server refused a request, e.g. to borrow a book whose copies are all out."""
+
+
+class LibraryClient:
+    """A blocking connection to a library server, one request at a time.
+
+    Methods mirror Library's: search, borrow_book, return_book and so on.
+    """
+
+    def __init__(self, socket_path=None, host='127.0.0.1', port=DEFAULT_PORT):
+        if socket_path:
+            self.sock = socket.socket(socket.AF_UNIX)
+            self.sock.connect(socket_path)
+        else:
+            self.sock = socket.create_connection((host, port))
+        self.file = self.sock.makefile('rwb')
+        self.next_id = 0
+
+    def call(self, op, **fields):
+        """Send one request and return its result, or raise ServerError."""
+        self.next_id += 1
+        self.file.write(json.dumps({'id': self.next_id, 'op': op, **fields}).encode() + b'\n')
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("The library server closed the connection")
+        reply = json.loads(line)
+        if not reply['ok']:
+            raise ServerError(reply['error'])
+        return reply['result']
+
+    def search(self, query, limit=None):
+        """{'version': ..., 'books': [[book id, title, author, year, copies, available, book version], ...], 'more': bool}"""
+        fields = {} if limit is None else {'limit': limit}
+        return self.call('search', query=query, **fields)
+
+    def closest(self, query, limit=None):
+        """{'version': ..., 'books': [...]}, the books as in search(), closest to query first."""
+        fields = {} if limit is None else {'limit': limit}
+        return self.call('closest', query=query, **fields)
+
+    def add_book(self, title, author, year):
+        return self.call('add_book', title=title, author=author, year=year)
+
+    def remove_book(self, book_id, version=None):
+        return self.call('remove_book', book_id=book_id, version=version)
+
+    def borrow_book(self, book_id, borrower, email='', phone='', return_date=None, version=None):
+        return self.call('borrow', book_id=book_id, borrower=borrower, email=email, phone=phone,
+                         return_date=return_date, version=version)
+
+    def return_book(self, loan_id):
+        return self.call('return', loan_id=loan_id)
+
+    def loan_record(self, loan_id):
+        return self.call('loan', loan_id=loan_id)
+
+    def outstanding(self, borrower):
+        return self.call('outstanding', borrower=borrower)
+
+    def reviews_for(self, title):
+        return self.call('reviews', title=title)
+
+    def add_review(self, title, review):
+        return self.call('add_review', title=title, review=review)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socket', help="the server's Unix socket")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    commands = parser.add_subparsers(dest='command', required=True)
+    search = commands.add_parser('search')
+    search.add_argument('query')
+    search.add_argument('--limit', type=int)
+    search.add_argument('--fuzzy', action='store_true', help="allow typos, closest matches first")
+    borrow = commands.add_parser('borrow')
+    borrow.add_argument('book_id', type=int)
+    borrow.add_argument('borrower')
+    borrow.add_argument('--email', default='')
+    borrow.add_argument('--phone', default='')
+    commands.add_parser('return').add_argument('loan_id', type=int)
+    commands.add_parser('reviews').add_argument('title')
+    commands.add_parser('outstanding').add_argument('borrower')
+    args = parser.parse_args(argv)
+
+    try:
+        with LibraryClient(args.socket, args.host, args.port) as client:
+            if args.command == 'search':
+                if args.fuzzy:
+                    result = client.closest(args.query, args.limit)
+                else:
+                    result = client.search(args.query, args.limit)
+                for book_id, title, author, year, copies, available, _ in result['books']:
+                    print(f"{book_id:>8}  {title.strip()}, {author.strip()}, {year.strip()}  ({available} of {copies} in)")
+                if result.get('more'):
+                    print("... more books match; use --limit to see them", file=sys.stderr)
+            elif args.command == 'borrow':
+                print(f"Loan {client.borrow_book(args.book_id, args.borrower, args.email, args.phone)}")
+            elif args.command == 'return':
+                print(f"Back on the shelf: book {client.return_book(args.loan_id)}")
+            elif args.command == 'reviews':
+                for review in client.reviews_for(args.title):
+                    print(review)
+            else:
+                for loan_id, loan in client.outstanding(args.borrower):
+                    print(f"{loan_id:>8}  {loan['Return Date'].strip()}  {loan['Title'].strip()}")
+    except ServerError as error:
+        sys.exit(str(error))
+    except OSError as error:
+        sys.exit(f"Can't reach the library server: {error}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""One process that owns the library, for several circulation desks at once.
+
+    python library_server.py [--socket library.sock | --port 8765] [--dir .] [--backend text]
+
+Without it, every desk's window loads the files and writes them back on its
+own, so desks overwrite each other's changes. The server loads the catalog
+once and applies every change itself, in the order the requests arrive, so
+a copy borrowed at one desk is off the shelf for all of them.
+library_client.py talks to it.
+
+Requests and replies are JSON objects, one per line:
+
+    {"id": 1, "op": "search", "query": "gatsby", "limit": 20}
+    {"id": 1, "ok": true, "result": {"version": 7, "books": [[3, "The Great Gatsby", ...]], "more": false}}
+    {"id": 2, "ok": false, "error": "Every copy of The Great Gatsby is on loan"}
+
+The closest op takes the same fields as search and answers with the books
+that best match the query's words despite typos ("gatbsy fitzgerlad"), best
+first.
+
+A request that isn't a JSON object, or whose fields are missing or of the
+wrong type, gets an error reply, and so does one that fails for any other
+reason.
+
+Changes run on the event loop one at a time and never wait for the disk;
+the Library writes storage on a thread of its own. Searches run on worker
+threads against the live index without taking a lock, so a long search
+never holds up a checkout. Their ids are turned into rows on the event
+loop, between changes, so every reply shows the catalog as of one moment
+(its version is in the reply), with the copies on the shelf at that moment.
+
+Other servers or windows may share the files. Every second the server picks
+up what they saved, off the event loop, since that may mean loading
+everything again; replies that read the catalog wait for it meanwhile.
+Each book in a search reply carries its record version; a borrow or
+removal that passes it back is refused if the book changed in between,
+and one that clashes with another instance's change is refused too.
+"""
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import os
+import signal
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from library import Library, STORAGE_BACKEND
+from repository import ConflictError
+
+DEFAULT_PORT = 8765
+SEARCH_THREADS = 4
+SEARCH_LIMIT = 100      # books per search reply unless the request asks for another limit
+MAX_REQUEST = 1 << 20   # bytes in one request line
+REFRESH_SECONDS = 1     # how often to pick up changes other instances saved
+
+# The JSON type of every request field; a field whose default is None may be null
+FIELD_TYPES = {
+    'query': str, 'limit': int, 'book_id': int, 'loan_id': int, 'version': int,
+    'title': str, 'author': str, 'year': str, 'borrower': str, 'email': str, 'phone': str,
+    'return_date': str, 'review': str,
+}
+TYPE_NAMES = {str: 'a string', int: 'an integer'}
+
+
+class LibraryServer:
+    """Serves one Library to any number of connections.
+
+    Each op_* method handles the request op of the same name and gets the
+    request's other fields as keyword arguments, checked against
+    FIELD_TYPES first. Errors a desk can cause, like borrowing a book someone
+    else just borrowed, become error replies; so does anything else that
+    goes wrong, which is logged as well.
+    """
+
+    def __init__(self, library, search_threads=SEARCH_THREADS):
+        self.library = library
+        self.searches = ThreadPoolExecutor(search_threads, thread_name_prefix='search')
+        self.connections = set()
+        # Held by changes, by replies that read the catalog, and by refresh()
+        # while it waits for the storage thread and applies what it found
+        self.changing = asyncio.Lock()
+
+    async def handle(self, reader, writer):
+        """Answer the requests of one connection, in order, until it closes."""
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    # Too long a line, or the desk went away
+                    break
+                if not line:
+                    break
+                writer.write(json.dumps(await self.answer(line)).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def answer(self, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object")
+            request_id = request.pop('id', None)
+            handler = getattr(self, 'op_' + str(request.pop('op', '')), None)
+            if handler is None:
+                raise ValueError("Unknown op")
+            _check_fields(handler, request)
+            result = handler(**request)
+            if asyncio.iscoroutine(result):
+                result = await result
+        except ConflictError as error:
+            return {'id': request_id, 'ok': False, 'error': str(error)}
+        except KeyError as error:
+            return {'id': request_id, 'ok': False, 'error': f"No such record: {error}"}
+        except ValueError as error:
+            return {'id': request_id, 'ok': False, 'error': str(error)}
+        except Exception as error:
+            # A bug, not the desk's doing: keep serving, and say what happened
+            traceback.print_exc()
+            return {'id': request_id, 'ok': False, 'error': f"Internal error: {error!r}"}
+        return {'id': request_id, 'ok': True, 'result': result}
+
+    def _rows(self, book_ids):
+        # Holding changing, so no change lands halfway through
+        return [self._book(book_id) for book_id in book_ids if book_id in self.library.book_data]
+
+    def _book(self, book_id):
+        # [book id, title, author, year, copies, available, version]
+        books = self.library.book_data
+        _, title, author, year, copies, available = books.row(book_id)
+        return [book_id, title, author, year, int(copies), int(available), books.version(book_id)]
+
+    async def refresh(self):
+        """Apply what other instances save, every REFRESH_SECONDS, until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(REFRESH_SECONDS)
+            self.library.sync()
+            # The poll waits behind the storage thread, which may be compacting,
+            # and applying what it found may load everything again, so both run
+            # off the loop. Searches go on meanwhile; changes and the replies
+            # that read the catalog wait, so none sees it half applied.
+            async with self.changing:
+                records, dropped, failure = await loop.run_in_executor(None, self.library.storage.poll)
+                _, dropped, failure = await loop.run_in_executor(None, self.library.apply_changes, records,
+                                                                 dropped, failure)
+            if failure is not None:
+                print(f"{dropped} change(s) were undone: saving one failed with {failure!r}", file=sys.stderr)
+            elif dropped:
+                print(f"{dropped} change(s) clashed with another instance's and were undone", file=sys.stderr)
+
+    def op_ping(self):
+        return 'pong'
+
+    async def op_search(self, query, limit=SEARCH_LIMIT):
+        """Up to limit books matching query, in catalog order, and whether there are more."""
+        book_ids = None
+        if query:
+            loop = asyncio.get_running_loop()
+            book_ids = await loop.run_in_executor(self.searches, self._search, query, limit)
+        async with self.changing:
+            if book_ids is None:
+                book_ids = list(islice(self.library.book_data, limit + 1))
+            books = self._rows(book_ids[:limit + 1])
+            return {'version': self.library.catalog_version, 'books': books[:limit], 'more': len(books) > limit}
+
+    def _search(self, query, limit):
+        # A few spare ids, as some may have been borrowed by the time they're shown
+        book_ids = []
+        for book_id in self.library.iter_search(query):
+            book_ids.append(book_id)
+            if len(book_ids) > 2 * limit + 10:
+                break
+        return book_ids
+
+    async def op_closest(self, query, limit=SEARCH_LIMIT):
+        """Up to limit books closest to query, typos allowed, best first."""
+        loop = asyncio.get_running_loop()
+        book_ids = await loop.run_in_executor(self.searches, self.library.closest, query, limit)
+        async with self.changing:
+            return {'version': self.library.catalog_version, 'books': self._rows(book_ids)}
+
+    async def op_book(self, book_id):
+        async with self.changing:
+            return self._book(book_id)
+
+    async def op_add_book(self, title, author, year):
+        """Add a copy of a book; returns the book's id, which is an existing one for a known book."""
+        async with self.changing:
+            return self.library.add_book(title, author, year)
+
+    async def op_remove_book(self, book_id, version=None):
+        async with self.changing:
+            self._check_listed(book_id)
+            return self.library.remove_book(book_id, version)
+
+    async def op_borrow(self, book_id, borrower, email='', phone='', return_date=None, version=None):
+        """Lend a copy of a book; returns the loan id, or an error if no copy is on the shelf.
+
+        With the version a search reported, the book must not have changed since.
+        """
+        async with self.changing:
+            self._check_listed(book_id)
+            if not borrower:
+                raise ValueError("Please enter the borrower's name")
+            return self.library.borrow_book(book_id, borrower, email, phone, return_date, version=version)
+
+    async def op_return(self, loan_id, version=None):
+        async with self.changing:
+            if loan_id not in self.library.borrowed_books:
+                raise ValueError(f"Loan {loan_id} has already been returned")
+            return self.library.return_book(loan_id, version)
+
+    async def op_loan(self, loan_id):
+        async with self.changing:
+            return self.library.loan_record(loan_id)
+
+    async def op_outstanding(self, borrower):
+        """The loans of every borrower matching a name, email or phone, earliest due first."""
+        async with self.changing:
+            loan_ids = [loan_id for borrower_id in self.library.borrowers.lookup(borrower)
+                        for loan_id in self.library.outstanding(borrower_id)]
+            loan_ids.sort(key=self.library.due_index.due_day)
+            return [[loan_id, self.library.loan_record(loan_id)] for loan_id in loan_ids]
+
+    async def op_reviews(self, title):
+        # Waits for the storage thread, so not on the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.library.reviews_for, title)
+
+    def op_add_review(self, title, review):
+        if not review:
+            raise ValueError("Review cannot be empty.")
+        self.library.add_review(title, review)
+
+    def _check_listed(self, book_id):
+        if book_id not in self.library.book_data:
+            raise ValueError(f"Book {book_id} is not in the catalog")
+
+    def close(self):
+        self.searches.shutdown()
+        self.library.close()
+
+
+def _check_fields(handler, fields):
+    # Raise ValueError unless fields are what handler takes, each of its type
+    parameters = inspect.signature(handler).parameters
+    for name, value in fields.items():
+        if name not in parameters:
+            raise ValueError(f"Unexpected field {name!r} for this op")
+        if value is None and parameters[name].default is None:
+            continue
+        expected = FIELD_TYPES[name]
+        # bool is an int to Python, but true isn't a book id
+        if not isinstance(value, expected) or isinstance(value, bool):
+            raise ValueError(f"Field {name!r} must be {TYPE_NAMES[expected]}")
+    missing = [name for name, parameter in parameters.items()
+               if parameter.default is parameter.empty and name not in fields]
+    if missing:
+        raise ValueError(f"Missing field(s) for this op: {', '.join(missing)}")
+
+
+async def serve(library, socket_path=None, host='127.0.0.1', port=DEFAULT_PORT, ready=None):
+    """Serve library until the task is cancelled; ready() is called once clients can connect."""
+    server = LibraryServer(library)
+    if socket_path:
+        listener = await asyncio.start_unix_server(server.handle, socket_path, limit=MAX_REQUEST)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port, limit=MAX_REQUEST)
+    if ready is not None:
+        ready()
+    refresh = asyncio.create_task(server.refresh())
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        refresh.cancel()
+        for writer in list(server.connections):
+            writer.close()
+        server.close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socket', help="listen on this Unix socket instead of TCP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--dir', default='.', help="directory holding the library files")
+    parser.add_argument('--backend', default=STORAGE_BACKEND, choices=['text', 'sqlite'])
+    args = parser.parse_args(argv)
+
+    library = Library.open(args.dir, args.backend, background=True)
+    missing, malformed = library.load()
+    for table in missing:
+        print(f"No {table} stored yet, starting fresh", file=sys.stderr)
+    for table, skipped in malformed.items():
+        if skipped:
+            print(f"{len(skipped)} malformed {table} line(s) skipped", file=sys.stderr)
+    # The catalog and its index are millions of objects that live as long as
+    # the server. Left to the collector, every full collection walks all of
+    # them and stalls the event loop for a quarter of a second.
+    gc.freeze()
+
+    def ready():
+        where = args.socket or f"{args.host}:{args.port}"
+        print(f"Serving {len(library.book_data)} titles and {len(library.borrowed_books)} loans on {where}",
+              file=sys.stderr)
+
+    async def run():
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, task.cancel)
+        try:
+            await serve(library, args.socket, args.host, args.port, ready)
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
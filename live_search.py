@@ -0,0 +1,176 @@
+"""Search-as-you-type for the book table of lib.py and libBERT.py.
+
+Every keystroke restarts a short timer, and only when typing pauses does a
+SearchWorker run the query on its own thread, so the GUI thread never waits
+for the index. A newer query interrupts the one in flight. Matches reach the
+table in growing batches, so the first ones show up right away on a large
+catalog. When the new query contains the last finished one, as it does while
+a word is being typed, only the books the last query found are checked.
+A query no book contains, often a misspelt name, shows the books closest to
+it instead, best first.
+"""
+import time
+
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal
+
+DEBOUNCE_MS = 150
+FIRST_BATCH = 200       # matches in the first batch sent to the table
+MAX_BATCH = 20000       # batches double up to this size
+# The search checks a few thousand books at a time and then sleeps this long
+# (in seconds), releasing the GIL, so the GUI thread can paint in between
+PAUSE = 0.001
+
+
+class SearchWorker(QThread):
+    """Runs one query against the library's search index off the GUI thread."""
+    found = pyqtSignal(int, list)   # generation, book ids
+    closest = pyqtSignal(int, list) # generation, ids of the closest books when none matched
+    completed = pyqtSignal(int)     # generation; not sent if interrupted
+
+    def __init__(self, library, generation, query, within=None, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.generation = generation
+        self.query = query
+        self.within = within
+
+    def run(self):
+        batch, size = [], FIRST_BATCH
+        for book_id in self.library.iter_search(self.query, self.within, self.pause):
+            batch.append(book_id)
+            if len(batch) >= size:
+                self.found.emit(self.generation, batch)
+                batch, size = [], min(size * 2, MAX_BATCH)
+        if self.isInterruptionRequested():
+            return
+        if batch:
+            self.found.emit(self.generation, batch)
+        elif size == FIRST_BATCH:
+            # Nothing found at all
+            self.closest.emit(self.generation, self.library.closest(self.query))
+            if self.isInterruptionRequested():
+                return
+        self.completed.emit(self.generation)
+
+    def pause(self):
+        """Polled by the search between chunks; True stops it."""
+        time.sleep(PAUSE)
+        return self.isInterruptionRequested()
+
+
+class LiveSearch(QObject):
+    """Filters a RecordTableModel of the library's books as line_edit changes.
+
+    Results of older queries are told apart by a generation number and
+    dropped. status reports the outcome as text for a label, instead of a
+    dialog that would get in the way of typing.
+    """
+    status = pyqtSignal(str)
+
+    def __init__(self, library, model, line_edit, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.model = model
+        self.line_edit = line_edit
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DEBOUNCE_MS)
+        self.timer.timeout.connect(self.search_now)
+        line_edit.textChanged.connect(lambda text: self.timer.start())
+
+        self.generation = 0
+        self.worker = None
+        self.running = set()    # workers that haven't finished, interrupted ones included
+        self.query = ''
+        self.version = None     # catalog version the current search started from
+        self.matched = []
+        self.suggested = 0      # close matches shown, when nothing matched
+        self.last = None        # (query, catalog version, ids) of the last completed search
+
+    def search_now(self):
+        """Run the current query without waiting for the timer."""
+        self.timer.stop()
+        self.cancel()
+        self.generation += 1
+        self.query = self.line_edit.text().lower()
+        if not self.query:
+            # No query: show the entire book list
+            self.model.set_table(self.library.book_data)
+            self.status.emit('')
+            return
+
+        within = None
+        if self.last is not None:
+            last_query, version, ids = self.last
+            if last_query in self.query and version == self.library.catalog_version:
+                within = ids
+        self.version = self.library.catalog_version
+        self.matched = []
+        self.suggested = 0
+        self.model.set_rows([])
+        self.status.emit("Searching...")
+
+        worker = SearchWorker(self.library, self.generation, self.query, within)
+        worker.found.connect(self._found)
+        worker.closest.connect(self._closest)
+        worker.completed.connect(self._completed)
+        # Keep a reference until the thread is done, even once it's interrupted
+        worker.finished.connect(lambda: self._finished(worker))
+        self.running.add(worker)
+        self.worker = worker
+        worker.start()
+
+    def cancel(self):
+        if self.worker is not None:
+            self.worker.requestInterruption()
+            self.worker = None
+
+    def stop(self):
+        """Interrupt any search and wait for its thread, e.g. before the window closes."""
+        self.timer.stop()
+        self.cancel()
+        for worker in list(self.running):
+            worker.wait()
+
+    def _current(self, generation):
+        # Ignore what older queries send, and stop once something else, like
+        # adding a book, has put the whole catalog back in the table
+        if generation != self.generation:
+            return False
+        if not self.model.is_filtered():
+            self.cancel()
+            return False
+        return True
+
+    def _found(self, generation, book_ids):
+        if self._current(generation):
+            self.matched.extend(book_ids)
+            self.model.add_rows(book_ids)
+            self.status.emit(f"{len(self.matched)} found so far...")
+
+    def _closest(self, generation, book_ids):
+        # Not added to matched: the next query mustn't be narrowed to these
+        if self._current(generation):
+            self.suggested = len(book_ids)
+            self.model.set_rows(book_ids)
+
+    def _completed(self, generation):
+        if not self._current(generation):
+            return
+        self.worker = None
+        if self.version != self.library.catalog_version:
+            # Books changed while the index was being read; search again
+            self.search_now()
+            return
+        self.last = (self.query, self.version, self.matched)
+        if self.matched:
+            self.status.emit(f"{len(self.matched)} found")
+        elif self.suggested:
+            self.status.emit(f"No books found; showing the {self.suggested} closest" if self.suggested > 1
+                             else "No books found; showing the closest")
+        else:
+            self.status.emit("No books found")
+
+    def _finished(self, worker):
+        self.running.discard(worker)
+        worker.deleteLater()
@@ -0,0 +1,65 @@
+"""Rewrite the library's text files in the record format of records.py.
+
+    python migrate_records.py [--dir .]     # books.txt, borrowers.txt, patrons.txt and reviews.txt
+    python migrate_records.py --check       # only say which format each file is in
+
+Files from before the format (format 1) split their fields on every comma,
+so a title with a comma in it broke its line, and reviews.txt split on the
+first colon. They were also written with ", " between fields, which left a
+space at the start of most of them; the rewrite strips those. The library
+still reads format 1. It writes the tables in the new format whenever it
+compacts them, and reviews.txt once a review needs it, but only this strips
+the spaces.
+
+Lines that can't be read are reported and left out, as the library leaves
+them out. Run it while the library window is closed: unsaved changes in the
+journal are folded into the new files.
+"""
+import argparse
+import sys
+
+from library import Library
+from records import FORMAT_VERSION, describe_malformed, file_version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dir', default='.', help="directory holding the library files")
+    parser.add_argument('--check', action='store_true', help="only report the format of each file")
+    args = parser.parse_args(argv)
+
+    library = Library.open(args.dir, 'text')
+    storage = library.storage
+    paths = {**storage.files, 'reviews': storage.review_path}
+    versions = {table: file_version(path) for table, path in paths.items()}
+    for table, path in paths.items():
+        version = versions[table]
+        print(f"{path}: " + ("missing" if version is None else f"format {version}"))
+    if args.check:
+        storage.close()
+        return
+
+    try:
+        # Also converts tables saved in a layout from before the catalog or the borrower registry
+        _, malformed = library.load()
+    except ValueError as error:
+        storage.close()
+        sys.exit(str(error))
+    for table, lines in malformed.items():
+        if lines:
+            print(describe_malformed(paths[table], lines))
+    tables = {table: [[field.strip() for field in row] for row in rows]
+              for table, rows in library.snapshot_rows().items()}
+    # Writes every table atomically and empties the journal
+    storage.compact(lambda: tables)
+    for table, rows in tables.items():
+        print(f"{paths[table]}: {len(rows)} records written in format {FORMAT_VERSION}")
+
+    reviews = storage.upgrade_reviews()
+    if reviews is not None:
+        print(f"{paths['reviews']}: {reviews} records written in format {FORMAT_VERSION}")
+    storage.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
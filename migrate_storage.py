@@ -0,0 +1,131 @@
+"""Copy the library between the text files and the SQLite database.
+
+    python migrate_storage.py to-sqlite    # books.txt, borrowers.txt, patrons.txt, loan_history.txt, reviews.txt -> library.db
+    python migrate_storage.py to-text      # library.db -> books.txt, borrowers.txt, patrons.txt, loan_history.txt, reviews.txt
+
+The destination is replaced, not merged. Run it while the library window is
+closed so neither backend has unsaved changes.
+
+A database in an older layout is exported with to-text --legacy: one from
+before the catalog, with a row per copy and the book's fields on every loan,
+or one from before the borrower registry, whose loans also carry the
+borrower's name, email and phone. The text files are written in that layout
+(without loan_history.txt, and without patrons.txt for the second), so the next time the library opens
+them it groups the copies into catalog records, registers any borrowers and
+rewrites the loans; to-sqlite then moves them back into a new database.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+from records import REVIEW_COLUMNS, format_records
+from repository import (BOOK_COLUMNS, BORROWER_COLUMNS, HISTORY_COLUMNS, LEGACY_BOOK_COLUMNS, LEGACY_LOAN_COLUMNS,
+                        LOAN_COLUMNS, PATRON_COLUMNS, SqliteRepository, TextRepository, sql_name)
+
+TABLES = {'books': BOOK_COLUMNS, 'borrowers': LOAN_COLUMNS, 'patrons': PATRON_COLUMNS, 'history': HISTORY_COLUMNS}
+# Older layouts, newest first
+LEGACY_LAYOUTS = [{'books': LEGACY_BOOK_COLUMNS, 'borrowers': LEGACY_LOAN_COLUMNS, 'patrons': PATRON_COLUMNS},
+                  {'books': LEGACY_BOOK_COLUMNS, 'borrowers': BORROWER_COLUMNS}]
+
+
+def open_text(args, tables=TABLES):
+    return TextRepository({'books': args.books, 'borrowers': args.borrowers, 'patrons': args.patrons,
+                           'history': args.history}, tables, args.journal, args.reviews)
+
+
+def stored_layout(path):
+    """The column names of the books and borrowers tables in the database at path."""
+    conn = sqlite3.connect(path)
+    try:
+        return {table: [row[1] for row in conn.execute(f"PRAGMA table_info({table})")] for table in ('books', 'borrowers')}
+    finally:
+        conn.close()
+
+
+def matches(stored, tables):
+    return all(stored[table] == [sql_name(column) for column in tables[table]] for table in stored)
+
+
+def legacy_layout(path):
+    """The layout from LEGACY_LAYOUTS the database at path is in."""
+    stored = stored_layout(path)
+    for tables in LEGACY_LAYOUTS:
+        if matches(stored, tables):
+            return tables
+    sys.exit(f"{path} is not in a layout this version knows; leave out --legacy if it is a current one")
+
+
+def to_sqlite(args):
+    if os.path.exists(args.borrowers) and not os.path.exists(args.patrons):
+        sys.exit(f"{args.borrowers} is in the layout from before {args.patrons} existed. "
+                 f"Open the library once to convert it, then run this again.")
+    text = open_text(args)
+    books, malformed = text.load('books')
+    if malformed and not books:
+        sys.exit(f"{args.books} is in the layout from before the catalog, with a line per copy. "
+                 f"Open the library once to convert it, then run this again.")
+    if os.path.exists(args.db) and not matches(stored_layout(args.db), TABLES):
+        # A database in an older layout, already exported with to-text --legacy
+        for path in (args.db, args.db + '-wal', args.db + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+    database = SqliteRepository(args.db, TABLES)
+    with database.conn:
+        for table in list(TABLES) + ['reviews']:
+            database.conn.execute(f"DELETE FROM {table}")
+    for table in TABLES:
+        rows, malformed = text.load(table)
+        database.insert_many(table, rows)
+        print(f"{table}: {len(rows)} rows copied, {len(malformed)} malformed lines skipped")
+    database.insert_many('reviews', text.iter_reviews())
+    print(f"reviews: {database.conn.execute('SELECT COUNT(*) FROM reviews').fetchone()[0]} rows copied")
+    text.close()
+    database.close()
+
+
+def to_text(args):
+    tables = legacy_layout(args.db) if args.legacy else TABLES
+    text, database = open_text(args, tables), SqliteRepository(args.db, tables)
+    tables = {table: database.load(table)[0] for table in text.tables}
+    if 'patrons' not in tables and os.path.exists(args.patrons):
+        # Its ids would not match the old loans
+        os.remove(args.patrons)
+    if 'history' not in tables and os.path.exists(args.history):
+        # Nor would the book ids of the loans in it
+        os.remove(args.history)
+    # Writes each file atomically and empties the text journal
+    text.compact(lambda: tables)
+    text.close()
+    tmp_path = args.reviews + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        f.writelines(format_records(database.iter_reviews(), REVIEW_COLUMNS))
+    os.replace(tmp_path, args.reviews)
+    count = database.conn.execute('SELECT COUNT(*) FROM reviews').fetchone()[0]
+    for table, rows in tables.items():
+        print(f"{table}: {len(rows)} rows copied")
+    print(f"reviews: {count} rows copied")
+    database.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('direction', choices=['to-sqlite', 'to-text'])
+    parser.add_argument('--db', default='library.db')
+    parser.add_argument('--books', default='books.txt')
+    parser.add_argument('--borrowers', default='borrowers.txt')
+    parser.add_argument('--patrons', default='patrons.txt')
+    parser.add_argument('--history', default='loan_history.txt')
+    parser.add_argument('--reviews', default='reviews.txt')
+    parser.add_argument('--journal', default='library.journal')
+    parser.add_argument('--legacy', action='store_true',
+                        help="to-text only: read a database in a layout from before the catalog or the borrower registry")
+    args = parser.parse_args(argv)
+    if args.direction == 'to-sqlite':
+        to_sqlite(args)
+    else:
+        to_text(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Score every review ahead of time so the review dialogs only read the cache.
+
+    python prescore.py [--model vader|bert] [--workers N] [--chunk-size 2000]
+
+reviews.txt is read in chunks of records and each chunk's unscored reviews are
+sent to a process pool whose workers each load the model once. Scores go to
+the same cache file the dialogs read. Progress is recorded after every chunk,
+so an interrupted run picks up where it stopped; anything already in the cache
+is skipped either way.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from records import data_start, parse_review, scan_records
+from sentiment import (BERT_MODEL, VADER_MODEL_ID, ScoreCache, bert_scores, load_bert_pipeline,
+                       load_vader, vader_scores)
+
+BERT_BATCH_SIZE = 32
+
+MODEL_IDS = {'vader': VADER_MODEL_ID, 'bert': BERT_MODEL}
+
+# Set in each worker process by init_worker
+_model_name = None
+_model = None
+
+
+def init_worker(model_name):
+    global _model_name, _model
+    _model_name = model_name
+    if model_name == 'bert':
+        # One model per core; don't let each of them spread over every core
+        import torch
+        torch.set_num_threads(1)
+        _model = load_bert_pipeline()
+    else:
+        _model = load_vader()
+
+
+def score_chunk(texts):
+    if _model_name == 'bert':
+        return bert_scores(_model, texts, BERT_BATCH_SIZE)
+    return vader_scores(_model, texts)
+
+
+def read_chunks(path, start, chunk_size):
+    """Yield (end offset, reviews) for every chunk_size records of path after byte start.
+
+    Records are parsed like TextRepository.iter_reviews. A half-written last
+    record is left for the next run.
+    """
+    with open(path, 'rb') as f:
+        quoted = data_start(f)
+        f.seek(max(start, f.tell()))
+        reviews, records = [], 0
+        for _, offset, record in scan_records(f, quoted):
+            records += 1
+            review = parse_review(record, quoted)
+            if review is not None:
+                reviews.append(review[1])
+            if records == chunk_size:
+                yield offset, reviews
+                reviews, records = [], 0
+        if records:
+            yield offset, reviews
+
+
+def read_progress(path, reviews_path, model_id):
+    """Byte offset of reviews_path that was fully scored by the last run, or 0."""
+    try:
+        with open(path, 'r') as f:
+            progress = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return 0
+    stat = os.stat(reviews_path)
+    if (progress.get('model') != model_id or progress.get('inode') != stat.st_ino
+            or progress.get('offset', 0) > stat.st_size):
+        return 0
+    return progress['offset']
+
+
+def write_progress(path, reviews_path, model_id, offset):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'model': model_id, 'inode': os.stat(reviews_path).st_ino, 'offset': offset}, f)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', choices=sorted(MODEL_IDS), default='vader')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=2000, help="reviews per task")
+    parser.add_argument('--reviews', default='reviews.txt')
+    parser.add_argument('--store', default='sentiment_cache.db')
+    args = parser.parse_args(argv)
+
+    model_id = MODEL_IDS[args.model]
+    cache = ScoreCache(args.store)
+    progress_path = args.store + '.progress'
+    start = read_progress(progress_path, args.reviews, model_id)
+    if start:
+        print(f"Resuming at byte {start} of {args.reviews}")
+
+    scored = skipped = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=(args.model,)) as pool:
+        # Chunks are committed in file order so the saved offset never skips one
+        pending = deque()
+
+        def commit_oldest():
+            nonlocal scored
+            end, texts, future = pending.popleft()
+            if future is not None:
+                cache.store(model_id, texts, future.result())
+                scored += len(texts)
+            write_progress(progress_path, args.reviews, model_id, end)
+
+        for end, reviews in read_chunks(args.reviews, start, args.chunk_size):
+            # The same review text only needs scoring once
+            unique = list(dict.fromkeys(reviews))
+            texts = [text for text, score in zip(unique, cache.lookup(model_id, unique)) if score is None]
+            skipped += len(reviews) - len(texts)
+            pending.append((end, texts, pool.submit(score_chunk, texts) if texts else None))
+            while len(pending) > 2 * args.workers:
+                commit_oldest()
+        while pending:
+            commit_oldest()
+    elapsed = time.perf_counter() - started
+    cache.close()
+
+    rate = scored / elapsed if elapsed else 0.0
+    print(f"{scored} reviews scored in {elapsed:.1f} s, {skipped} skipped as already scored or repeated")
+    print(f"{rate:.1f} reviews/s over {args.workers} workers, {rate / args.workers:.1f} reviews/s per core")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+from array import array
+from itertools import islice
+
+# extend() adds rows a chunk of this many at a time
+CHUNK = 65536
+
+
+class RecordTable:
+    """Rows of one table kept in slots and addressed by stable integer ids.
+
+    Every column is indexed by slot and slot_of maps a record id to its slot
+    (-1 once deleted), so reading, editing or deleting a record is an array
+    lookup instead of a scan, and nothing is copied or renumbered when a
+    record goes away. Freed slots are reused by later inserts. Ids only grow,
+    so iterating them in order gives the records in insertion order, which is
+    the order they are stored and shown in.
+
+    Columns are plain lists unless kinds gives a compact type from columns.py
+    for them, e.g. {'Year': YearColumn}; either way they read and write text.
+
+    Every record also has a version, which changes whenever it is written,
+    so a caller holding an id and a version can tell whether the record is
+    still the one it read. Versions come from a clock that only goes up;
+    records loaded together share the clock value the table starts from.
+    """
+
+    def __init__(self, columns, kinds=None, clock=0):
+        self.columns = list(columns)
+        self.kinds = dict(kinds or {})
+        self.data = {column: self.kinds.get(column, list)() for column in self.columns}
+        self.slot_of = array('i')   # record id -> slot, -1 if there's no such record
+        self.free = []              # slots of deleted records
+        self.count = 0
+        self.versions = array('i')  # slot -> version
+        self.clock = clock
+
+    @property
+    def next_id(self):
+        return len(self.slot_of)
+
+    @classmethod
+    def from_rows(cls, columns, rows, ids=None, kinds=None, clock=0):
+        """Build a table from rows, given increasing ids or numbered from 0."""
+        rows = list(rows)
+        values = zip(*rows) if rows else [()] * len(columns)
+        return cls.from_columns(columns, dict(zip(columns, values)), len(rows), ids, kinds, clock)
+
+    @classmethod
+    def from_columns(cls, columns, values, size, ids=None, kinds=None, clock=0):
+        """Build a table of size records from an iterable of values per column."""
+        table = cls(columns, kinds, clock)
+        table.versions = array('i', [clock]) * size
+        for column in table.columns:
+            table.data[column] = table.kinds.get(column, list)(values[column])
+        if ids is None:
+            table.slot_of = array('i', range(size))
+        else:
+            for slot, record_id in enumerate(ids):
+                if record_id < len(table.slot_of):
+                    raise ValueError(f"record ids must increase, got {record_id} after {len(table.slot_of) - 1}")
+                table.slot_of.extend([-1] * (record_id - len(table.slot_of)))
+                table.slot_of.append(slot)
+        table.count = size
+        return table
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (record_id for record_id, slot in enumerate(self.slot_of) if slot >= 0)
+
+    def __contains__(self, record_id):
+        return 0 <= record_id < len(self.slot_of) and self.slot_of[record_id] >= 0
+
+    def _slot(self, record_id):
+        if not 0 <= record_id < len(self.slot_of) or self.slot_of[record_id] < 0:
+            raise KeyError(record_id)
+        return self.slot_of[record_id]
+
+    def value(self, record_id, column):
+        return self.data[column][self._slot(record_id)]
+
+    def version(self, record_id):
+        return self.versions[self._slot(record_id)]
+
+    def values(self, record_ids, column):
+        """The column's value for each of record_ids."""
+        values = self.data[column]
+        return [values[self._slot(record_id)] for record_id in record_ids]
+
+    def row(self, record_id):
+        slot = self._slot(record_id)
+        return [self.data[column][slot] for column in self.columns]
+
+    def record(self, record_id):
+        """The record as a dict of column -> value."""
+        return dict(zip(self.columns, self.row(record_id)))
+
+    def rows(self):
+        """Every row, in order."""
+        data = [self.data[column] for column in self.columns]
+        for slot in self.slot_of:
+            if slot >= 0:
+                yield [values[slot] for values in data]
+
+    def items(self):
+        """(record id, row) for every record, in order."""
+        return zip(self, self.rows())
+
+    def insert(self, row, record_id=None):
+        """Store row and return its id, which must be new and above every existing id."""
+        if record_id is None:
+            record_id = self.next_id
+        if record_id < self.next_id:
+            raise ValueError(f"record id {record_id} is already taken")
+        self.clock += 1
+        if self.free:
+            slot = self.free.pop()
+            for column, value in zip(self.columns, row):
+                self.data[column][slot] = value
+            self.versions[slot] = self.clock
+        else:
+            slot = len(self.data[self.columns[0]])
+            for column, value in zip(self.columns, row):
+                self.data[column].append(value)
+            self.versions.append(self.clock)
+        self.slot_of.extend([-1] * (record_id - self.next_id))
+        self.slot_of.append(slot)
+        self.count += 1
+        return record_id
+
+    def extend(self, rows):
+        """Store rows under new ids from next_id on and return the range of those ids.
+
+        Each chunk of rows goes into the columns a column at a time, as in
+        from_columns, which is far quicker than inserting them one by one.
+        Freed slots are left for later inserts.
+        """
+        first = self.next_id
+        self.clock += 1
+        rows = iter(rows)
+        while chunk := list(islice(rows, CHUNK)):
+            slot = len(self.versions)
+            for column, values in zip(self.columns, zip(*chunk)):
+                self.data[column].extend(values)
+            self.slot_of.extend(range(slot, slot + len(chunk)))
+            self.versions.extend(array('i', [self.clock]) * len(chunk))
+            self.count += len(chunk)
+        return range(first, self.next_id)
+
+    def delete(self, record_id):
+        """Remove the record and return its row."""
+        row = self.row(record_id)
+        slot = self._slot(record_id)
+        self.slot_of[record_id] = -1
+        for column in self.columns:
+            # Don't keep the old values alive in a free slot
+            self.data[column][slot] = None
+        self.free.append(slot)
+        self.count -= 1
+        return row
+
+    def update(self, record_id, row):
+        """Replace the record's values and return the old row."""
+        old = self.row(record_id)
+        slot = self._slot(record_id)
+        for column, value in zip(self.columns, row):
+            self.data[column][slot] = value
+        self.clock += 1
+        self.versions[slot] = self.clock
+        return old
+
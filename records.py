@@ -0,0 +1,243 @@
+"""The record format of the library's text files.
+
+A file starts with a line naming the format and its version, then a header
+with each column's name and type (int, year, date or text), then a record
+per row in CSV: fields are separated by commas, and a field with a comma,
+quote or line break in it is quoted, with its quotes doubled. For example:
+
+    #library-records 2
+    Book ID:int,Title:text,Author:text,Year:year,Copies:int,Available:int
+    0,"Crime, and Punishment",Fyodor Dostoevsky,1866,2,2
+
+The types say how fields are meant to be read, e.g. by other tools; the
+library keeps any field that doesn't fit its type as text, as before.
+Files are parsed and written by the csv module, whose parser is C code, a
+whole file or chunk at a time.
+
+Files from before the format have no header and split their fields on every
+comma (and reviews.txt on the first colon), so a comma in a title broke the
+line. They are still read, and migrate_records.py rewrites them.
+"""
+import csv
+import gc
+import io
+from contextlib import contextmanager
+from itertools import islice
+
+MAGIC = '#library-records'
+FORMAT_VERSION = 2
+CHUNK = 10000           # rows formatted at a time
+REVIEW_COLUMNS = ['Title', 'Review']
+
+
+@contextmanager
+def gc_paused():
+    """Pause the cyclic garbage collector while building many small objects.
+
+    Parsing makes a list per line, and the collector would otherwise keep
+    rescanning every one of them as the lists pile up.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def read_records(path, width):
+    """Parse a file of records with width fields each, usually in one pass.
+
+    Returns the well-formed rows as lists of fields and the malformed lines as
+    (line_number, line) pairs, so callers can report them instead of failing
+    on the first bad line. Blank lines are skipped. Raises ValueError for a
+    file in a newer version of the format than this one.
+    """
+    with open(path, 'r', newline='', encoding='utf-8') as f, gc_paused():
+        version = read_version(f.readline(), path)
+        if version is None:
+            f.seek(0)
+            return _read_split(f, width)
+        # The column header
+        f.readline()
+        start = f.tell()
+        try:
+            rows = list(csv.reader(f))
+        except csv.Error:
+            rows = None
+        if rows == [] or rows and min(map(len, rows)) == width == max(map(len, rows)):
+            return rows, []
+        # A blank line, a record with the wrong number of fields or one the
+        # csv module can't parse: go through the file again, a record at a
+        # time, to tell which lines they are
+        f.seek(start)
+        return _read_quoted(f, width, first_line=3)
+
+
+def read_version(line, path):
+    """The format version the first line of a file names, or None for a file from before the format."""
+    if not line.startswith(MAGIC):
+        return None
+    try:
+        version = int(line[len(MAGIC):])
+    except ValueError:
+        version = None
+    if version is None or version > FORMAT_VERSION:
+        raise ValueError(f"{path} is in a newer record format ({line.strip()}) than this version "
+                         f"of the library reads ({MAGIC} {FORMAT_VERSION})")
+    return version
+
+
+def file_version(path):
+    """The record format of the file at path: 1 for files from before the header, None if it is missing or empty."""
+    try:
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            first = f.readline()
+    except FileNotFoundError:
+        return None
+    return (read_version(first, path) or 1) if first else None
+
+
+def _read_split(f, width):
+    # The format from before the header: every comma separates fields
+    rows = []
+    malformed = []
+    append = rows.append
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        fields = line.split(',')
+        if len(fields) == width:
+            append(fields)
+        else:
+            malformed.append((line_number, line))
+    return rows, malformed
+
+
+def _read_quoted(f, width, first_line):
+    rows = []
+    malformed = []
+    reader = csv.reader(f)
+    line_number = first_line
+    while True:
+        try:
+            fields = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as error:
+            malformed.append((line_number, str(error)))
+            line_number = first_line + reader.line_num
+            continue
+        if len(fields) == width:
+            rows.append(fields)
+        elif fields:
+            malformed.append((line_number, format_record(fields).rstrip('\n')))
+        # Where the next record starts; a quoted field may span lines
+        line_number = first_line + reader.line_num
+    return rows, malformed
+
+
+def format_header(columns, types=None):
+    """The first two lines of a file of the columns; types maps a column to its type, text by default."""
+    types = types or {}
+    return f"{MAGIC} {FORMAT_VERSION}\n" + format_record([f"{column}:{types.get(column, 'text')}"
+                                                          for column in columns])
+
+
+def format_record(fields):
+    """One record as a line of the format, quoted where needed."""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerow(fields)
+    return buffer.getvalue()
+
+
+def format_records(rows, columns, types=None):
+    """Yield the text of a file of rows, the header first and then CHUNK rows at a time."""
+    yield format_header(columns, types)
+    width = len(columns)
+    rows = iter(rows)
+    while chunk := list(islice(rows, CHUNK)):
+        try:
+            text = '\n'.join(map(','.join, chunk)) + '\n'
+        except TypeError:
+            # Numbers among the fields, which the csv module writes too
+            text = None
+        # Usually no field needs quoting, which a count of the separators
+        # shows for the whole chunk at once
+        if (text is not None and text.count(',') == len(chunk) * (width - 1) and text.count('\n') == len(chunk)
+                and '"' not in text and '\r' not in text):
+            yield text
+        else:
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator='\n').writerows(chunk)
+            yield buffer.getvalue()
+
+
+def data_start(file):
+    """Read past the header of a file opened in binary at its start; returns whether it has one.
+
+    For the reviews file, whose records are found by their byte offsets
+    (see scan_records) instead of being parsed all at once.
+    """
+    first = file.readline()
+    if read_version(first.decode('utf-8', 'replace'), file.name) is None:
+        file.seek(0)
+        return False
+    file.readline()
+    return True
+
+
+def scan_records(file, quoted):
+    """Yield (offset, end, record) for each complete record of a binary file or mmap from its position on.
+
+    A quoted field may span lines, so a record ends at the first line end
+    after an even number of quotes. A record cut off by a crash, or still
+    being written, has no line end after it yet and is left out.
+    """
+    offset = file.tell()
+    lines = []
+    quotes = 0
+    # readline rather than iterating, which an mmap doesn't do by line
+    for line in iter(file.readline, b''):
+        if not line.endswith(b'\n'):
+            break
+        if quoted:
+            quotes += line.count(b'"')
+            if quotes % 2:
+                lines.append(line)
+                continue
+            if lines:
+                lines.append(line)
+                line = b''.join(lines)
+                lines, quotes = [], 0
+        yield offset, offset + len(line), line
+        offset += len(line)
+
+
+def parse_review(record, quoted):
+    """(title, review) of a record of the reviews file, without surrounding spaces, or None if it has no review."""
+    if not quoted:
+        if b':' not in record:
+            return None
+        title, review = record.split(b':', 1)
+    elif b'"' not in record:
+        if b',' not in record:
+            return None
+        title, review = record.split(b',', 1)
+    else:
+        try:
+            fields = next(csv.reader([record.decode('utf-8', 'replace')]), [])
+        except csv.Error:
+            return None
+        return (fields[0].strip(), fields[1].strip()) if len(fields) == 2 else None
+    return title.decode('utf-8', 'replace').strip(), review.decode('utf-8', 'replace').strip()
+
+
+def describe_malformed(path, malformed, limit=10):
+    """Build a short user-facing message listing skipped lines."""
+    lines = [f"line {line_number}: {line}" for line_number, line in malformed[:limit]]
+    if len(malformed) > limit:
+        lines.append(f"... and {len(malformed) - limit} more")
+    return f"Skipped {len(malformed)} malformed line(s) in {path}:\n" + "\n".join(lines)
@@ -0,0 +1,128 @@
+"""Loan reports from the command line, without opening the library window.
+
+    python report.py overdue [--date 2024-10-20]    # loans due before the date (default today)
+    python report.py due [--days 7]                 # loans due within the next days
+    python report.py borrower "Jane Doe"            # a borrower's outstanding loans, by name, email or phone
+    python report.py statistics [--format json]     # the Statistics tab's report (see analytics.py)
+
+Only the catalog records, loans and borrowers are loaded, without the search
+index, and the due-date index answers each query with a binary search. The
+statistics take sentiment by author from --sentiment-cache, the scores lib.py
+(--model vader) or libBERT.py (--model bert) have stored; as JSON they go to
+--output or stdout, as CSV one file per table into the --output directory.
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+from analytics import TOP, Snapshot, format_table, report, review_scores, slug, write_csv, write_json
+from library import Library, STORAGE_BACKEND
+from sentiment import BERT_MODEL, VADER_MODEL_ID, ScoreCache
+
+MODEL_IDS = {'vader': VADER_MODEL_ID, 'bert': BERT_MODEL}
+
+
+def format_loans(library, loan_ids, today):
+    """One line per loan: return date, how late it is, borrower and title."""
+    loans = library.borrowed_books
+    borrower_ids = map(int, loans.values(loan_ids, 'Borrower ID'))
+    borrowers = library.borrowers.table.values(borrower_ids, 'Borrower')
+    titles = library.book_data.values(map(int, loans.values(loan_ids, 'Book ID')), 'Title')
+    today = today.toordinal()
+    lines = []
+    for loan_id, return_date, borrower, title in zip(loan_ids, loans.values(loan_ids, 'Return Date'),
+                                                      borrowers, titles):
+        days = today - library.due_index.due_day(loan_id)
+        if days > 0:
+            status = f"{days} day(s) overdue"
+        elif days == 0:
+            status = "due today"
+        else:
+            status = f"due in {-days} day(s)"
+        lines.append(f"{return_date.strip()}  {status:<20}  {borrower.strip()}  {title.strip()}")
+    return lines
+
+
+def write_statistics(tables, form, output):
+    """Print or save the statistics report in form ('text', 'json' or 'csv')."""
+    if form == 'csv':
+        os.makedirs(output, exist_ok=True)
+        for name, table in tables.items():
+            with open(os.path.join(output, slug(name) + '.csv'), 'w', newline='', encoding='utf-8') as file:
+                write_csv(table, file)
+    elif form == 'json':
+        if output:
+            with open(output, 'w', encoding='utf-8') as file:
+                write_json(tables, file)
+        else:
+            write_json(tables, sys.stdout)
+            sys.stdout.write('\n')
+    else:
+        sys.stdout.write('\n\n'.join(f"{name}\n{format_table(table)}" for name, table in tables.items()) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('report', choices=['overdue', 'due', 'borrower', 'statistics'])
+    parser.add_argument('borrower', nargs='?', help="borrower name, email or phone, for the borrower report")
+    parser.add_argument('--date', type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="the day to report for (YYYY-MM-DD)")
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--dir', default='.', help="directory holding the library files")
+    parser.add_argument('--backend', default=STORAGE_BACKEND, choices=['text', 'sqlite'])
+    parser.add_argument('--format', default='text', choices=['text', 'json', 'csv'], help="for the statistics")
+    parser.add_argument('--output', help="statistics file (JSON) or directory (CSV)")
+    parser.add_argument('--top', type=int, default=TOP, help="rows in the ranked statistics, 0 for all")
+    parser.add_argument('--sentiment-cache', default='sentiment_cache.db',
+                        help="scores for the sentiment by author, left out if there's no such file")
+    parser.add_argument('--model', default='vader', choices=list(MODEL_IDS), help="whose scores to use")
+    args = parser.parse_args(argv)
+    if args.report == 'borrower' and not args.borrower:
+        parser.error("the borrower report needs a borrower name")
+    if args.format == 'csv' and not args.output:
+        parser.error("CSV statistics need an --output directory")
+
+    started = time.perf_counter()
+    library = Library.open(args.dir, args.backend)
+    malformed = library.load_loans()
+    loaded = time.perf_counter()
+
+    if args.report == 'statistics':
+        reviews = scores = None
+        if os.path.exists(args.sentiment_cache):
+            cache = ScoreCache(args.sentiment_cache)
+            reviews, scores = review_scores(library, cache, MODEL_IDS[args.model])
+            cache.close()
+        tables = report(Snapshot(library, args.date), reviews, scores, args.top)
+        library.storage.close()
+        write_statistics(tables, args.format, args.output)
+        print(f"{len(library.borrowed_books)} loans; loaded in {loaded - started:.2f} s, "
+              f"reported in {time.perf_counter() - loaded:.2f} s", file=sys.stderr)
+        return
+
+    if args.report == 'overdue':
+        loan_ids = library.overdue(args.date)
+    elif args.report == 'due':
+        loan_ids = library.due_within(args.days, args.date)
+    else:
+        # A name can belong to several borrowers
+        loan_ids = sorted((loan_id for borrower_id in library.borrowers.lookup(args.borrower)
+                           for loan_id in library.outstanding(borrower_id)), key=library.due_index.due_day)
+    lines = format_loans(library, loan_ids, args.date)
+    library.storage.close()
+
+    if lines:
+        sys.stdout.write('\n'.join(lines) + '\n')
+    finished = time.perf_counter()
+    # Timings go to stderr so the report itself can be redirected
+    print(f"{len(lines)} of {len(library.borrowed_books)} loans; loaded in {loaded - started:.2f} s, "
+          f"reported in {finished - loaded:.2f} s", file=sys.stderr)
+    for table, skipped in malformed.items():
+        if skipped:
+            print(f"{len(skipped)} malformed {table} line(s) skipped", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,531 @@
+import json
+import os
+import sqlite3
+import uuid
+from contextlib import contextmanager
+
+from journal import Journal, apply_records
+from records import (REVIEW_COLUMNS, data_start, file_version, format_header, format_record, format_records,
+                     parse_review, read_records, scan_records)
+from review_index import ReviewIndex
+from search_index import file_signature
+
+# One catalog record per title, however many copies the library has of it
+BOOK_COLUMNS = ['Book ID', 'Title', 'Author', 'Year', 'Copies', 'Available']
+# Loans refer to a borrower in the patrons table and a book in the catalog by id
+LOAN_COLUMNS = ['Borrower ID', 'Book ID', 'Borrow Date', 'Return Date']
+PATRON_COLUMNS = ['Borrower ID', 'Borrower', 'Borrower Email', 'Borrower Phone']
+# Loans that have ended, as they were, with the day the copy came back
+HISTORY_COLUMNS = LOAN_COLUMNS + ['Returned On']
+# Books and loans as they were stored before the catalog, with a row per copy
+# and the book's fields on every loan
+LEGACY_BOOK_COLUMNS = ['Title', 'Author', 'Year']
+LEGACY_LOAN_COLUMNS = ['Borrower ID', 'Title', 'Author', 'Year', 'Borrow Date', 'Return Date']
+# Loans as they were stored before the patrons table, with the borrower on every row
+BORROWER_COLUMNS = ['Borrower', 'Borrower Email', 'Borrower Phone', 'Title', 'Author', 'Year', 'Borrow Date', 'Return Date']
+
+# Types of the columns that aren't text, for the header of the text files (see records.py)
+COLUMN_TYPES = {'Book ID': 'int', 'Borrower ID': 'int', 'Year': 'year', 'Copies': 'int', 'Available': 'int',
+                'Borrow Date': 'date', 'Return Date': 'date', 'Returned On': 'date'}
+
+# Tables whose rows start with an id the instance inserting them picks
+KEYED_TABLES = ('books', 'patrons')
+
+COMPACT_EVERY = 1000  # journal records before they are folded into the text files
+CHANGE_LOG_SIZE = 10000  # changes the SQLite backend keeps for other instances to catch up on
+LOOKUP_CHUNK = 500  # rowids per SELECT, under SQLite's variable limit
+
+# Columns the SQLite backend keeps an index on, wherever a table has them
+INDEXED_COLUMNS = ('book_id', 'title', 'author', 'borrower', 'borrower_id', 'borrower_email', 'borrower_phone',
+                   'return_date')
+
+
+class ConflictError(Exception):
+    """Another instance changed the records a change depends on, so it wasn't saved."""
+
+
+def check_conflicts(changes, foreign):
+    """Raise ConflictError if changes delete or update a row that foreign records did.
+
+    foreign are the journal records of other instances that this one hasn't
+    seen. Rows are matched by their text, like the journal does; a book or
+    patron inserted under an id someone else just took conflicts too.
+    """
+    if not foreign:
+        return
+    taken = {(record['table'], tuple(record['row'])) for record in foreign if record['op'] != 'insert'}
+    keys = {(record['table'], record['row'][0]) for record in foreign
+            if record['table'] in KEYED_TABLES and record['op'] == 'insert'}
+    for table, op, row, new in changes:
+        if op != 'insert' and (table, tuple(row)) in taken:
+            raise ConflictError(f"Another instance changed this {table} record first: {', '.join(row)}")
+        if op == 'insert' and (table, row[0]) in keys:
+            raise ConflictError(f"Another instance added {table} record {row[0]} first")
+
+
+class TextRepository:
+    """The original books.txt/borrowers.txt/reviews.txt files, in the record format of records.py.
+
+    files maps a table name to its text file and tables maps it to its column
+    names. Changes go through a Journal and are folded back into the text files
+    by compact(), which needs the current rows of every table. Reviews are
+    looked up through a ReviewIndex kept next to the reviews file.
+
+    Other instances may use the same files; commit() refuses changes that
+    conflict with theirs and poll() hands over what they saved.
+    """
+
+    def __init__(self, files, tables, journal_path, review_path):
+        self.files = files
+        self.tables = tables
+        self.review_path = review_path
+        self.review_index_path = os.path.splitext(review_path)[0] + '.idx'
+        self.review_index = None  # opened on the first lookup
+        self.journal = Journal(journal_path)
+
+    def exists(self, table):
+        return os.path.exists(self.files[table])
+
+    def load(self, table, width=None):
+        """Return the rows of table (snapshot plus journal) and any malformed lines.
+
+        width overrides the number of fields a row must have, for reading
+        files saved in an older layout.
+        """
+        path = self.files[table]
+        # Locked, so no other instance is halfway through replacing the file
+        with self.journal.lock():
+            self.journal.catch_up()
+            try:
+                rows, malformed = read_records(path, width or len(self.tables[table]))
+            except FileNotFoundError:
+                rows, malformed = [], []
+            return apply_records(rows, self.journal.pending(table, path)), malformed
+
+    def signature(self, table):
+        """Changes whenever the stored rows change, None while there are unsaved changes."""
+        path = self.files[table]
+        if self.journal.pending(table, path) or not os.path.exists(path):
+            return None
+        return file_signature(path)
+
+    def commit(self, changes):
+        """Save changes, (table, op, row, new) tuples, as one journal record: all or nothing.
+
+        Raises ConflictError and saves nothing if another instance got to
+        the same records first (see check_conflicts), or compacted the files
+        since this one last called poll().
+        """
+        with self.journal.lock():
+            self.journal.catch_up()
+            if self.journal.stale:
+                raise ConflictError("Another instance rewrote the library files")
+            check_conflicts(changes, self.journal.foreign)
+            self.journal.append_many(changes)
+
+    def poll(self):
+        """(records, 0, None): the journal records other instances saved since the last call.
+
+        records is None if they can't be replayed one by one, because
+        another instance compacted the files, and every table has to be
+        loaded again. The 0 and None are for the changes of this instance
+        that were dropped and why, which commit() raises about instead.
+        """
+        return self.journal.take_foreign(), 0, None
+
+    def begin_reading(self):
+        """Keep other instances from writing until end_reading(), e.g. while loading every table."""
+        self.journal.acquire()
+        # Whatever others saved so far is part of what is about to be read
+        self.journal.take_foreign()
+
+    def end_reading(self):
+        self.journal.release()
+
+    def stored_rows(self):
+        """The rows of every table as stored: the files with the journal replayed on top."""
+        return {table: self.load(table)[0] for table in self.tables}
+
+    def compact(self, snapshot=None):
+        """Write every table returned by snapshot() to its file and empty the journal.
+
+        Without a snapshot, the stored rows are written, which is slower but
+        doesn't depend on anything outside the repository.
+        """
+        with self.journal.lock():
+            self.journal.catch_up()
+            if self.journal.stale or self.journal.foreign:
+                # The tables in memory are missing what other instances saved
+                snapshot = None
+            for table, rows in (snapshot or self.stored_rows)().items():
+                self.journal.write_snapshot(table, self.files[table],
+                                            format_records(rows, self.tables[table], COLUMN_TYPES))
+            self.journal.truncate()
+
+    def replace_table(self, table, rows, snapshot):
+        """Store rows as the whole of table, for changes too big for the journal, e.g. an import.
+
+        Every file is rewritten, with the other tables as snapshot() has
+        them, and the journal emptied, as compact() does; other instances
+        then load everything again. Raises ConflictError and writes nothing
+        if another instance saved changes this one hasn't caught up with.
+        """
+        with self.journal.lock():
+            self.journal.catch_up()
+            if self.journal.stale or self.journal.foreign:
+                raise ConflictError("Another instance changed the library first")
+            self.compact(lambda: {**snapshot(), table: rows})
+
+    def compact_if_needed(self, snapshot):
+        # Call once an operation is fully applied and journaled
+        if len(self.journal) >= COMPACT_EVERY:
+            self.compact(snapshot)
+
+    def sync(self):
+        self.journal.sync()
+
+    def batch(self):
+        """Context manager that writes the changes made inside in one go."""
+        return self.journal.batch()
+
+    def flush(self, snapshot):
+        """Fold any journaled changes into the text files."""
+        if len(self.journal):
+            self.compact(snapshot)
+
+    def close(self):
+        self.journal.close()
+        if self.review_index is not None:
+            self.review_index.save()
+
+    def iter_reviews(self):
+        """Yield (title, review) for every record of the reviews file."""
+        try:
+            with open(self.review_path, 'rb') as file:
+                quoted = data_start(file)
+                for _, _, record in scan_records(file, quoted):
+                    review = parse_review(record, quoted)
+                    if review is not None:
+                        yield review
+        except FileNotFoundError:
+            return
+
+    def reviews(self):
+        """Every (title, review), read to the end."""
+        return list(self.iter_reviews())
+
+    def upgrade_reviews(self):
+        """Rewrite a reviews file from before the record format in it; returns how many reviews it has.
+
+        Returns None if the file is in the format already, or missing. The
+        rewritten file is a new one, so review indexes and prescore.py's
+        progress start over.
+        """
+        with self.journal.lock():
+            if file_version(self.review_path) != 1:
+                return None
+            reviews = self.reviews()
+            tmp_path = self.review_path + '.tmp'
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as file:
+                file.writelines(format_records(reviews, REVIEW_COLUMNS))
+            os.replace(tmp_path, self.review_path)
+        if self.review_index is not None:
+            self.review_index.catch_up()
+        return len(reviews)
+
+    def _reviews(self):
+        # Opened on the first lookup, and caught up on every later one with
+        # the reviews other instances added since
+        if self.review_index is None:
+            self.review_index = ReviewIndex.open(self.review_path, self.review_index_path)
+        elif self.review_index.grown():
+            self.review_index.catch_up()
+        return self.review_index
+
+    def reviews_for(self, title, positions=None):
+        return self._reviews().reviews_for(title, positions)
+
+    def review_count(self, title):
+        return self._reviews().count(title)
+
+    def add_review(self, title, review):
+        # Locked throughout, so another instance can't upgrade the file, or
+        # start it with its header, between the check and the append
+        with self.journal.lock():
+            legacy = file_version(self.review_path) == 1
+            if legacy and (':' in title or any(end in title + review for end in '\r\n')):
+                # A file from before the record format can't hold this review
+                self.upgrade_reviews()
+                legacy = False
+            with open(self.review_path, 'a', newline='', encoding='utf-8') as file:
+                if file.tell() == 0:
+                    file.write(format_header(REVIEW_COLUMNS))
+                file.write(f"{title}:{review}\n" if legacy else format_record([title, review]))
+        if self.review_index is not None:
+            self.review_index.catch_up()
+
+
+class SqliteRepository:
+    """SQLite database in WAL mode with the same tables as the text files.
+
+    Rows keep their insertion order through SQLite's rowid, and the title,
+    author, borrower and return date columns are indexed so deletes, updates
+    and review lookups don't scan whole tables.
+
+    Every change is also logged in the changes table, under the id of the
+    instance that made it, for other instances sharing the database to catch
+    up on with poll().
+    """
+
+    def __init__(self, path, tables):
+        self.path = path
+        self.tables = tables
+        self.existed = os.path.exists(path)
+        self.batching = False
+        self.batched = 0
+        self.reading = False
+        self.instance = uuid.uuid4().hex
+        # A StorageWriter opens the repository on one thread and uses it on
+        # another, never from two at once
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.columns = {table: [sql_name(column) for column in columns] for table, columns in tables.items()}
+        with self.conn:
+            for table, columns in self.columns.items():
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(c + ' TEXT' for c in columns)})")
+                stored = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+                if stored != columns:
+                    raise ValueError(f"The {table} table in {path} has the columns {stored}, expected {columns}. "
+                                     f"Export it with: python migrate_storage.py to-text --legacy")
+                for column in INDEXED_COLUMNS:
+                    if column in columns:
+                        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
+            # Reviews are matched case-insensitively, like the text file
+            self.conn.execute("CREATE TABLE IF NOT EXISTS reviews (title TEXT, review TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS reviews_title_nocase ON reviews (title COLLATE NOCASE)")
+            self.columns['reviews'] = ['title', 'review']
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (version INTEGER)")
+            if self.conn.execute("SELECT COUNT(*) FROM meta").fetchone()[0] == 0:
+                self.conn.execute("INSERT INTO meta VALUES (0)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS changes (id INTEGER PRIMARY KEY, instance TEXT, ops TEXT)")
+        # Changes up to here are in whatever this instance loads
+        self.seen = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM changes").fetchone()[0]
+
+    def exists(self, table):
+        return self.existed
+
+    def load(self, table):
+        columns = ', '.join(self.columns[table])
+        return [list(row) for row in self.conn.execute(f"SELECT {columns} FROM {table} ORDER BY rowid")], []
+
+    def signature(self, table):
+        return self.conn.execute("SELECT version FROM meta").fetchone()[0]
+
+    def _match(self, table):
+        return ' AND '.join(f"{column} IS ?" for column in self.columns[table])
+
+    def commit(self, changes):
+        """Save changes, (table, op, row, new) tuples, in one transaction: all or nothing.
+
+        Raises ConflictError and saves nothing if a row to delete or update
+        is no longer there, or a new book's or patron's id is already taken,
+        because another instance got there first.
+        """
+        self._begin()
+        self.conn.execute("SAVEPOINT change")
+        try:
+            for table, op, row, new in changes:
+                if op == 'insert':
+                    if table in KEYED_TABLES and self.conn.execute(
+                            f"SELECT 1 FROM {table} WHERE {self.columns[table][0]} = ?", (str(row[0]),)).fetchone():
+                        raise ConflictError(f"Another instance added {table} record {row[0]} first")
+                    sql, params = f"INSERT INTO {table} VALUES ({', '.join('?' * len(row))})", row
+                elif op == 'delete':
+                    sql, params = (f"DELETE FROM {table} WHERE rowid = "
+                                   f"(SELECT rowid FROM {table} WHERE {self._match(table)} LIMIT 1)"), row
+                else:
+                    assignments = ', '.join(f"{column} = ?" for column in self.columns[table])
+                    sql, params = (f"UPDATE {table} SET {assignments} WHERE rowid = "
+                                   f"(SELECT rowid FROM {table} WHERE {self._match(table)} LIMIT 1)"), list(new) + list(row)
+                cursor = self.conn.execute(sql, [str(value) for value in params])
+                if op != 'insert' and cursor.rowcount != 1:
+                    raise ConflictError(f"Another instance changed this {table} record first: {', '.join(row)}")
+            ops = [{'table': table, 'op': op, 'row': list(map(str, row)),
+                    **({'new': list(map(str, new))} if new is not None else {})}
+                   for table, op, row, new in changes]
+            self.conn.execute("INSERT INTO changes (instance, ops) VALUES (?, ?)", (self.instance, json.dumps(ops)))
+        except BaseException:
+            self.conn.execute("ROLLBACK TO change")
+            self.conn.execute("RELEASE change")
+            if not self.batching:
+                self.conn.rollback()
+            raise
+        self.conn.execute("RELEASE change")
+        self._written()
+
+    def _write(self, sql, params):
+        self._begin()
+        self.conn.execute(sql, [str(value) for value in params])
+        self._written()
+
+    def _begin(self):
+        if not self.conn.in_transaction:
+            # Take the write lock now rather than at the first write, so
+            # another instance can't change the rows in between
+            self.conn.execute("BEGIN IMMEDIATE")
+
+    def _written(self):
+        self.batched += 1
+        if not self.batching:
+            self._commit()
+
+    def _commit(self):
+        if self.batched:
+            self.conn.execute("UPDATE meta SET version = version + 1")
+            self.conn.execute("DELETE FROM changes WHERE id <= (SELECT MAX(id) FROM changes) - ?", (CHANGE_LOG_SIZE,))
+            self.batched = 0
+        self.conn.commit()
+
+    @contextmanager
+    def batch(self):
+        """Commit the changes made inside as one transaction, with a single version bump."""
+        self.batching = True
+        try:
+            yield
+        finally:
+            self.batching = False
+            if self.conn.in_transaction and not self.reading:
+                self._commit()
+
+    def poll(self):
+        """(records, 0, None): the changes other instances saved since the last call, as journal records.
+
+        records is None if some have already been pruned from the change
+        log, and every table has to be loaded again.
+        """
+        first, last = self.conn.execute("SELECT MIN(id), MAX(id) FROM changes").fetchone()
+        if last is None or last <= self.seen:
+            return [], 0, None
+        if first > self.seen + 1:
+            self.seen = last
+            return None, 0, None
+        records = []
+        for change_id, instance, ops in self.conn.execute(
+                "SELECT id, instance, ops FROM changes WHERE id > ? ORDER BY id", (self.seen,)).fetchall():
+            self.seen = change_id
+            if instance == self.instance:
+                continue
+            if ops is None:
+                self.seen = last
+                return None, 0, None
+            records.extend(dict(op, seq=change_id) for op in json.loads(ops))
+        return records, 0, None
+
+    def begin_reading(self):
+        """Read every table from one snapshot of the database until end_reading()."""
+        if self.reading:
+            return
+        if self.conn.in_transaction:
+            # Changes of the batch so far go first
+            self._commit()
+        self.conn.execute("BEGIN")
+        self.reading = True
+        # Whatever others saved so far is part of what is about to be read
+        self.poll()
+
+    def end_reading(self):
+        if self.reading:
+            self.reading = False
+            self.conn.commit()
+
+    def insert_many(self, table, rows):
+        """Bulk load rows in one transaction, e.g. when importing the text files."""
+        placeholders = ', '.join('?' * len(self.columns[table]))
+        with self.conn:
+            self.conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+            self.conn.execute("UPDATE meta SET version = version + 1")
+            # Other instances can't catch up on a bulk load; no ops makes them load everything again
+            self.conn.execute("INSERT INTO changes (instance, ops) VALUES (?, NULL)", (self.instance,))
+
+    def replace_table(self, table, rows, snapshot=None):
+        """Store rows as the whole of table in one transaction; see TextRepository.replace_table."""
+        self._begin()
+        self.conn.execute("SAVEPOINT change")
+        try:
+            if self.conn.execute("SELECT 1 FROM changes WHERE id > ? AND instance != ? LIMIT 1",
+                                 (self.seen, self.instance)).fetchone():
+                raise ConflictError("Another instance changed the library first")
+            self.conn.execute(f"DELETE FROM {table}")
+            placeholders = ', '.join('?' * len(self.columns[table]))
+            self.conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})",
+                                  ([str(value) for value in row] for row in rows))
+            # Other instances can't catch up on this one by one; no ops makes them load everything again
+            self.conn.execute("INSERT INTO changes (instance, ops) VALUES (?, NULL)", (self.instance,))
+        except BaseException:
+            self.conn.execute("ROLLBACK TO change")
+            self.conn.execute("RELEASE change")
+            if not self.batching:
+                self.conn.rollback()
+            raise
+        self.conn.execute("RELEASE change")
+        self._written()
+
+    def compact_if_needed(self, snapshot):
+        pass
+
+    def sync(self):
+        pass
+
+    def flush(self, snapshot):
+        pass
+
+    def close(self):
+        self.conn.close()
+
+    def iter_reviews(self):
+        return iter(self.conn.execute("SELECT title, review FROM reviews ORDER BY rowid"))
+
+    def reviews(self):
+        return list(self.iter_reviews())
+
+    def reviews_for(self, title, positions=None):
+        query = "SELECT {} FROM reviews WHERE title = ? COLLATE NOCASE ORDER BY rowid"
+        if positions is None:
+            return [review for review, in self.conn.execute(query.format('review'), (title.strip(),))]
+        positions = list(positions)
+        if not positions:
+            return []
+        if positions == list(range(positions[0], positions[0] + len(positions))):
+            # A page in stored order
+            rows = self.conn.execute(query.format('review') + " LIMIT ? OFFSET ?",
+                                     (title.strip(), len(positions), positions[0]))
+            return [review for review, in rows]
+        rowids = [rowid for rowid, in self.conn.execute(query.format('rowid'), (title.strip(),))]
+        wanted = [rowids[position] for position in positions if position < len(rowids)]
+        reviews = {}
+        for start in range(0, len(wanted), LOOKUP_CHUNK):
+            chunk = wanted[start:start + LOOKUP_CHUNK]
+            reviews.update(self.conn.execute(f"SELECT rowid, review FROM reviews WHERE rowid IN "
+                                             f"({', '.join('?' * len(chunk))})", chunk))
+        return [reviews[rowid] for rowid in wanted]
+
+    def review_count(self, title):
+        return self.conn.execute("SELECT COUNT(*) FROM reviews WHERE title = ? COLLATE NOCASE",
+                                 (title.strip(),)).fetchone()[0]
+
+    def add_review(self, title, review):
+        self._write("INSERT INTO reviews VALUES (?, ?)", (title.strip(), review.strip()))
+
+
+def sql_name(column):
+    """'Borrow Date' -> 'borrow_date'."""
+    return column.lower().replace(' ', '_')
+
+
+def open_repository(backend, files, tables, journal_path, review_path, database_path):
+    if backend == 'sqlite':
+        return SqliteRepository(database_path, tables)
+    if backend == 'text':
+        return TextRepository(files, tables, journal_path, review_path)
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,130 @@
+import mmap
+import os
+import pickle
+from array import array
+
+from records import data_start, parse_review, scan_records
+
+INDEX_VERSION = 1
+
+TAIL_BYTES = 64  # bytes before the indexed end that must be unchanged for the index to be reused
+
+
+class ReviewIndex:
+    """Byte offsets of the records of the reviews file, grouped by title.
+
+    Titles are keyed lowercased, like the old scan compared them. The index
+    remembers how far into the file it has read, so catch_up() only scans
+    records appended since then, and reviews_for() reads just the records of
+    one title through a memory-mapped view of the file.
+
+    It is saved to a sidecar file with the inode, indexed size and the bytes
+    just before that size; if the reviews file was replaced or rewritten
+    instead of appended to, the saved index is thrown away and rebuilt.
+    """
+
+    def __init__(self, path, index_path):
+        self.path = path
+        self.index_path = index_path
+        self.offsets = {}    # lowercased title -> array of line offsets
+        self.size = 0        # bytes of the file that have been indexed
+        self.inode = None
+        self.quoted = False     # whether the file is in the record format, see records.py
+        self.dirty = False
+
+    @classmethod
+    def open(cls, path, index_path):
+        index = cls(path, index_path)
+        index._load()
+        index.catch_up()
+        return index
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+        if state.get('version') != INDEX_VERSION:
+            return
+        tail = self._tail(state['inode'], state['size'])
+        if tail is None or tail != state['tail']:
+            return
+        self.offsets, self.size, self.inode = state['offsets'], state['size'], state['inode']
+
+    def _tail(self, inode, size):
+        try:
+            with open(self.path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != inode or stat.st_size < size:
+                    return None
+                f.seek(max(0, size - TAIL_BYTES))
+                return f.read(size - f.tell())
+        except FileNotFoundError:
+            return None
+
+    def catch_up(self):
+        """Index the complete records that were appended since the last call."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self.inode or stat.st_size < self.size:
+                # Replaced or truncated: start over
+                self.offsets, self.size, self.inode = {}, 0, stat.st_ino
+            self.quoted = data_start(f)
+            f.seek(max(self.size, f.tell()))
+            offset = f.tell()
+            # A half-written last record is indexed once it is complete
+            for offset, end, record in scan_records(f, self.quoted):
+                review = parse_review(record, self.quoted)
+                if review is not None:
+                    self.offsets.setdefault(review[0].lower(), array('q')).append(offset)
+                offset = end
+            if offset != self.size:
+                self.size = offset
+                self.dirty = True
+
+    def grown(self):
+        """Whether the file changed since it was last indexed, e.g. another instance added a review."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        # Past size, or a half-written record that may be complete by now
+        return stat.st_ino != self.inode or stat.st_size != self.size
+
+    def count(self, title):
+        return len(self.offsets.get(title.strip().lower(), ()))
+
+    def reviews_for(self, title, positions=None):
+        """The reviews of title, or only those at positions (0 is the first one stored), in that order."""
+        offsets = self.offsets.get(title.strip().lower())
+        if not offsets:
+            return []
+        if positions is not None:
+            offsets = [offsets[position] for position in positions if position < len(offsets)]
+        reviews = []
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            for offset in offsets:
+                view.seek(offset)
+                reviews.append(parse_review(next(scan_records(view, self.quoted))[2], self.quoted)[1])
+        return reviews
+
+    def save(self):
+        if not self.dirty:
+            return
+        state = {
+            'version': INDEX_VERSION,
+            'inode': self.inode,
+            'size': self.size,
+            'tail': self._tail(self.inode, self.size),
+            'offsets': self.offsets,
+        }
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
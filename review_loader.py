@@ -0,0 +1,154 @@
+"""Reviews and their sentiment, read and scored off the GUI thread.
+
+The review dialogs of lib.py and libBERT.py show a book's reviews a page at
+a time (see review_pages.py). A ReviewLoader reads a page and shows what it
+sends as it arrives: first the reviews with the sentiment the cache already
+has, then the rest batch by batch as the model scores them. A ReviewOrder
+reads the stored sentiment of every review of the book to sort or filter
+them by it. Closing a dialog only interrupts its threads, so the dialog
+never waits for a batch to finish.
+"""
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from sentiment import polarity
+
+ORDER_CHUNK = 2000  # reviews read and looked up at a time while ordering
+
+# The filter of a ReviewOrder that keeps the reviews without a stored sentiment
+UNSCORED = None
+
+
+class ReviewThread(QThread):
+    """A thread of a review dialog, kept referenced until it finishes.
+
+    Threads that haven't finished, interrupted ones included, stay in
+    running, so they can be waited for on exit.
+    """
+    running = set()
+
+    def __init__(self):
+        # No parent: the thread may outlive the dialog that started it
+        super().__init__()
+
+    def start(self):
+        ReviewThread.running.add(self)
+        self.finished.connect(self._finished)
+        super().start()
+
+    def _finished(self):
+        ReviewThread.running.discard(self)
+        self.deleteLater()
+
+    @classmethod
+    def stop_all(cls):
+        """Interrupt every review thread and wait for it, e.g. before the library closes."""
+        for thread in list(ReviewThread.running):
+            thread.requestInterruption()
+        for thread in list(ReviewThread.running):
+            thread.wait()
+
+
+class ReviewLoader(ReviewThread):
+    """Reads some reviews of a book and scores the ones the cache doesn't know.
+
+    fetch() is called on the loader's thread and gives the reviews and how
+    many reviews there are in all, e.g. a page of them and the count of the
+    book's reviews. model is a BackgroundModel and score(model, texts) gives
+    a (label, score) for each of texts. New scores are stored in cache (a
+    ScoreCache) under model_id as each batch of batch_size reviews is done.
+    Without a model the loader only reads, e.g. to have the next page ready.
+    """
+    loaded = pyqtSignal(list, list, int)    # reviews, their label or None if not scored yet, reviews in all
+    scored = pyqtSignal(list, list)         # positions in reviews, their labels
+    progress = pyqtSignal(int, int)         # reviews with a label, total
+    failed = pyqtSignal(str)
+
+    def __init__(self, fetch, cache, model_id, model, score, batch_size):
+        super().__init__()
+        self.fetch = fetch
+        self.cache = cache
+        self.model_id = model_id
+        self.model = model
+        self.score = score
+        self.batch_size = batch_size
+
+    def run(self):
+        try:
+            reviews, total = self.fetch()
+            scores = self.cache.lookup(self.model_id, reviews)
+            labels = [score and score[0] for score in scores]
+            if self.isInterruptionRequested():
+                return
+            self.loaded.emit(reviews, labels, total)
+            if self.model is None:
+                return
+            unscored = [i for i, label in enumerate(labels) if label is None]
+            self.progress.emit(len(reviews) - len(unscored), len(reviews))
+            if not unscored:
+                return
+
+            # Wait for the model to load without ignoring a cancel
+            while not self.model.wait(0.1):
+                if self.isInterruptionRequested():
+                    return
+            model = self.model.get()
+            for start in range(0, len(unscored), self.batch_size):
+                if self.isInterruptionRequested():
+                    return
+                positions = unscored[start:start + self.batch_size]
+                texts = [reviews[i] for i in positions]
+                scores = self.score(model, texts)
+                self.cache.store(self.model_id, texts, scores)
+                self.scored.emit(positions, [label for label, _ in scores])
+                self.progress.emit(len(reviews) - len(unscored) + start + len(positions), len(reviews))
+        except Exception as error:
+            self.failed.emit(str(error))
+
+
+class ReviewOrder(ReviewThread):
+    """Puts the reviews of a book in order by the sentiment stored for them.
+
+    Only scores already in cache are used; nothing is scored. sort is
+    'positive' (most positive first), 'negative' or None for the stored
+    order, and label keeps only the reviews with that label, UNSCORED only
+    those without a score, or with no label at all every review. Reviews
+    without a score go after the others. Every review of the book is read,
+    a chunk at a time, but only positions and scores are kept.
+    """
+    ordered = pyqtSignal(list)      # positions of the reviews to show, in order
+    progress = pyqtSignal(int, int)     # reviews looked at, total
+    failed = pyqtSignal(str)
+
+    # Keep every review, whatever its sentiment
+    ALL = object()
+
+    def __init__(self, library, title, cache, model_id, sort=None, label=ALL):
+        super().__init__()
+        self.library = library
+        self.title = title
+        self.cache = cache
+        self.model_id = model_id
+        self.sort = sort
+        self.label = label
+
+    def run(self):
+        try:
+            total = self.library.review_count(self.title)
+            kept = []   # (position, polarity or None)
+            for start in range(0, total, ORDER_CHUNK):
+                if self.isInterruptionRequested():
+                    return
+                reviews = self.library.reviews_for(self.title, range(start, min(start + ORDER_CHUNK, total)))
+                for position, score in enumerate(self.cache.lookup(self.model_id, reviews), start):
+                    label = score and score[0]
+                    if self.label is ReviewOrder.ALL or label == self.label:
+                        kept.append((position, score and polarity(*score)))
+                self.progress.emit(start + len(reviews), total)
+            if self.sort is not None:
+                sign = -1 if self.sort == 'positive' else 1
+                # Stable, so reviews with the same score stay in stored order
+                kept.sort(key=lambda entry: (entry[1] is None, 0 if entry[1] is None else sign * entry[1]))
+            if not self.isInterruptionRequested():
+                self.ordered.emit([position for position, _ in kept])
+        except Exception as error:
+            self.failed.emit(str(error))
@@ -0,0 +1,328 @@
+"""A book's reviews a page at a time, for the review dialogs of lib.py and libBERT.py.
+
+Opening the reviews of a book reads only its first page and scores only
+that page, so it costs the same however many reviews the book has. The
+next page is read in the background meanwhile, so going on to it shows its
+reviews at once. Sorting or filtering by sentiment reads the stored score
+of every review of the book once (see ReviewOrder) and then pages through
+the order that gives. Scores are only ever computed for the page on screen.
+"""
+from PyQt5 import sip
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt, pyqtSignal
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QComboBox, QHBoxLayout, QLabel, QListView, QProgressBar, QPushButton, QVBoxLayout, QWidget
+
+from review_loader import UNSCORED, ReviewLoader, ReviewOrder
+
+PAGE_SIZE = 50  # reviews on a page
+
+# Shown for a review without a label while its page is being scored
+ANALYZING = "Analyzing..."
+
+SORTS = [("Stored order", None), ("Most positive first", 'positive'), ("Most negative first", 'negative')]
+
+
+class ReviewPageModel(QAbstractListModel):
+    """The reviews on one page, each with its sentiment and a swatch of color(label)."""
+
+    def __init__(self, color, parent=None):
+        super().__init__(parent)
+        self._color = color
+        self._reviews = []
+        self._labels = []       # None until the review is scored
+        self.unscored = ANALYZING
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._reviews)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        label = self._labels[index.row()] or self.unscored
+        if role == Qt.DisplayRole:
+            return f"{self._reviews[index.row()]}\nSentiment: {label}"
+        if role == Qt.DecorationRole:
+            return QColor(self._color(label))
+        return None
+
+    def set_page(self, reviews, labels):
+        self.beginResetModel()
+        self._reviews = list(reviews)
+        self._labels = list(labels)
+        self.unscored = ANALYZING
+        self.endResetModel()
+
+    def set_labels(self, rows, labels):
+        for row, label in zip(rows, labels):
+            self._labels[row] = label
+        if rows:
+            self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)))
+
+    def mark_unscored(self, text):
+        """Show text as the sentiment of every review without one, e.g. once scoring is cancelled."""
+        self.unscored = text
+        if self._reviews:
+            self.dataChanged.emit(self.index(0), self.index(len(self._reviews) - 1))
+
+
+def _connect(thread, **slots):
+    # Connect signals of a review thread by name, remembering them for _drop()
+    thread.connected = []
+    for name, slot in slots.items():
+        signal = getattr(thread, name)
+        signal.connect(slot)
+        thread.connected.append(signal)
+    return thread
+
+
+def _drop(thread):
+    # Ignore whatever a review thread still sends and let it stop on its own;
+    # one that has finished is deleted already
+    if thread is not None and not sip.isdeleted(thread):
+        for signal in thread.connected:
+            signal.disconnect()
+        thread.requestInterruption()
+
+
+class ReviewBrowser(QWidget):
+    """The reviews of a book a page at a time, with sort and filter by sentiment.
+
+    Reviews are scored with model (a BackgroundModel) through score(model,
+    texts), batch_size at a time, and the scores kept in cache under
+    model_id; see ReviewLoader. labels are the labels the model gives,
+    offered as filters, and color(label) is the color shown for one.
+    """
+    failed = pyqtSignal(str)    # scoring failed; reviews are shown without their sentiment from then on
+
+    def __init__(self, library, title, cache, model_id, model, score, batch_size, labels, color, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.title = title
+        self.cache = cache
+        self.model_id = model_id
+        self.sentiment_model = model
+        self.score = score
+        self.batch_size = batch_size
+        self.filters = [("All reviews", ReviewOrder.ALL), *((label, label) for label in labels),
+                        ("Not analyzed yet", UNSCORED)]
+
+        self.order = None       # positions of the reviews to page through; None for all, in stored order
+        self.view = 0           # goes up with every new order, so pages read for an old one are dropped
+        self.total = 0          # reviews to page through
+        self.page = 0
+        self.scoring = True     # False once scoring was cancelled or failed
+        self.unscored = None    # what to show for reviews without sentiment then
+        self.loader = None      # reads and scores the page on screen
+        self.prefetch = None    # reads the next page
+        self.prefetched = None  # (view, page, reviews, labels, total) it read
+        self.sorter = None
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        order_layout = QHBoxLayout()
+        self.sort_box = QComboBox()
+        self.sort_box.addItems([text for text, _ in SORTS])
+        self.filter_box = QComboBox()
+        self.filter_box.addItems([text for text, _ in self.filters])
+        self.sort_box.currentIndexChanged.connect(self.reorder)
+        self.filter_box.currentIndexChanged.connect(self.reorder)
+        order_layout.addWidget(QLabel("Sort:"))
+        order_layout.addWidget(self.sort_box)
+        order_layout.addWidget(QLabel("Show:"))
+        order_layout.addWidget(self.filter_box)
+        order_layout.addStretch(1)
+        layout.addLayout(order_layout)
+
+        self.model = ReviewPageModel(color, self)
+        self.list_view = QListView()
+        self.list_view.setModel(self.model)
+        self.list_view.setWordWrap(True)
+        self.list_view.setSpacing(4)
+        self.list_view.setAlternatingRowColors(True)
+        layout.addWidget(self.list_view)
+
+        page_layout = QHBoxLayout()
+        self.previous_button = QPushButton("< Previous")
+        self.previous_button.clicked.connect(lambda: self.show_page(self.page - 1))
+        self.page_label = QLabel()
+        self.page_label.setAlignment(Qt.AlignCenter)
+        self.next_button = QPushButton("Next >")
+        self.next_button.clicked.connect(lambda: self.show_page(self.page + 1))
+        page_layout.addWidget(self.previous_button)
+        page_layout.addWidget(self.page_label, 1)
+        page_layout.addWidget(self.next_button)
+        layout.addLayout(page_layout)
+
+        # How many reviews of the page have their sentiment, while the model works through the rest
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("Analyzing sentiment... %v/%m")
+        progress_layout.addWidget(self.progress_bar)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_scoring)
+        progress_layout.addWidget(self.cancel_button)
+        layout.addLayout(progress_layout)
+        self.setLayout(layout)
+
+        self.show_page(0)
+
+    def _fetch(self, page):
+        # What a loader reads for a page, -1 for the last one
+        library, title, order = self.library, self.title, self.order
+
+        def fetch():
+            total = library.review_count(title) if order is None else len(order)
+            start = (max(total - 1, 0) // PAGE_SIZE if page < 0 else page) * PAGE_SIZE
+            if order is None:
+                return library.reviews_for(title, range(start, min(start + PAGE_SIZE, total))), total
+            return library.reviews_for(title, order[start:start + PAGE_SIZE]), total
+        return fetch
+
+    def show_page(self, page):
+        """Show a page of the reviews (from 0, -1 for the last), scoring the ones without sentiment."""
+        self._stop_loader()
+        self.page = page
+        ahead, self.prefetched = self.prefetched, None
+        model = self.sentiment_model if self.scoring else None
+        slots = {'scored': self.page_scored, 'progress': self.show_progress, 'failed': self.scoring_failed}
+        if ahead is not None and ahead[:2] == (self.view, page):
+            # Read in the background already; only the scoring is left
+            _, _, reviews, labels, total = ahead
+            self.page_loaded(reviews, labels, total)
+            loader = ReviewLoader(lambda: (reviews, total), self.cache, self.model_id, model, self.score,
+                                  self.batch_size)
+            # Reviews scored since the page was read have their label in the cache now
+            slots['loaded'] = lambda reviews, labels, total: self.page_scored(
+                [row for row, label in enumerate(labels) if label is not None],
+                [label for label in labels if label is not None])
+        else:
+            self.model.set_page([], [])
+            self.page_label.setText("Loading reviews...")
+            self.previous_button.setEnabled(False)
+            self.next_button.setEnabled(False)
+            loader = ReviewLoader(self._fetch(page), self.cache, self.model_id, model, self.score, self.batch_size)
+            slots['loaded'] = self.page_loaded
+        self.loader = _connect(loader, **slots)
+        if model is not None:
+            self.progress_bar.setRange(0, 0)
+            self.progress_bar.show()
+            self.cancel_button.show()
+        self.loader.start()
+
+    def page_loaded(self, reviews, labels, total):
+        self.total = total
+        pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+        if self.page < 0:
+            self.page = max(pages - 1, 0)
+        self.model.set_page(reviews, labels)
+        if self.unscored is not None:
+            self.model.mark_unscored(self.unscored)
+        self.list_view.scrollToTop()
+        if total:
+            self.page_label.setText(f"Page {self.page + 1} of {pages} ({total} reviews)")
+        else:
+            self.page_label.setText("No reviews available.")
+        self.previous_button.setEnabled(self.page > 0)
+        self.next_button.setEnabled(self.page + 1 < pages)
+        if self.page + 1 < pages:
+            self._prefetch(self.page + 1)
+
+    def _prefetch(self, page):
+        _drop(self.prefetch)
+        self.prefetch = _connect(ReviewLoader(self._fetch(page), self.cache, self.model_id, None, None,
+                                              self.batch_size),
+                                 loaded=self.page_prefetched, failed=self.prefetch_failed)
+        self.prefetch_key = (self.view, page)
+        self.prefetch.start()
+
+    def page_prefetched(self, reviews, labels, total):
+        self.prefetched = (*self.prefetch_key, reviews, labels, total)
+        self.prefetch = None
+
+    def prefetch_failed(self, message):
+        # The page is read again when it is shown, and any error shown then
+        self.prefetch = None
+
+    def page_scored(self, rows, labels):
+        self.model.set_labels(rows, labels)
+
+    def show_progress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+        if done == total:
+            self._stop_loader()
+
+    def scoring_failed(self, message):
+        # Show the reviews anyway, without the sentiment we can't compute
+        self._stop_scoring("Unavailable")
+        self.failed.emit(message)
+
+    def cancel_scoring(self):
+        self._stop_scoring("Not analyzed")
+
+    def _stop_scoring(self, unscored):
+        # No scoring from now on, on this page or any other
+        self._stop_loader()
+        self.scoring = False
+        self.unscored = unscored
+        self.model.mark_unscored(unscored)
+
+    def _stop_loader(self):
+        _drop(self.loader)
+        self.loader = None
+        self.progress_bar.hide()
+        self.cancel_button.hide()
+
+    def reorder(self):
+        """Page through the reviews in the order and with the filter chosen."""
+        self._drop_order()
+        sort = SORTS[self.sort_box.currentIndex()][1]
+        label = self.filters[self.filter_box.currentIndex()][1]
+        if sort is None and label is ReviewOrder.ALL:
+            self.order = None
+            self.show_page(0)
+            return
+        self._stop_loader()
+        self.model.set_page([], [])
+        self.page_label.setText("Reading the stored sentiment of every review...")
+        self.previous_button.setEnabled(False)
+        self.next_button.setEnabled(False)
+        self.sorter = _connect(ReviewOrder(self.library, self.title, self.cache, self.model_id, sort, label),
+                               ordered=self.show_order, progress=self.order_progress, failed=self.order_failed)
+        self.sorter.start()
+
+    def _drop_order(self):
+        # Whatever was being read for the order shown until now
+        _drop(self.sorter)
+        _drop(self.prefetch)
+        self.sorter = self.prefetch = None
+        self.view += 1
+
+    def order_progress(self, done, total):
+        self.page_label.setText(f"Reading the stored sentiment of every review... {done}/{total}")
+
+    def show_order(self, positions):
+        self.sorter = None
+        self.order = positions
+        self.show_page(0)
+
+    def order_failed(self, message):
+        self.sorter = None
+        self.page_label.setText(f"The reviews can't be sorted: {message}")
+
+    def reload(self):
+        """Show the last page of every review in stored order, e.g. after adding one."""
+        for box in (self.sort_box, self.filter_box):
+            box.blockSignals(True)
+            box.setCurrentIndex(0)
+            box.blockSignals(False)
+        self._drop_order()
+        self.order = None
+        self.show_page(-1)
+
+    def stop(self):
+        """Drop every thread of the browser, e.g. when its dialog closes; doesn't wait for them."""
+        self._stop_loader()
+        _drop(self.prefetch)
+        _drop(self.sorter)
+        self.prefetch = self.sorter = None
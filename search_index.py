@@ -0,0 +1,251 @@
+import heapq
+import os
+import pickle
+import re
+from itertools import groupby, islice
+from operator import itemgetter, neg
+
+from fuzzy_index import Vocabulary
+
+INDEX_VERSION = 3
+
+# How many candidates matches() checks between polls of cancelled
+CHECK_EVERY = 4096
+# Above this many candidates, matches() walks the ids in order instead of
+# sorting them, which would hold the GIL for tens of milliseconds at once
+SORT_LIMIT = 50000
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def file_signature(path):
+    """Size and modification time, used to tell whether a saved index is stale."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _in_order(ids, limit):
+    """The ids, all below limit, in increasing order: as a list or, for big sets, lazily."""
+    if len(ids) <= SORT_LIMIT:
+        return sorted(ids)
+    return (doc_id for doc_id in range(limit) if doc_id in ids)
+
+
+class SearchIndex:
+    """Inverted index over the Title, Author and Year of every book.
+
+    Documents are keyed by the book's id. Whole words go into
+    a token index and every field is also split into trigrams, so a substring
+    query only has to verify the few books that share all of its trigrams.
+    The words are also kept in a Vocabulary, through which closest() finds
+    books despite typos in the query.
+    """
+
+    def __init__(self):
+        self.docs = {}       # doc id -> lowercased (title, author, year)
+        self.tokens = {}     # word -> set of doc ids
+        self.trigrams = {}   # three-character substring -> set of doc ids
+        self.vocabulary = Vocabulary()
+        self.limit = 0       # one more than the highest doc id ever added
+
+    @classmethod
+    def build(cls, books):
+        """Index books, an iterable of (doc id, (title, author, year))."""
+        index = cls()
+        for doc_id, (title, author, year) in books:
+            index.add(doc_id, title, author, year)
+        return index
+
+    def add(self, doc_id, title, author, year):
+        fields = tuple(str(value).lower() for value in (title, author, year))
+        self.docs[doc_id] = fields
+        self.limit = max(self.limit, doc_id + 1)
+        for key in self._keys(fields, _TOKEN_RE.findall):
+            ids = self.tokens.get(key)
+            if ids is None:
+                ids = self.tokens[key] = set()
+                self.vocabulary.add(key)
+            ids.add(doc_id)
+        for key in self._keys(fields, _trigrams):
+            self.trigrams.setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        fields = self.docs.pop(doc_id, None)
+        if fields is None:
+            return
+        for postings, split in ((self.tokens, _TOKEN_RE.findall), (self.trigrams, _trigrams)):
+            for key in self._keys(fields, split):
+                ids = postings.get(key)
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del postings[key]
+
+    def update(self, doc_id, title, author, year):
+        self.remove(doc_id)
+        self.add(doc_id, title, author, year)
+
+    def search(self, query):
+        """Return the ids of books with query as a substring of any field, in id order."""
+        return list(self.matches(query))
+
+    def matches(self, query, within=None, cancelled=None):
+        """Yield the ids of books with query as a substring of any field, in id order.
+
+        within is the result of an earlier query that query contains, so only
+        those books need checking. cancelled is polled every few thousand
+        books and stops the search once it returns True. Safe to run on
+        another thread while the GUI thread edits the index; books added or
+        removed meanwhile may or may not be reported.
+        """
+        query = query.lower()
+        if within is not None:
+            candidates, exact = within, False
+        elif len(query) >= 3:
+            # Intersect the smallest posting lists first; any missing trigram means no match
+            postings = sorted((self.trigrams.get(gram, ()) for gram in _trigrams(query)), key=len)
+            if not postings or not postings[0]:
+                return
+            candidates = _in_order(postings[0].intersection(*postings[1:]) if len(postings) > 1 else postings[0],
+                                   self.limit)
+            # A single trigram is its own proof of a match, longer queries need checking
+            exact = len(query) == 3
+        elif query.isalnum():
+            # Too short for trigrams: match against the (much smaller) word vocabulary
+            ids = set()
+            tokens = self.tokens
+            # A copy of the keys, since the GUI thread may add words meanwhile
+            for position, token in enumerate(list(tokens)):
+                if cancelled is not None and position % CHECK_EVERY == 0 and cancelled():
+                    return
+                if query in token:
+                    ids |= tokens.get(token, ())
+            candidates, exact = _in_order(ids, self.limit), True
+        else:
+            candidates, exact = _in_order(self.docs, self.limit), False
+        docs = self.docs
+        for position, doc_id in enumerate(candidates):
+            if cancelled is not None and position % CHECK_EVERY == 0 and cancelled():
+                return
+            if exact:
+                yield doc_id
+            else:
+                fields = docs.get(doc_id)
+                if fields is not None and any(query in field for field in fields):
+                    yield doc_id
+
+    def closest(self, query, limit):
+        """Ids of the limit books that best match the words of query, typos allowed, best first.
+
+        Books with more of the query's words come first, then those whose
+        words are closer to the query's (see Vocabulary.similar), then lower
+        ids. The books ranked are those matching the query word that matches
+        the fewest books, so a common word like "the" doesn't make every
+        book a candidate. Safe to run on another thread, like matches().
+        """
+        # For each query word, (similarity, books) for each known word close
+        # to it, furthest first. The sets are shared with the GUI thread,
+        # which may change them meanwhile, but each is only read by a single
+        # set or dict operation, which the GUI thread can't interrupt.
+        groups = []
+        for word in dict.fromkeys(_TOKEN_RE.findall(query.lower())):
+            similar = [(word, 1.0)] if word.isdigit() else self.vocabulary.similar(word)
+            group = [(similarity, books) for known, similarity in reversed(similar)
+                     for books in [self.tokens.get(known)] if books]
+            if group:
+                groups.append(group)
+        if not groups:
+            return []
+        groups.sort(key=lambda group: sum(len(books) for _, books in group))
+        anchor, others = groups[0], groups[1:]
+
+        # Only books with another of the query's words are scored one by one;
+        # with a common word, the others may be a good part of the catalog
+        elsewhere = [books for group in others for _, books in group]
+        scores = {}
+        for similarity, books in anchor:
+            # Closer words come last and overwrite the scores of further ones
+            scores.update(dict.fromkeys(set().union(*(books & other for other in elsewhere)), similarity))
+        words = dict.fromkeys(scores, 1)
+        for group in others:
+            best = {}
+            for similarity, books in group:
+                best.update(dict.fromkeys(scores.keys() & books, similarity))
+            for doc_id, similarity in best.items():
+                scores[doc_id] += similarity
+                words[doc_id] += 1
+        # Tuples that compare in C, without a key function per book
+        ranked = [doc_id for _, _, doc_id in heapq.nsmallest(
+            limit, zip(map(neg, words.values()), map(neg, scores.values()), scores))]
+
+        # Then books with just the anchor word, closest first
+        skip = [scores]
+        for _, equally_close in groupby(reversed(anchor), key=itemgetter(0)):
+            if len(ranked) >= limit:
+                break
+            sets = [books for _, books in equally_close]
+            ranked.extend(self._lowest(sets, limit - len(ranked), skip))
+            skip.extend(sets)
+        return ranked
+
+    def _lowest(self, sets, count, skip):
+        # The count lowest ids in any of sets and none of skip. Counting up
+        # from 0 finds them after some count * limit / size tries, quicker
+        # than going through every id in sets when there are many.
+        size = sum(map(len, sets))
+        if count * self.limit < size * size:
+            wanted = (doc_id for doc_id in range(self.limit)
+                      if any(doc_id in ids for ids in sets) and not any(doc_id in ids for ids in skip))
+            return list(islice(wanted, count))
+        return heapq.nsmallest(count, set().union(*sets).difference(*skip))
+
+    @staticmethod
+    def _keys(fields, split):
+        keys = set()
+        for field in fields:
+            keys.update(split(field))
+        return keys
+
+    def save(self, path, signature, order):
+        """Persist the index for a books file with the given signature.
+
+        order is the list of book ids in file order, so a later load can give
+        the freshly parsed rows the ids the index refers to.
+        """
+        state = {
+            'version': INDEX_VERSION,
+            'signature': signature,
+            'order': list(order),
+            'docs': self.docs,
+            'tokens': self.tokens,
+            'trigrams': self.trigrams,
+            'vocabulary': self.vocabulary,
+        }
+        # Another instance may be saving the same index; each writes its own file
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, signature, rows):
+        """Load a saved index, or return (None, None) if it is missing or stale."""
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None, None
+        if (state.get('version') != INDEX_VERSION or state['signature'] != signature
+                or len(state['order']) != rows):
+            return None, None
+        index = cls()
+        index.docs = state['docs']
+        index.tokens = state['tokens']
+        index.trigrams = state['trigrams']
+        index.vocabulary = state['vocabulary']
+        index.limit = max(index.docs, default=-1) + 1
+        return index, state['order']
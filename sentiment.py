@@ -0,0 +1,200 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Pinned so cached scores can be keyed by the model that produced them
+BERT_MODEL = "distilbert/distilbert-base-uncased-finetuned-sst-2-english"
+VADER_MODEL_ID = 'vader'
+
+CACHE_SIZE = 10000     # scores kept in memory in front of the database
+LOOKUP_CHUNK = 500     # hashes per SELECT, under SQLite's variable limit
+
+
+class BackgroundModel:
+    """A model that is loaded on a daemon thread instead of at import time.
+
+    loader is called once, on the thread started by start(); get() blocks
+    until it has finished and re-raises anything it raised.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._model = None
+        self._error = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name='model-loader', daemon=True)
+                self._thread.start()
+
+    def _load(self):
+        try:
+            self._model = self._loader()
+        except Exception as error:
+            self._error = error
+        finally:
+            self._ready.set()
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Wait up to timeout seconds for loading to finish; True once it has."""
+        self.start()
+        return self._ready.wait(timeout)
+
+    def get(self, timeout=None):
+        self.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError("Sentiment model is still loading")
+        if self._error is not None:
+            raise self._error
+        return self._model
+
+
+def load_bert_pipeline():
+    # Imported here so that importing this module stays cheap
+    from transformers import pipeline
+    return pipeline("sentiment-analysis", model=BERT_MODEL)
+
+
+def load_vader():
+    """VADER's analyzer, from a vader_lexicon that is already installed.
+
+    Raises LookupError instead of downloading the lexicon when it is missing.
+    """
+    import nltk
+    from nltk.sentiment.vader import SentimentIntensityAnalyzer
+    try:
+        nltk.data.find('sentiment/vader_lexicon.zip')
+    except LookupError:
+        raise LookupError("The VADER lexicon is not installed. "
+                          "Run: python -m nltk.downloader vader_lexicon") from None
+    return SentimentIntensityAnalyzer()
+
+
+def vader_label(compound_score):
+    """Classify a review by VADER's compound score."""
+    if compound_score >= 0.05:
+        return "Positive"
+    elif compound_score <= -0.05:
+        return "Negative"
+    else:
+        return "Neutral"
+
+
+def vader_scores(analyzer, texts):
+    """(label, compound score) for each of texts."""
+    scores = []
+    for text in texts:
+        compound = analyzer.polarity_scores(text)['compound']
+        scores.append((vader_label(compound), compound))
+    return scores
+
+
+def polarity(label, score):
+    """A (label, score) from either model as one number, from -1 (most negative) to 1 (most positive).
+
+    VADER's score is its signed compound score already; BERT's is its
+    confidence in the label, so it takes the label's sign.
+    """
+    kind = label.upper()
+    if kind.startswith('NEG'):
+        return -abs(score)
+    if kind.startswith('POS'):
+        return abs(score)
+    return score
+
+
+def bert_scores(model, texts, batch_size):
+    """(label, score) for each of texts, scored batch_size at a time."""
+    scores = []
+    for _, results in score_batches(model, texts, batch_size):
+        scores.extend((result['label'], result['score']) for result in results)
+    return scores
+
+
+def score_batches(model, texts, batch_size):
+    """Yield (start, results) for texts scored batch_size at a time.
+
+    Each batch is a single call into the pipeline, which runs the whole batch
+    through the network together instead of once per text.
+    """
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        yield start, model(batch, batch_size=batch_size, truncation=True)
+
+
+class ScoreCache:
+    """Sentiment scores on disk, keyed by (model id, hash of the review text).
+
+    The same text always gets the same score from the same model, so a review
+    only has to be scored once. Scores are kept in SQLite with an LRU of the
+    most recently used ones in memory. Any thread may use it; calls take
+    turns on a lock.
+    """
+
+    def __init__(self, path, size=CACHE_SIZE):
+        self.size = size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS scores (model TEXT, hash BLOB, label TEXT, score REAL, "
+                              "PRIMARY KEY (model, hash)) WITHOUT ROWID")
+
+    def lookup(self, model_id, texts):
+        """Return a (label, score) for each of texts, or None where it hasn't been scored."""
+        hashes = [review_hash(text) for text in texts]
+        with self._lock:
+            return self._lookup(model_id, hashes)
+
+    def _lookup(self, model_id, hashes):
+        results = [self._recall((model_id, h)) for h in hashes]
+        missing = list({h for h, result in zip(hashes, results) if result is None})
+        found = {}
+        for start in range(0, len(missing), LOOKUP_CHUNK):
+            chunk = missing[start:start + LOOKUP_CHUNK]
+            rows = self.conn.execute(f"SELECT hash, label, score FROM scores WHERE model = ? "
+                                     f"AND hash IN ({', '.join('?' * len(chunk))})", [model_id, *chunk])
+            for h, label, score in rows:
+                found[h] = (label, score)
+                self._remember((model_id, h), found[h])
+        return [result or found.get(h) for h, result in zip(hashes, results)]
+
+    def store(self, model_id, texts, scores):
+        """Save the (label, score) pairs in scores for texts."""
+        rows = []
+        for text, (label, score) in zip(texts, scores):
+            h = review_hash(text)
+            rows.append((model_id, h, label, score))
+        with self._lock:
+            for _, h, label, score in rows:
+                self._remember((model_id, h), (label, score))
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)", rows)
+
+    def _recall(self, key):
+        result = self._memory.get(key)
+        if result is not None:
+            self._memory.move_to_end(key)
+        return result
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def review_hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
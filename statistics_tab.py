@@ -0,0 +1,164 @@
+"""The Statistics tab of lib.py and libBERT.py.
+
+The running totals Library keeps of its loans (see circulation.py) are
+shown at the top and kept current while the tab is open. The full report
+(see analytics.py) is worked out on a ReportWorker thread from a Snapshot
+taken when it's asked for, then shown a table at a time and can be
+exported: every table as JSON, or the one shown as CSV.
+"""
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+from PyQt5.QtWidgets import (QComboBox, QFileDialog, QHBoxLayout, QLabel, QMessageBox, QPushButton,
+                             QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget)
+
+from analytics import Snapshot, report, review_scores, write_csv, write_json
+
+MOST_BORROWED_SHOWN = 5     # books named in the running totals
+
+
+class ReportWorker(QThread):
+    """Works out the report of a Snapshot, with the sentiment the cache has for the library's reviews."""
+    done = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, snapshot, library, cache, model_id):
+        super().__init__()
+        self.snapshot = snapshot
+        self.library = library
+        self.cache = cache
+        self.model_id = model_id
+
+    def run(self):
+        try:
+            reviews, scores = review_scores(self.library, self.cache, self.model_id)
+            self.done.emit(report(self.snapshot, reviews, scores))
+        except Exception as error:
+            self.failed.emit(str(error))
+
+
+class StatisticsTab(QWidget):
+    """Statistics about library, with sentiment from the scores of model_id in cache."""
+
+    def __init__(self, library, cache, model_id, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.cache = cache
+        self.model_id = model_id
+        self.worker = None
+        self.report = {}
+        self.counted = None     # the counters the totals were last shown for
+
+        layout = QVBoxLayout()
+        self.totals = QLabel()
+        self.totals.setWordWrap(True)
+        layout.addWidget(self.totals)
+
+        buttons = QHBoxLayout()
+        self.report_button = QPushButton("Full Report")
+        self.report_button.clicked.connect(self.compute_report)
+        self.table_choice = QComboBox()
+        self.table_choice.currentTextChanged.connect(self.show_table)
+        self.export_button = QPushButton("Export...")
+        self.export_button.clicked.connect(self.export)
+        self.export_button.setEnabled(False)
+        buttons.addWidget(self.report_button)
+        buttons.addWidget(self.table_choice, 1)
+        buttons.addWidget(self.export_button)
+        layout.addLayout(buttons)
+
+        self.status = QLabel()
+        layout.addWidget(self.status)
+        self.table = QTableWidget()
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+        # The totals change with every loan; they're shown again only while
+        # the tab is in view, and only if they have changed
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+
+    def showEvent(self, event):
+        self.refresh()
+        super().showEvent(event)
+
+    def refresh(self):
+        counters = self.library.circulation
+        if not self.isVisible() or counters is None or self.counted == (id(counters), counters.changes):
+            return
+        self.counted = (id(counters), counters.changes)
+        average = counters.average_days()
+        lines = [f"{counters.loans} books out to {counters.borrowers()} borrowers; {counters.ended} returned"
+                 + (f", after {average:.1f} days on average." if average is not None else ".")]
+        books = self.library.book_data
+        most = [f"{books.value(book_id, 'Title').strip()} ({loans})"
+                for book_id, loans in counters.most_borrowed(MOST_BORROWED_SHOWN) if book_id in books]
+        if most:
+            lines.append("Most borrowed: " + ", ".join(most))
+        self.totals.setText("\n".join(lines))
+
+    def compute_report(self):
+        if self.worker is not None:
+            return
+        self.report_button.setEnabled(False)
+        self.status.setText("Working out the report...")
+        # Taken here, on the thread that changes the library
+        self.worker = ReportWorker(Snapshot(self.library), self.library, self.cache, self.model_id)
+        self.worker.done.connect(self._report_done)
+        self.worker.failed.connect(self._report_failed)
+        self.worker.finished.connect(self._worker_finished)
+        self.worker.start()
+
+    def _report_done(self, tables):
+        self.report = tables
+        shown = self.table_choice.currentText()
+        self.table_choice.blockSignals(True)
+        self.table_choice.clear()
+        self.table_choice.addItems(list(tables))
+        self.table_choice.blockSignals(False)
+        if shown in tables:
+            self.table_choice.setCurrentText(shown)
+        self.show_table(self.table_choice.currentText())
+        self.export_button.setEnabled(True)
+        self.status.setText("")
+
+    def _report_failed(self, message):
+        self.status.setText(f"The report could not be worked out: {message}")
+
+    def _worker_finished(self):
+        self.worker.deleteLater()
+        self.worker = None
+        self.report_button.setEnabled(True)
+
+    def show_table(self, name):
+        if name not in self.report:
+            return
+        headers, rows = self.report[name]
+        self.table.clear()
+        self.table.setColumnCount(len(headers))
+        self.table.setHorizontalHeaderLabels(headers)
+        self.table.setRowCount(len(rows))
+        for row_number, row in enumerate(rows):
+            for column, value in enumerate(row):
+                self.table.setItem(row_number, column, QTableWidgetItem(str(value)))
+        self.table.resizeColumnsToContents()
+
+    def export(self):
+        path, chosen = QFileDialog.getSaveFileName(self, "Export Statistics", "statistics.json",
+                                                   "Every table as JSON (*.json);;The table shown as CSV (*.csv)")
+        if not path:
+            return
+        try:
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                if chosen.endswith('(*.csv)'):
+                    write_csv(self.report[self.table_choice.currentText()], file)
+                else:
+                    write_json(self.report, file)
+        except OSError as error:
+            QMessageBox.warning(self, "Export Failed", str(error))
+
+    def stop(self):
+        """Wait for a report being worked out, e.g. before the library closes."""
+        self.timer.stop()
+        if self.worker is not None:
+            self.worker.wait()
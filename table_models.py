@@ -0,0 +1,98 @@
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+
+class RecordTableModel(QAbstractTableModel):
+    """Read-only Qt model over some columns of a RecordTable.
+
+    Each row of the view holds the id of the record it shows, so a selected
+    row maps straight to its record whether or not the view is filtered. The
+    view only asks for the cells it is painting, and callers report mutations
+    with append_record/remove_row, which emit row-level signals instead of
+    resetting the whole table. value(record_id, column) reads a cell; it
+    defaults to the table's own value and can pull in columns stored
+    elsewhere, like a loan's borrower.
+    """
+
+    def __init__(self, columns, table=None, parent=None, value=None):
+        super().__init__(parent)
+        self._columns = list(columns)
+        self._table = table
+        self._value = value
+        self._rows = list(table) if table is not None else []  # record id of every row
+        self._filtered = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        value = self._value or self._table.value
+        return str(value(self._rows[index.row()], self._columns[index.column()]))
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._columns[section]
+        return str(section + 1)
+
+    def record_id(self, row):
+        return self._rows[row]
+
+    def set_table(self, table):
+        """Show every record of table, dropping any filter."""
+        self.beginResetModel()
+        self._table = table
+        self._rows = list(table)
+        self._filtered = False
+        self.endResetModel()
+
+    def set_rows(self, record_ids):
+        """Only show the records of the current table with the given ids."""
+        self.beginResetModel()
+        self._rows = list(record_ids)
+        self._filtered = True
+        self.endResetModel()
+
+    def is_filtered(self):
+        return self._filtered
+
+    def append_record(self, record_id):
+        """Show a record that was just added to the table."""
+        if self._filtered:
+            return self.set_table(self._table)
+        row = len(self._rows)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._rows.append(record_id)
+        self.endInsertRows()
+
+    def add_rows(self, record_ids):
+        """Show more records after the current rows, e.g. as search results arrive."""
+        if not record_ids:
+            return
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(record_ids) - 1)
+        self._rows.extend(record_ids)
+        self.endInsertRows()
+
+    def remove_row(self, row):
+        """Stop showing the record at row, which was just deleted from the table."""
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._rows[row]
+        self.endRemoveRows()
+
+    def refresh_row(self, row):
+        """Repaint the record at row after it was edited."""
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def refresh(self):
+        """Repaint every row, e.g. after a record whose row isn't known was edited.
+
+        Only the rows on screen are read again, however many there are.
+        """
+        if self._rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self._rows) - 1, self.columnCount() - 1))
@@ -0,0 +1,218 @@
+"""Binary snapshots of RecordTables, to start without parsing the stored tables.
+
+A snapshot file holds a table's compact columns (see columns.py) the way
+they are laid out in memory: the arrays of each column back to back, with
+the text of every TextColumn on pages of its own, then the few Python
+objects that aren't arrays (a CategoryColumn's distinct values, an
+IntColumn's odd fields, plain list columns) pickled, and a JSON header
+saying where everything is:
+
+    MAGIC, header offset and length (two little-endian uint64)
+    arrays, each 8-byte aligned; text sections, ALLOCATIONGRANULARITY aligned
+    pickled objects
+    JSON header
+
+load_table() maps the file and copies the arrays out of the mapping, at
+the speed of memory with nothing to parse and no object made per row.
+The text isn't even copied: each TextColumn reads its fields from a
+copy-on-write mapping of its section, so those pages only come from disk
+once something shows them.
+
+Every snapshot carries the signature of the stored table it was taken of
+(Repository.signature), and load_table() gives nothing unless the table
+still has that signature, so once the text files are written again, by
+this instance, another one or an editor, they are parsed as before.
+"""
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+from array import array
+
+from columns import CategoryColumn, IntColumn, TextColumn
+from record_table import RecordTable
+
+MAGIC = b'LIBSNAP\n'
+SNAPSHOT_VERSION = 1
+ALIGN = 8
+# mmap only maps from offsets that are a multiple of this
+PAGE = mmap.ALLOCATIONGRANULARITY
+# A snapshot is only read back on a machine with the same array item sizes
+ITEMSIZES = {typecode: array(typecode).itemsize for typecode in 'hiq'}
+
+
+def _parts(kind):
+    """(attribute, typecode) of every array of a column of kind; typecode None for a bytearray."""
+    if issubclass(kind, TextColumn):
+        return [('starts', 'q'), ('lengths', 'i')]
+    if issubclass(kind, CategoryColumn):
+        return [('codes', 'i')]
+    if issubclass(kind, IntColumn):
+        return [('numbers', kind.typecode), ('pads', None)]
+    return []
+
+
+def _plain(signature):
+    # The signature as the JSON header gives it back, e.g. lists for tuples
+    return json.loads(json.dumps(signature))
+
+
+def _kind_names(columns, kinds):
+    return [kinds.get(column, list).__name__ for column in columns]
+
+
+def save_table(path, table, signature, malformed=(), renumber=False):
+    """Write a snapshot of table, the stored table with the given signature, to path.
+
+    malformed are the lines that were skipped reading it, which
+    load_table() hands back. Records are written in id order without the
+    slots they freed; with renumber they also get new ids from 0 on, as
+    tables stored without ids get when they are read.
+    """
+    # Imported here so that scripts which never save a snapshot don't pay for NumPy
+    import numpy as np
+    _release(table)
+    slot_of = np.frombuffer(table.slot_of, dtype=np.int32)
+    ids = np.flatnonzero(slot_of >= 0)
+    order = slot_of[ids]
+    # Old slot -> new slot, -1 for the freed ones
+    moved = np.full(len(table.versions), -1, dtype=np.int64)
+    moved[order] = np.arange(len(order))
+    if renumber:
+        new_slot_of = np.arange(len(order), dtype=np.int32)
+    else:
+        new_slot_of = np.full(len(slot_of), -1, dtype=np.int32)
+        new_slot_of[ids] = np.arange(len(ids), dtype=np.int32)
+
+    # Another instance may be saving the same snapshot; each writes its own file
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    sections, texts, objects = {}, {}, {}
+    try:
+        with open(tmp_path, 'wb') as file:
+            file.write(MAGIC + bytes(16))
+
+            def put(data, align=ALIGN):
+                file.write(bytes(-file.tell() % align))
+                offset = file.tell()
+                file.write(data)
+                return [offset, file.tell() - offset]
+
+            sections['slot_of'] = put(new_slot_of)
+            for column in table.columns:
+                kind = table.kinds.get(column, list)
+                values = table.data[column]
+                for attribute, typecode in _parts(kind):
+                    dtype = np.uint8 if typecode is None else np.dtype(typecode)
+                    sections[f'{column}:{attribute}'] = put(np.frombuffer(getattr(values, attribute), dtype)[order])
+                if issubclass(kind, TextColumn):
+                    # Fields still point into the whole buffer, so it goes out as is
+                    texts[column] = put(values.buffer, PAGE)
+                elif issubclass(kind, CategoryColumn):
+                    objects[column] = values.categories
+                elif issubclass(kind, IntColumn):
+                    objects[column] = {int(moved[slot]): value for slot, value in values.odd.items()
+                                       if moved[slot] >= 0}
+                else:
+                    objects[column] = [values[slot] for slot in order.tolist()]
+            pickled = put(pickle.dumps({'columns': objects, 'malformed': list(malformed)},
+                                       protocol=pickle.HIGHEST_PROTOCOL))
+
+            header = json.dumps({
+                'version': SNAPSHOT_VERSION,
+                'signature': _plain(signature),
+                'byteorder': sys.byteorder,
+                'itemsizes': ITEMSIZES,
+                'columns': table.columns,
+                'kinds': _kind_names(table.columns, table.kinds),
+                'count': len(order),
+                'sections': sections,
+                'texts': texts,
+                'objects': pickled,
+            }).encode()
+            header_at = file.tell()
+            file.write(header)
+            file.seek(len(MAGIC))
+            file.write(struct.pack('<QQ', header_at, len(header)))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_table(path, signature, columns, kinds=None, clock=0):
+    """(table, malformed) from the snapshot at path, or (None, None).
+
+    Gives None if there's no snapshot, it can't be read, or it wasn't taken
+    of the stored table with this signature. columns and kinds are those
+    of the table the caller expects; a snapshot of any other is ignored.
+    Every record gets clock as its version, as with RecordTable.from_rows.
+    """
+    if signature is None:
+        return None, None
+    kinds = dict(kinds or {})
+    try:
+        with open(path, 'rb') as file:
+            # An empty file can't be mapped, which raises ValueError
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as whole, memoryview(whole) as view:
+                if whole[:len(MAGIC)] != MAGIC:
+                    return None, None
+                header_at, header_length = struct.unpack_from('<QQ', whole, len(MAGIC))
+                header = json.loads(whole[header_at:header_at + header_length])
+                if (header.get('version') != SNAPSHOT_VERSION or header['signature'] != _plain(signature)
+                        or header['byteorder'] != sys.byteorder or header['itemsizes'] != ITEMSIZES
+                        or header['columns'] != list(columns)
+                        or header['kinds'] != _kind_names(columns, kinds)):
+                    return None, None
+
+                def read(name, typecode):
+                    # One copy straight out of the mapping, and nothing parsed
+                    offset, length = header['sections'][name]
+                    data = view[offset:offset + length]
+                    if typecode is None:
+                        return bytearray(data)
+                    values = array(typecode)
+                    values.frombytes(data)
+                    return values
+
+                offset, length = header['objects']
+                objects = pickle.loads(whole[offset:offset + length])
+
+                table = RecordTable(columns, kinds, clock)
+                table.slot_of = read('slot_of', 'i')
+                table.count = header['count']
+                table.versions = array('i', [clock]) * table.count
+                for column in columns:
+                    kind = kinds.get(column, list)
+                    if kind is list:
+                        table.data[column] = objects['columns'][column]
+                        continue
+                    values = table.data[column]
+                    for attribute, typecode in _parts(kind):
+                        setattr(values, attribute, read(f'{column}:{attribute}', typecode))
+                    if issubclass(kind, TextColumn):
+                        offset, length = header['texts'][column]
+                        # Copy on write, so a field edited in place never reaches the file
+                        values.buffer = (mmap.mmap(file.fileno(), length, offset=offset, access=mmap.ACCESS_COPY)
+                                         if length else bytearray())
+                    elif issubclass(kind, CategoryColumn):
+                        values.categories = objects['columns'][column]
+                        values.index = dict(zip(values.categories, range(len(values.categories))))
+                    elif issubclass(kind, IntColumn):
+                        values.odd = objects['columns'][column]
+    except (OSError, ValueError, KeyError, TypeError, BufferError, struct.error, pickle.UnpicklingError, EOFError):
+        return None, None
+    return table, objects['malformed']
+
+
+def _release(table):
+    # Copy the text the table reads from its snapshot into memory and unmap
+    # the file, which can't be replaced on Windows while it is mapped
+    for column in table.columns:
+        values = table.data[column]
+        if isinstance(values, TextColumn) and isinstance(values.buffer, mmap.mmap):
+            mapping = values.buffer
+            values.buffer = bytearray(mapping)
+            mapping.close()
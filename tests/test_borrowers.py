@@ -0,0 +1,71 @@
+import os
+
+from borrowers import BorrowerRegistry
+from records import read_records
+from repository import LOAN_COLUMNS, PATRON_COLUMNS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def registry():
+    borrowers = BorrowerRegistry()
+    borrowers.register('Ann Lee', 'ann@example.com', '555-0100')
+    borrowers.register('Bob Lee', '', '555-0100')         # Ann's household phone
+    borrowers.register('Cat Ray')                         # no contact details
+    return borrowers
+
+
+def test_same_email_is_the_same_person():
+    assert registry().find('A. Lee', ' ANN@example.com ', '') == 0
+
+
+def test_same_phone_needs_the_same_name():
+    borrowers = registry()
+    assert borrowers.find('Bob Lee', '', '555-0100') == 1
+    assert borrowers.find('ann lee', '', '555-0100') == 0
+    # A third member of the household is someone new
+    assert borrowers.find('Dee Lee', '', '555-0100') is None
+
+
+def test_different_details_are_a_different_person():
+    borrowers = registry()
+    assert borrowers.find('Ann Lee', 'ann@example.com', '555-0199') is None
+    assert borrowers.find('Bob Lee', 'bob@example.com', '555-0100') == 1     # Bob had no email
+    assert borrowers.find('Ann Lee', 'other@example.com', '555-0100') is None
+
+
+def test_name_only_matches_a_borrower_without_contact_details():
+    borrowers = registry()
+    assert borrowers.find('cat ray') == 2
+    assert borrowers.find('Cat Ray', 'cat@example.com') is None
+    assert borrowers.find('Ann Lee') is None
+
+
+def test_added_borrowers_are_found_and_looked_up():
+    borrowers = registry()
+    row = borrowers.register('Dee Lee', '', '555-0100')
+    assert row[0] == '3'
+    assert borrowers.find('Dee Lee', '', '555-0100') == 3
+    assert borrowers.lookup('555-0100') == [0, 1, 3]
+    assert borrowers.lookup(' bob lee') == [1]
+    assert borrowers.record(3) == dict(zip(PATRON_COLUMNS, ['3', 'Dee Lee', '', '555-0100']))
+
+
+def test_from_rows_keeps_ids():
+    borrowers = BorrowerRegistry.from_rows([['4', 'Ann Lee', 'ann@example.com', ''], ['9', 'Bob', '', '']])
+    assert borrowers.find('Ann', 'ann@example.com') == 4
+    assert borrowers.find('Bob') == 9
+    assert borrowers.new_row('Cat')[0] == '10'
+
+
+def test_shipped_files_keep_relatives_apart():
+    # Every loan points at a registered borrower, and no two patrons are the
+    # same person by find()'s rule
+    patrons, malformed = read_records(os.path.join(ROOT, 'patrons.txt'), len(PATRON_COLUMNS))
+    assert not malformed
+    borrowers = BorrowerRegistry.from_rows(patrons)
+    loans, malformed = read_records(os.path.join(ROOT, 'borrowers.txt'), len(LOAN_COLUMNS))
+    assert not malformed
+    assert {int(loan[0]) for loan in loans} <= set(borrowers.table)
+    for borrower_id, (_, name, email, phone) in borrowers.table.items():
+        assert borrowers.find(name, email, phone) == borrower_id
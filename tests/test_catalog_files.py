@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from catalog_files import book_fields, read_books, write_books
+from library import Library
+
+
+def open_library(directory, backend='text'):
+    library = Library.open(str(directory), backend)
+    library.load()
+    return library
+
+
+@pytest.fixture(params=['text', 'sqlite'])
+def backend(request):
+    return request.param
+
+
+def test_an_import_adds_copies_to_the_books_it_already_has(tmp_path, backend):
+    library = open_library(tmp_path, backend)
+    dune = library.add_book('Dune', 'Frank Herbert', '1965')
+    library.borrow_book(dune, 'Ann Lee')
+    read = []
+    chunks = [[{'title': ' Dune ', 'author': 'Frank Herbert', 'year': 1965, 'copies': '2'},
+               {'title': 'Emma', 'author': 'Jane Austen', 'year': '1815'}],
+              [{'title': 'Emma', 'author': 'Jane Austen', 'year': '1815', 'copies': 3},
+               {'title': 'Emma', 'author': 'Jane Austen', 'year': '1816'}]]
+    assert library.import_books(chunks, read.append) == (2, 2, [])
+    assert read == [2, 4]
+    assert library.book_data.row(dune)[1:] == ['Dune', 'Frank Herbert', '1965', '3', '2']
+    assert sorted(row[1:] for row in library.book_data.rows() if row[1] == 'Emma') == [
+        ['Emma', 'Jane Austen', '1815', '4', '4'], ['Emma', 'Jane Austen', '1816', '1', '1']]
+    # Imported books are only searched once they are indexed
+    assert library.index_pending() == 0
+    assert len(library.search('emma')) == 2
+    library.close()
+
+    library = open_library(tmp_path, backend)
+    assert len(library.book_data) == 3
+    assert library.available(dune) == 2
+    library.close()
+
+
+def test_invalid_records_are_skipped_and_reported(tmp_path):
+    library = open_library(tmp_path)
+    chunks = [[{'title': 'Dune', 'author': 'Frank Herbert', 'year': '1965'},
+               None,
+               {'title': ' ', 'author': 'Jane Austen', 'year': '1815'}],
+              [{'title': 'Emma', 'author': 'Jane Austen'},
+               {'title': 'Emma', 'author': 'Jane Austen', 'year': '1815', 'copies': 'two'},
+               {'title': 'Emma', 'author': 'Jane Austen', 'year': '1815', 'copies': 0}]]
+    added, copied, invalid = library.import_books(chunks, None)
+    assert (added, copied) == (1, 0)
+    # Numbered across chunks, from one
+    assert invalid == [(2, "not a record"), (3, "no title"), (4, "no year"),
+                       (5, "copies is 'two', not a whole number"), (6, "copies is less than one")]
+    library.close()
+
+
+def test_book_fields_default_to_one_copy():
+    assert book_fields({'title': 'Dune', 'author': 'Frank Herbert', 'year': 1965}) == (
+        'Dune', 'Frank Herbert', '1965', 1)
+    assert book_fields({'title': 'Dune', 'author': 'Frank Herbert', 'year': '1965', 'copies': ' 4 '})[3] == 4
+
+
+@pytest.mark.parametrize('name', ['catalog.csv', 'catalog.jsonl'])
+def test_an_exported_catalog_reads_back(tmp_path, name):
+    path = str(tmp_path / name)
+    rows = [['Dune', 'Frank Herbert', '1965', 3, 2], ['Emma, again', 'Jane "J" Austen', '1815', 1, 1]]
+    written = []
+    write_books(path, rows, chunk_size=1, progress=written.append)
+    assert written == [1, 2]
+    chunks = list(read_books(path, chunk_size=1))
+    assert len(chunks) == 2
+    assert [book_fields(record) for chunk in chunks for record in chunk] == [
+        ('Dune', 'Frank Herbert', '1965', 3), ('Emma, again', 'Jane "J" Austen', '1815', 1)]
+
+
+def test_a_line_that_is_not_an_object_is_an_invalid_record(tmp_path):
+    path = tmp_path / 'catalog.jsonl'
+    path.write_text(json.dumps({'Title': 'Dune', 'Author': 'Frank Herbert', 'Year': '1965'}) + '\n[1, 2]\n{oops\n\n')
+    assert list(read_books(str(path))) == [[{'title': 'Dune', 'author': 'Frank Herbert', 'year': '1965'}, None, None]]
+
+
+def test_only_catalog_formats_are_read(tmp_path):
+    with pytest.raises(ValueError):
+        read_books(str(tmp_path / 'catalog.txt'))
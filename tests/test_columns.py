@@ -0,0 +1,60 @@
+import pytest
+
+from columns import CategoryColumn, DateColumn, IntColumn, TextColumn, YearColumn
+
+# Fields as the files hold them: spaces after the separators, odd values
+# among the numbers and dates, and None for a freed slot
+VALUES = {
+    TextColumn: ['Dune', ' The Hobbit', '', 'Crime, and Punishment', 'Éowyn', None],
+    CategoryColumn: ['Austen', ' Austen', 'Homer', 'Austen', '', None],
+    IntColumn: ['0', ' 12', '-3', '007', '+4', '1e3', 'x', '', '  99999999999', None],
+    YearColumn: [' 1851', '1949', '-800', ' 40000', 'c. 1600', None],
+    DateColumn: ['2024-10-05', ' 2024-09-13', '2024-9-13', '2024-02-30', 'soon', '', None],
+}
+
+
+@pytest.mark.parametrize('kind', VALUES)
+def test_gives_back_the_values_it_was_built_with(kind):
+    # Slots are only freed one at a time, never in bulk
+    values = [value for value in VALUES[kind] if value is not None]
+    assert list(kind(values)) == values
+
+
+@pytest.mark.parametrize('kind', VALUES)
+def test_gives_back_the_values_appended_and_set(kind):
+    values = VALUES[kind]
+    column = kind()
+    for value in values:
+        column.append(value)
+    assert list(column) == values
+    # Every slot set to the value of the slot before it
+    for slot in range(len(values) - 1, 0, -1):
+        column[slot] = values[slot - 1]
+    assert list(column) == values[:1] + values[:-1]
+
+
+def test_int_column_keeps_numbers_in_the_array_and_the_rest_aside():
+    column = IntColumn(['5', ' 6', '007', 'x'])
+    assert list(column.numbers) == [5, 6, 0, 0]
+    assert list(column.pads[:2]) == [0, 1]
+    assert column.odd == {2: '007', 3: 'x'}
+    assert [column.number(slot) for slot in range(4)] == [5, 6, None, None]
+
+
+def test_setting_a_number_over_an_odd_value_clears_it():
+    column = IntColumn(['x'])
+    column[0] = ' 3'
+    assert column.odd == {}
+    assert column[0] == ' 3'
+
+
+def test_date_column_days():
+    column = DateColumn(['2024-10-05', ' 2024-10-06', 'later'])
+    first = column.days()[0]
+    assert column.days() == [first, first + 1, None]
+
+
+def test_category_column_stores_each_value_once():
+    column = CategoryColumn(['a', 'b', 'a', 'a'])
+    assert column.categories == ['a', 'b']
+    assert list(column.codes) == [0, 1, 0, 0]
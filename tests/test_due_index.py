@@ -0,0 +1,74 @@
+import datetime
+
+from due_index import DueIndex, day_number
+
+TODAY = datetime.date(2024, 10, 10).toordinal()
+
+
+def loans():
+    # loan id -> (borrower, return date)
+    return {0: ('ann', '2024-10-05'), 1: ('bob', '2024-10-12'), 2: ('ann', ' 2024-10-01'),
+            3: ('bob', 'someday'), 4: ('cat', '2024-10-10'), 5: ('ann', '2024-10-20')}
+
+
+def built():
+    given = loans()
+    return DueIndex.build(list(given), [borrower for borrower, _ in given.values()],
+                          [day_number(date) for _, date in given.values()])
+
+
+def added():
+    index = DueIndex()
+    for loan_id, (borrower, date) in loans().items():
+        index.add(loan_id, borrower, date)
+    return index
+
+
+def test_day_number():
+    assert day_number(' 2024-10-10') == TODAY
+    assert day_number('2024-02-30') is None
+    assert day_number(None) is None
+
+
+def test_built_and_added_indexes_agree():
+    first, second = built(), added()
+    assert first.keys == second.keys
+    assert first.undated == second.undated == {3}
+    assert len(first) == len(second) == 6
+
+
+def test_overdue_is_most_overdue_first():
+    assert built().overdue(TODAY) == [2, 0]
+
+
+def test_due_within_includes_both_ends():
+    assert built().due_within(2, TODAY) == [4, 1]
+    assert built().between(TODAY - 9, TODAY - 9) == [2]
+
+
+def test_outstanding_per_borrower():
+    index = built()
+    assert index.outstanding('ann') == [2, 0, 5]
+    # Undated loans are only in undated
+    assert index.outstanding('bob') == [1]
+    assert index.outstanding('nobody') == []
+
+
+def test_remove_takes_the_loan_out_everywhere():
+    index = built()
+    index.outstanding('ann')    # builds the per-borrower lists
+    for loan_id in (0, 3, 4):
+        index.remove(loan_id)
+    assert index.overdue(TODAY) == [2]
+    assert index.due_within(2, TODAY) == [1]
+    assert index.outstanding('ann') == [2, 5]
+    assert index.undated == set()
+    assert index.due_day(0) is None
+    assert len(index) == 3
+
+
+def test_add_after_the_per_borrower_lists_are_built():
+    index = built()
+    index.outstanding('ann')
+    index.add(9, 'ann', '2024-10-02')
+    assert index.outstanding('ann') == [2, 9, 0, 5]
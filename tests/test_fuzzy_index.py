@@ -0,0 +1,54 @@
+import pytest
+
+from fuzzy_index import Vocabulary, distance, max_edits
+
+
+def reference(a, b):
+    # Optimal string alignment distance, filling the whole table
+    table = [[i + j if not i * j else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            table[i][j] = min(table[i - 1][j] + 1, table[i][j - 1] + 1, table[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                table[i][j] = min(table[i][j], table[i - 2][j - 2] + 1)
+    return table[len(a)][len(b)]
+
+
+@pytest.mark.parametrize('a, b, edits', [
+    ('', '', 0), ('', 'abc', 3), ('abc', '', 3), ('dune', 'dune', 0),
+    ('fitzgerald', 'fitzgerlad', 1),      # a swap is one edit
+    ('dostoevsky', 'dostoyevsky', 1),     # an insertion
+    ('tolkien', 'tolkein', 1),
+    ('orwell', 'orwel', 1),
+    ('kitten', 'sitting', 3),
+    ('ca', 'abc', 3),                     # no edits inside a swapped pair
+])
+def test_distance(a, b, edits):
+    assert distance(a, b) == edits
+    assert distance(b, a) == edits
+
+
+def test_distance_matches_the_full_table():
+    words = ['austen', 'asuten', 'austin', 'usten', 'austenn', 'hemingway', 'hemmingway', 'a', 'ab', 'ba',
+             'tolstoy', 'tolstoi', 'dickens', 'dikcens', 'x' * 70, 'x' * 69 + 'y']
+    for a in words:
+        for b in words:
+            assert distance(a, b) == reference(a, b), (a, b)
+
+
+def test_max_edits():
+    assert [max_edits(word) for word in ('the', 'dune', 'tolkiens', 'dostoevsky')] == [0, 1, 1, 2]
+
+
+def test_similar_finds_words_within_the_allowed_edits():
+    vocabulary = Vocabulary()
+    for word in ('fitzgerald', 'fitzgerlad', 'gerald', 'dostoevsky', 'dune', 'june', '1984'):
+        vocabulary.add(word)
+    assert '1984' not in vocabulary.words
+    found = dict(vocabulary.similar('fitzgerald'))
+    assert set(found) == {'fitzgerald', 'fitzgerlad'}
+    assert found['fitzgerald'] == 1.0 > found['fitzgerlad']
+    assert [word for word, _ in vocabulary.similar('dostoyevsky')] == ['dostoevsky']
+    assert {word for word, _ in vocabulary.similar('dune')} == {'dune', 'june'}
+    # Short words must match exactly
+    assert vocabulary.similar('dun') == []
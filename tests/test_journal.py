@@ -0,0 +1,50 @@
+from journal import apply_records
+
+
+def insert(row):
+    return {'op': 'insert', 'row': row}
+
+
+def delete(row):
+    return {'op': 'delete', 'row': row}
+
+
+def update(row, new):
+    return {'op': 'update', 'row': row, 'new': new}
+
+
+def test_no_records_returns_rows_unchanged():
+    rows = [['0', 'a']]
+    assert apply_records(rows, []) is rows
+
+
+def test_insert_appends():
+    assert apply_records([['0', 'a']], [insert(['1', 'b'])]) == [['0', 'a'], ['1', 'b']]
+
+
+def test_delete_drops_only_the_first_matching_row():
+    rows = [['1', 'x'], ['2', 'y'], ['1', 'x']]
+    assert apply_records(rows, [delete(['1', 'x'])]) == [['2', 'y'], ['1', 'x']]
+
+
+def test_update_changes_the_row_in_place():
+    rows = [['0', 'a'], ['1', 'b'], ['2', 'c']]
+    assert apply_records(rows, [update(['1', 'b'], ['1', 'B'])]) == [['0', 'a'], ['1', 'B'], ['2', 'c']]
+
+
+def test_records_apply_in_order():
+    # A row inserted, updated and then deleted by later records
+    records = [insert(['5', 'new']), update(['5', 'new'], ['5', 'newer']), update(['0', 'a'], ['0', 'A']),
+               delete(['5', 'newer'])]
+    assert apply_records([['0', 'a']], records) == [['0', 'A']]
+
+
+def test_record_for_a_missing_row_is_ignored():
+    rows = [['0', 'a']]
+    assert apply_records(rows, [delete(['9', 'z']), update(['8', 'y'], ['8', 'Y'])]) == [['0', 'a']]
+
+
+def test_rows_are_not_modified():
+    rows = [['0', 'a'], ['1', 'b']]
+    apply_records(rows, [delete(['0', 'a']), update(['1', 'b'], ['1', 'B'])])
+    assert rows == [['0', 'a'], ['1', 'b']]
@@ -0,0 +1,150 @@
+import datetime
+import subprocess
+import sys
+
+import pytest
+
+from analytics import Snapshot, report
+from library import Library
+
+
+def open_library(directory, backend='text'):
+    library = Library.open(str(directory), backend)
+    library.load()
+    return library
+
+
+@pytest.fixture(params=['text', 'sqlite'])
+def backend(request):
+    return request.param
+
+
+def lend_and_return(library):
+    book_id = library.add_book('Dune', 'Frank Herbert', '1965')
+    library.add_book('Dune', 'Frank Herbert', '1965')
+    first = library.borrow_book(book_id, 'Ann Lee', 'ann@example.com', return_date='2024-01-15',
+                                borrow_date='2024-01-01')
+    library.borrow_book(book_id, 'Bob Lee', '', '555-0100', return_date='2024-02-15', borrow_date='2024-02-01')
+    library.return_book(first, returned_on='2024-01-11')
+    return book_id
+
+
+def test_importing_the_core_leaves_out_the_gui_and_the_models():
+    code = ("import sys, library; "
+            "print(' '.join(sorted({'PyQt5', 'pandas', 'nltk', 'numpy', 'torch', 'transformers'} & set(sys.modules))))")
+    loaded = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert loaded.strip() == ''
+
+
+def test_catalog_loans_and_reviews_without_a_display(tmp_path, backend):
+    library = open_library(tmp_path, backend)
+    book_id = library.add_book('Dune', 'Frank Herbert', '1965')
+    assert library.search('herbert') == [book_id]
+    loan_id = library.borrow_book(book_id, 'Ann Lee', 'ann@example.com', return_date='2024-01-15')
+    assert library.loan_record(loan_id)['Title'] == 'Dune'
+    assert library.loan_value(loan_id, 'Borrower') == 'Ann Lee'
+    assert library.return_book(loan_id) == book_id
+    library.add_review('Dune', 'Great')
+    library.close()
+
+    library = open_library(tmp_path, backend)
+    assert [row[1:4] for row in library.book_data.rows()] == [['Dune', 'Frank Herbert', '1965']]
+    assert list(library.borrowed_books) == []
+    assert library.reviews_for('dune') == ['Great']
+    library.close()
+
+
+def test_adding_a_book_needs_every_field(tmp_path):
+    library = open_library(tmp_path)
+    with pytest.raises(ValueError):
+        library.add_book('Dune', '', '1965')
+    library.close()
+
+
+@pytest.mark.parametrize('dates', [{'return_date': 'not-a-date'}, {'return_date': '2024-2-30'},
+                                   {'return_date': ' 2024-10-05'}, {'borrow_date': '05/10/2024'}])
+def test_a_loan_needs_real_dates(tmp_path, dates):
+    library = open_library(tmp_path)
+    book_id = library.add_book('Dune', 'Frank Herbert', '1965')
+    with pytest.raises(ValueError):
+        library.borrow_book(book_id, 'Ann Lee', **dates)
+    # Nothing was lent or stored
+    assert library.available(book_id) == 1 and len(library.borrowed_books) == 0
+    library.close()
+    library = open_library(tmp_path)
+    assert list(library.borrowed_books) == []
+    library.close()
+
+
+@pytest.mark.parametrize('borrower', ['', '   '])
+def test_a_loan_needs_a_borrower(tmp_path, borrower):
+    library = open_library(tmp_path)
+    book_id = library.add_book('Dune', 'Frank Herbert', '1965')
+    with pytest.raises(ValueError):
+        library.borrow_book(book_id, borrower, return_date='2024-10-05')
+    assert library.available(book_id) == 1 and len(library.borrowers) == 0
+    library.close()
+
+
+def test_every_loan_is_in_the_due_date_index(tmp_path):
+    library = open_library(tmp_path)
+    book_id = library.add_book('Dune', 'Frank Herbert', '1965')
+    library.add_book('Dune', 'Frank Herbert', '1965')
+    late = library.borrow_book(book_id, 'Ann Lee', borrow_date='2024-01-01', return_date='2024-01-15')
+    soon = library.borrow_book(book_id, 'Bob Lee', return_date='')
+    today = datetime.date(2024, 2, 1)
+    assert library.overdue(today) == [late]
+    assert library.due_within(14, datetime.date.today()) == [soon]
+    assert library.due_index.undated == set()
+    library.close()
+
+
+def test_borrowers_sharing_a_phone_stay_apart(tmp_path):
+    library = open_library(tmp_path)
+    ann = library.borrower_id('Ann Lee', '', '555-0100')
+    assert library.borrower_id('Bob Lee', '', '555-0100') != ann
+    assert library.borrower_id('ann lee', '', '555-0100') == ann
+    library.close()
+
+
+def test_a_returned_loan_moves_to_the_history(tmp_path, backend):
+    library = open_library(tmp_path, backend)
+    book_id = lend_and_return(library)
+    assert list(library.loan_history.rows()) == [['0', str(book_id), '2024-01-01', '2024-01-15', '2024-01-11']]
+    counters = library.circulation
+    assert (counters.loans, counters.ended, counters.borrowers()) == (1, 1, 1)
+    assert counters.most_borrowed(1) == [(book_id, 2)]
+    # Ten days from borrowing to bringing it back, not the fourteen it was lent for
+    assert counters.average_days() == 10
+    library.close()
+
+    # The same after loading everything again
+    library = open_library(tmp_path, backend)
+    assert len(library.loan_history) == 1
+    assert (library.circulation.loans, library.circulation.ended, library.circulation.average_days()) == (1, 1, 10)
+    library.close()
+
+
+def test_report_counts_every_loan_on_record(tmp_path):
+    library = open_library(tmp_path)
+    lend_and_return(library)
+    tables = report(Snapshot(library))
+    summary = dict(tables['Summary'][1])
+    assert (summary['Loans out'], summary['Loans returned']) == (1, 1)
+    assert summary['Average loan length (days)'] == 10
+    assert tables['Loan lengths'][1] == [(10, 1)]
+    assert [row[3] for row in tables['Most borrowed books'][1]] == [2]
+    assert tables['Loans by month'][1] == [('2024-01', 1), ('2024-02', 1)]
+    library.close()
+
+
+def test_other_instances_see_returns(tmp_path, backend):
+    first, second = open_library(tmp_path, backend), open_library(tmp_path, backend)
+    book_id = lend_and_return(first)
+    first.sync()
+    assert second.refresh() == (True, 0, None)
+    assert second.available(book_id) == 1
+    assert list(second.loan_history.rows()) == list(first.loan_history.rows())
+    assert (second.circulation.ended, second.circulation.average_days()) == (1, 10)
+    first.close()
+    second.close()
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import pytest
+
+import library_server
+from library import Library
+from library_server import LibraryServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    library = Library.open(str(tmp_path))
+    library.load()
+    library.add_book('Dune', 'Frank Herbert', '1965')
+    server = LibraryServer(library)
+    yield server
+    server.close()
+
+
+def ask(server, request):
+    line = request if isinstance(request, bytes) else json.dumps(request).encode()
+    return asyncio.run(server.answer(line))
+
+
+def test_requests_are_answered(server):
+    assert ask(server, {'id': 1, 'op': 'ping'}) == {'id': 1, 'ok': True, 'result': 'pong'}
+    loan = ask(server, {'id': 2, 'op': 'borrow', 'book_id': 0, 'borrower': 'Ann Lee', 'return_date': '2024-10-05'})
+    assert loan['ok']
+    assert ask(server, {'op': 'loan', 'loan_id': loan['result']})['result']['Title'] == 'Dune'
+    assert ask(server, {'op': 'outstanding', 'borrower': 'ann lee'})['ok']
+
+
+@pytest.mark.parametrize('request_, error', [
+    (b'not json', None),
+    ([1, 2], "A request must be a JSON object"),
+    ({'op': 'fly'}, "Unknown op"),
+    ({'op': 'book'}, "book_id"),
+    ({'op': 'book', 'book_id': '0'}, "book_id"),
+    ({'op': 'book', 'book_id': True}, "book_id"),
+    ({'op': 'book', 'book_id': 0, 'colour': 'red'}, "colour"),
+    ({'op': 'search', 'query': None}, "query"),
+    ({'op': 'borrow', 'book_id': 0, 'borrower': 'Ann', 'return_date': 5}, "return_date"),
+    ({'op': 'borrow', 'book_id': 0, 'borrower': 'Ann', 'return_date': 'soon'}, "return date"),
+    ({'op': 'book', 'book_id': 7}, "No such record"),
+])
+def test_bad_requests_get_an_error_reply(server, request_, error):
+    reply = ask(server, request_)
+    assert reply['ok'] is False
+    if error is not None:
+        assert error in reply['error']
+
+
+def test_nullable_fields_may_be_null(server):
+    assert ask(server, {'op': 'borrow', 'book_id': 0, 'borrower': 'Ann', 'return_date': None, 'version': None})['ok']
+
+
+def test_a_bug_is_an_error_reply_and_the_server_carries_on(server, monkeypatch):
+    monkeypatch.setattr(LibraryServer, 'op_ping', lambda self: 1 / 0, raising=True)
+    reply = ask(server, {'id': 3, 'op': 'ping'})
+    assert reply['id'] == 3 and not reply['ok'] and 'ZeroDivisionError' in reply['error']
+    monkeypatch.undo()
+    assert ask(server, {'op': 'ping'})['ok']
+
+
+def test_refresh_picks_up_what_other_instances_save(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(library_server, 'REFRESH_SECONDS', 0.01)
+    other = Library.open(str(tmp_path))
+    other.load()
+    other.add_book('Emma', 'Jane Austen', '1815')
+
+    async def refreshed():
+        task = asyncio.create_task(server.refresh())
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            if len(server.library.book_data) == 2:
+                break
+        task.cancel()
+        return await server.answer(json.dumps({'op': 'search', 'query': 'emma'}).encode())
+
+    assert [book[1] for book in asyncio.run(refreshed())['result']['books']] == ['Emma']
+    other.close()
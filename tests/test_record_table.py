@@ -0,0 +1,53 @@
+import pytest
+
+from columns import DateColumn, IntColumn
+from record_table import RecordTable
+
+COLUMNS = ['Borrower ID', 'Book ID', 'Borrow Date']
+KINDS = {'Borrower ID': IntColumn, 'Book ID': IntColumn, 'Borrow Date': DateColumn}
+ROWS = [['0', '4', '2024-09-13'], ['1', ' 7', 'soon'], ['2', '4', ' 2024-09-14']]
+
+
+@pytest.mark.parametrize('kinds', [None, KINDS])
+def test_records_keep_their_ids(kinds):
+    table = RecordTable.from_rows(COLUMNS, ROWS, [2, 5, 6], kinds)
+    assert list(table) == [2, 5, 6] and table.next_id == 7
+    assert table.row(5) == ROWS[1]
+    assert table.value(6, 'Borrow Date') == ' 2024-09-14'
+    assert table.record(2) == dict(zip(COLUMNS, ROWS[0]))
+    assert table.values([6, 2], 'Book ID') == ['4', '4']
+    assert 3 not in table and 5 in table
+
+
+@pytest.mark.parametrize('kinds', [None, KINDS])
+def test_freed_slots_are_reused_without_renumbering(kinds):
+    table = RecordTable.from_rows(COLUMNS, ROWS, kinds=kinds)
+    assert table.delete(1) == ROWS[1]
+    assert table.insert(['9', '9', '2025-01-01']) == 3
+    assert table.data['Book ID'][1] == '9'
+    assert list(table.items()) == [(0, ROWS[0]), (2, ROWS[2]), (3, ['9', '9', '2025-01-01'])]
+    assert len(table) == 3
+    with pytest.raises(ValueError):
+        table.insert(ROWS[0], 3)
+
+
+def test_ids_must_increase():
+    with pytest.raises(ValueError):
+        RecordTable.from_rows(COLUMNS, ROWS[:2], [3, 3])
+
+
+def test_versions_change_with_every_write():
+    table = RecordTable.from_rows(COLUMNS, ROWS, clock=5)
+    assert {table.version(record_id) for record_id in table} == {5}
+    table.update(0, ['0', '5', '2024-09-13'])
+    first = table.version(0)
+    assert first > 5 and table.version(1) == 5
+    table.update(0, ['0', '6', '2024-09-13'])
+    assert table.version(0) > first
+
+
+def test_extend_adds_rows_under_new_ids():
+    table = RecordTable.from_rows(COLUMNS, ROWS, kinds=KINDS)
+    table.delete(0)
+    assert table.extend(ROWS) == range(3, 6)
+    assert list(table.rows()) == ROWS[1:] + ROWS
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+import repository
+from library import REVIEW_FILE, Library
+from records import (FORMAT_VERSION, MAGIC, data_start, file_version, format_records, parse_review, read_records,
+                     scan_records)
+
+COLUMNS = ['Book ID', 'Title', 'Year']
+ROWS = [['0', 'Dune', '1965'],
+        ['1', 'Crime, and Punishment', '1866'],
+        ['2', 'The "Best" Poems', '1900'],
+        ['3', 'Two\nlines', '']]
+
+
+def write(path, text):
+    path.write_text(text, encoding='utf-8', newline='')
+    return path
+
+
+def test_round_trip(tmp_path):
+    path = write(tmp_path / 'books.txt', ''.join(format_records(ROWS, COLUMNS, {'Book ID': 'int'})))
+    assert path.read_text(encoding='utf-8').splitlines()[:2] == [f"{MAGIC} {FORMAT_VERSION}",
+                                                                 'Book ID:int,Title:text,Year:text']
+    assert read_records(path, 3) == (ROWS, [])
+    assert file_version(path) == FORMAT_VERSION
+
+
+def test_malformed_records_are_reported_with_their_line(tmp_path):
+    text = ''.join(format_records(ROWS[:2], COLUMNS)) + '9,too few\n\n' + ''.join(format_records(ROWS[2:], COLUMNS)).split('\n', 2)[2]
+    rows, malformed = read_records(write(tmp_path / 'books.txt', text), 3)
+    assert rows == ROWS
+    assert malformed == [(5, '9,too few')]
+
+
+def test_legacy_files_split_on_every_comma(tmp_path):
+    path = write(tmp_path / 'books.txt', '1984, George Orwell, 1949\n\nCrime, and Punishment, Fyodor Dostoevsky, 1866\n')
+    rows, malformed = read_records(path, 3)
+    assert rows == [['1984', ' George Orwell', ' 1949']]
+    assert malformed == [(3, 'Crime, and Punishment, Fyodor Dostoevsky, 1866')]
+    assert file_version(path) == 1
+
+
+def test_newer_format_is_refused(tmp_path):
+    path = write(tmp_path / 'books.txt', f"{MAGIC} {FORMAT_VERSION + 1}\nBook ID:int\n0\n")
+    with pytest.raises(ValueError):
+        read_records(path, 1)
+
+
+def test_missing_and_empty_files_have_no_version(tmp_path):
+    assert file_version(tmp_path / 'missing.txt') is None
+    assert file_version(write(tmp_path / 'empty.txt', '')) is None
+
+
+def test_scan_records_skips_a_record_still_being_written(tmp_path):
+    text = ''.join(format_records([['Dune', 'Good'], ['Emma', 'Long,\n"quoted"']], ['Title', 'Review']))
+    path = write(tmp_path / 'reviews.txt', text + 'Half,written')
+    with open(path, 'rb') as file:
+        assert data_start(file)
+        records = list(scan_records(file, True))
+    assert [parse_review(record, True) for _, _, record in records] == [('Dune', 'Good'),
+                                                                        ('Emma', 'Long,\n"quoted"')]
+    # Offsets and ends point at the records in the file
+    start, end, record = records[1]
+    assert path.read_bytes()[start:end] == record
+
+
+def test_parse_review():
+    assert parse_review(b' Dune : Great, really\n', False) == ('Dune', 'Great, really')
+    assert parse_review(b'no review here\n', False) is None
+    assert parse_review(b'Dune,Great\n', True) == ('Dune', 'Great')
+    assert parse_review(b'"Crime, and Punishment","Long"\n', True) == ('Crime, and Punishment', 'Long')
+    assert parse_review(b'Dune\n', True) is None
+
+
+def test_legacy_reviews_have_no_header(tmp_path):
+    with open(write(tmp_path / 'reviews.txt', 'Dune: Great\n'), 'rb') as file:
+        assert not data_start(file)
+        assert [parse_review(record, False) for _, _, record in scan_records(file, False)] == [('Dune', 'Great')]
+
+
+def open_text_library(directory):
+    library = Library.open(str(directory), 'text')
+    library.load()
+    return library
+
+
+def test_a_review_the_legacy_format_cant_hold_upgrades_the_file(tmp_path):
+    reviews = write(tmp_path / REVIEW_FILE, 'Dune: Great\n')
+    library = open_text_library(tmp_path)
+    library.add_review('Dune', 'Fine')
+    assert file_version(reviews) == 1
+    library.add_review('Dune: Messiah', 'Two\nlines')
+    assert file_version(reviews) == FORMAT_VERSION
+    assert library.reviews() == [('Dune', 'Great'), ('Dune', 'Fine'), ('Dune: Messiah', 'Two\nlines')]
+    library.close()
+
+
+def test_reviews_added_while_another_instance_upgrades_the_file_are_kept(tmp_path, monkeypatch):
+    write(tmp_path / REVIEW_FILE, 'Dune: Great\n')
+    libraries = [open_text_library(tmp_path) for _ in range(4)]
+
+    def slow_file_version(path):
+        # Widens the gap between looking at the file and appending to it
+        version = file_version(path)
+        time.sleep(0.001)
+        return version
+
+    monkeypatch.setattr(repository, 'file_version', slow_file_version)
+
+    def add(library, title):
+        for number in range(25):
+            library.add_review(title, f"Review {number}")
+
+    # Titles with a colon need the record format, so the first of them upgrades the file
+    threads = [threading.Thread(target=add, args=(library, title))
+               for library, title in zip(libraries, ['Dune', 'Emma', 'Dune: Messiah', 'Emma'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert file_version(tmp_path / REVIEW_FILE) == FORMAT_VERSION
+    reviews = libraries[0].reviews()
+    assert len(reviews) == 101
+    assert sum(title == 'Dune: Messiah' for title, _ in reviews) == 25
+    for library in libraries:
+        library.close()
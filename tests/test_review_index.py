@@ -0,0 +1,53 @@
+import pytest
+
+from library import Library
+from review_index import ReviewIndex
+
+
+def append(path, text):
+    with open(path, 'a', encoding='utf-8', newline='') as f:
+        f.write(text)
+
+
+def test_catch_up_indexes_only_complete_records(tmp_path):
+    path = tmp_path / 'reviews.txt'
+    append(path, 'Dune: Great\nEmma: Fine\n')
+    index = ReviewIndex.open(str(path), str(tmp_path / 'reviews.idx'))
+    assert index.reviews_for(' dune ') == ['Great']
+    append(path, 'Dune: Also good\nEmma: half')
+    assert index.grown()
+    index.catch_up()
+    assert index.count('DUNE') == 2 and index.count('Emma') == 1
+    assert index.reviews_for('Dune', [1, 5]) == ['Also good']
+    append(path, ' written\n')
+    index.catch_up()
+    assert index.reviews_for('emma') == ['Fine', 'half written']
+    assert not index.grown()
+
+
+def test_saved_index_is_reused_unless_the_file_was_rewritten(tmp_path):
+    path, index_path = tmp_path / 'reviews.txt', str(tmp_path / 'reviews.idx')
+    append(path, 'Dune: Great\n')
+    ReviewIndex.open(str(path), index_path).save()
+    append(path, 'Dune: Again\n')
+    assert ReviewIndex.open(str(path), index_path).reviews_for('Dune') == ['Great', 'Again']
+    # Same size, different text: the saved offsets mean nothing any more
+    path.write_text('Emma: Great\nEmma: Again\n', encoding='utf-8')
+    index = ReviewIndex.open(str(path), index_path)
+    assert index.count('Dune') == 0 and index.reviews_for('Emma') == ['Great', 'Again']
+
+
+@pytest.mark.parametrize('backend', ['text', 'sqlite'])
+def test_a_review_another_instance_adds_shows_up(tmp_path, backend):
+    first, second = Library.open(str(tmp_path), backend), Library.open(str(tmp_path), backend)
+    first.load()
+    second.load()
+    # Both have their index open before either adds a review
+    assert first.review_count('Dune') == second.review_count('Dune') == 0
+    first.add_review('Dune', 'Great')
+    assert second.review_count('dune') == 1
+    second.add_review('Dune', 'Long, and "quoted"')
+    assert first.reviews_for('Dune') == second.reviews_for('Dune') == ['Great', 'Long, and "quoted"']
+    assert first.reviews_for('Dune', [1]) == ['Long, and "quoted"']
+    first.close()
+    second.close()
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from library import Library
+from repository import ConflictError
+
+STRESS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks',
+                      'stress_transactions.py')
+
+
+def open_library(directory, backend='text'):
+    library = Library.open(str(directory), backend)
+    library.load()
+    return library
+
+
+@pytest.fixture(params=['text', 'sqlite'])
+def backend(request):
+    return request.param
+
+
+def test_other_instances_see_changes_and_conflicts(tmp_path, backend):
+    first, second = open_library(tmp_path, backend), open_library(tmp_path, backend)
+    book_id = first.add_book('Dune', 'Frank Herbert', '1965')
+    first.add_book('Dune', 'Frank Herbert', '1965')
+    first.borrow_book(book_id, 'Ann Lee')
+    first.sync()
+    assert second.refresh() == (True, 0, None)
+    assert second.available(book_id) == 1
+    # Both take the last copy; the second one to save loses
+    first.borrow_book(book_id, 'Cat Ray')
+    first.sync()
+    with pytest.raises(ConflictError):
+        second.borrow_book(book_id, 'Dee Ray', version=second.book_data.version(book_id))
+    assert second.available(book_id) == 0
+    first.close()
+    second.close()
+
+
+@pytest.mark.parametrize('options', [['--backend', 'text'], ['--backend', 'sqlite'],
+                                     ['--backend', 'text', '--background'], ['--backend', 'sqlite', '--background']])
+def test_instances_lending_at_once_never_lose_or_double_a_copy(tmp_path, options):
+    result = subprocess.run([sys.executable, STRESS, '--workers', '3', '--cycles', '30', '--titles', '4',
+                             '--copies', '2'] + options, cwd=tmp_path, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'OK: every copy is accounted for exactly once' in result.stdout
@@ -0,0 +1,81 @@
+import errno
+
+import pytest
+
+from library import Library
+
+
+class FullDisk:
+    # Makes the repository under a StorageWriter fail its next commits
+    def __init__(self, storage, times=1):
+        self.storage, self.commit, self.times = storage, storage.commit, times
+        storage.commit = self
+
+    def __call__(self, changes):
+        if self.times:
+            self.times -= 1
+            raise OSError(errno.ENOSPC, "No space left on device")
+        self.commit(changes)
+
+
+def open_library(directory, backend='text'):
+    library = Library.open(str(directory), backend, background=True)
+    library.load()
+    return library
+
+
+@pytest.fixture(params=['text', 'sqlite'])
+def backend(request):
+    return request.param
+
+
+def test_a_failed_write_comes_back_through_refresh(tmp_path, backend):
+    library = open_library(tmp_path, backend)
+    book_id = library.add_book('Dune', 'Frank Herbert', '1965')
+    library.add_book('Emma', 'Jane Austen', '1815')
+    library.refresh()
+    FullDisk(library.storage.storage)
+    # Neither call raises, though the first isn't saved and the second builds on it
+    library.borrow_book(book_id, 'Ann Lee')
+    library.edit_book(book_id, 'Dune', 'Frank Herbert', '1966')
+    changed, dropped, failure = library.refresh()
+    assert changed and dropped == 2
+    assert isinstance(failure, OSError) and failure.errno == errno.ENOSPC
+    # What is in memory is what is stored again
+    assert len(library.borrowed_books) == 0 and library.available(book_id) == 1
+    assert library.book_data.value(book_id, 'Year') == '1965'
+    assert library.refresh() == (False, 0, None)
+    # Later changes are saved as usual
+    library.borrow_book(book_id, 'Ann Lee')
+    assert library.refresh() == (False, 0, None)
+    library.close()
+    library = open_library(tmp_path, backend)
+    assert len(library.borrowed_books) == 1
+    library.close()
+
+
+def test_a_failure_no_refresh_reported_is_raised_by_close(tmp_path):
+    library = open_library(tmp_path)
+    book_id = library.add_book('Dune', 'Frank Herbert', '1965')
+    FullDisk(library.storage.storage)
+    library.borrow_book(book_id, 'Ann Lee')
+    with pytest.raises(OSError):
+        library.close()
+
+
+def test_conflicts_are_dropped_without_a_failure(tmp_path, backend):
+    first, second = open_library(tmp_path, backend), open_library(tmp_path, backend)
+    book_id = first.add_book('Dune', 'Frank Herbert', '1965')
+    # refresh() waits for the storage thread, so the book is stored by then
+    first.sync()
+    first.refresh()
+    second.refresh()
+    first.remove_book(book_id)
+    first.sync()
+    first.refresh()
+    # second still has the book and lends it; the storage thread finds it gone
+    second.borrow_book(book_id, 'Ann Lee')
+    assert second.refresh() == (True, 1, None)
+    assert book_id not in second.book_data
+    first.close()
+    second.close()
@@ -0,0 +1,174 @@
+"""Storage calls on a background thread, so the GUI never waits for the disk."""
+import queue
+import threading
+from concurrent.futures import Future
+
+from repository import ConflictError
+
+_STOP = object()
+# Calls that change the library's tables
+_CHANGES = {'commit'}
+
+
+class StorageWriter:
+    """Runs every call on a TextRepository or SqliteRepository on one thread.
+
+    Changes (commit, add_review, compact_if_needed, sync) return at once and
+    are applied in the order they were made. Whatever queues up while the
+    thread is busy is applied as one batch: one journal write for the text
+    files, one transaction for SQLite, so a burst of edits costs a single
+    write. Everything else, like load and reviews_for,
+    runs on the thread too, once every change made before it is stored, and
+    blocks the caller until it has a result.
+
+    A change that fails can't raise in the code that made it. Instead it is
+    dropped and counted, whether it conflicts with another instance's or
+    couldn't be written (a full disk, say), and the next poll() reports the
+    count, with the error of a change that couldn't be written, and has the
+    caller load everything again. Changes queued after it may build on it,
+    so they are dropped too until that poll().
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        if hasattr(storage, 'files'):
+            self.files = storage.files
+        self.tasks = queue.SimpleQueue()
+        # Changes dropped since the last poll(), and the error of the first
+        # one that failed for another reason than a conflict; taken together
+        self.counting = threading.Lock()
+        self.dropped = 0
+        self.failure = None
+        self.thread = threading.Thread(target=self._run, name='storage-writer', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.tasks.get()]
+            while True:
+                try:
+                    batch.append(self.tasks.get_nowait())
+                except queue.Empty:
+                    break
+            # A call runs after the changes before it are stored, not just
+            # queued, so once poll() returns, say, other instances can see them
+            changes = []
+            for task in batch:
+                if task[0] is None:
+                    changes.append(task)
+                    continue
+                self._write(changes)
+                changes = []
+                if task[1] is _STOP:
+                    # close() is the last call, nothing can follow it
+                    self._execute(task[0], 'close', ())
+                    return
+                self._execute(*task)
+            self._write(changes)
+
+    def _write(self, changes):
+        if changes:
+            with self.storage.batch():
+                for task in changes:
+                    self._execute(*task)
+
+    def _execute(self, future, method, args):
+        if self.dropped and method in _CHANGES:
+            self._drop(None)
+            return
+        try:
+            result = getattr(self.storage, method)(*args)
+        except Exception as error:
+            if future is None:
+                self._drop(None if isinstance(error, ConflictError) else error)
+            else:
+                future.set_exception(error)
+        else:
+            if future is not None:
+                future.set_result(result)
+
+    def _drop(self, error):
+        with self.counting:
+            self.dropped += 1
+            self.failure = self.failure or error
+
+    def _queue(self, method, *args):
+        self.tasks.put((None, method, args))
+
+    def _call(self, method, *args):
+        future = Future()
+        self.tasks.put((future, method, args))
+        return future.result()
+
+    # Changes, applied in the background
+    def commit(self, changes):
+        self._queue('commit', [(table, op, list(row), new and list(new)) for table, op, row, new in changes])
+
+    def add_review(self, title, review):
+        self._queue('add_review', title, review)
+
+    def compact_if_needed(self, snapshot):
+        # snapshot reads the live tables, which are ahead of the queue, so the
+        # repository compacts what it has stored itself
+        self._queue('compact_if_needed', None)
+
+    def sync(self):
+        self._queue('sync')
+
+    # Reads and whole-file writes, which wait for the queue to get to them
+    def exists(self, table):
+        return self._call('exists', table)
+
+    def load(self, table, *args):
+        return self._call('load', table, *args)
+
+    def signature(self, table):
+        return self._call('signature', table)
+
+    def reviews_for(self, title, positions=None):
+        return self._call('reviews_for', title, positions)
+
+    def review_count(self, title):
+        return self._call('review_count', title)
+
+    def reviews(self):
+        # Read to the end on the thread, since SQLite's rows come from the
+        # connection it is using
+        return self._call('reviews')
+
+    def poll(self):
+        records, _, _ = self._call('poll')
+        with self.counting:
+            dropped, self.dropped = self.dropped, 0
+            failure, self.failure = self.failure, None
+        # What memory holds no longer matches what is stored if a change was dropped
+        return (None if dropped else records), dropped, failure
+
+    def begin_reading(self):
+        return self._call('begin_reading')
+
+    def end_reading(self):
+        return self._call('end_reading')
+
+    def compact(self, snapshot):
+        # The caller is blocked meanwhile, so snapshot sees the same tables as the queue
+        return self._call('compact', self._unless_dropped(snapshot))
+
+    def flush(self, snapshot):
+        return self._call('flush', self._unless_dropped(snapshot))
+
+    def replace_table(self, table, rows, snapshot):
+        # Like compact(), the caller waits, so rows and snapshot read the tables as the queue left them
+        return self._call('replace_table', table, rows, self._unless_dropped(snapshot))
+
+    def _unless_dropped(self, snapshot):
+        # Once a change is dropped the tables in memory no longer match
+        # storage, so the repository writes out what it has stored instead
+        return lambda: self.storage.stored_rows() if self.dropped else snapshot()
+
+    def close(self):
+        """Apply every queued change, close the repository and stop the thread."""
+        try:
+            self._call(_STOP)
+        finally:
+            self.thread.join()